@@ -0,0 +1,60 @@
+"""
+Micro-benchmark for GettextCloudTranslator.apply_translations_to_po_file.
+
+Builds synthetic catalogs of increasing size and times how long it takes to
+apply a full set of translations back into them. The time per entry should
+stay flat as the catalog grows.
+
+Usage:
+    python benchmarks/bench_apply.py [sizes...]
+"""
+
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import polib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "gettext_cloud_translator"))
+
+from config_azure import AzureConfiguration  # noqa: E402  pylint: disable=C0413
+from gettext_cloud_translator import GettextCloudTranslator, build_parser  # noqa: E402  pylint: disable=C0413
+
+###############################################################################
+
+def build_catalog(size):
+    """Returns an in-memory catalog with `size` untranslated entries."""
+    po_file = polib.POFile()
+    po_file.metadata = {"Language": "es"}
+    for i in range(size):
+        po_file.append(polib.POEntry(msgid=f"Source string number {i}", msgstr=""))
+    return po_file
+# build_catalog
+
+###############################################################################
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or [1000, 10000, 100000]
+    # The configuration of a real run, so new options do not break the benchmark
+    args = build_parser().parse_args(["--backend", "azure", "--file", "es.po", "--dstlang", "es", "--no-tm"])
+    service = SimpleNamespace(config=AzureConfiguration(args))
+    translator = GettextCloudTranslator(service)
+
+    print(f"{'entries':>10} {'seconds':>10} {'us/entry':>10}")
+    for size in sizes:
+        po_file = build_catalog(size)
+        translated_texts = [{"msgid": entry.msgid, "msgstr": entry.msgid.upper()} for entry in po_file]
+
+        start = time.perf_counter()
+        translator.apply_translations_to_po_file(translated_texts, po_file)
+        elapsed = time.perf_counter() - start
+
+        print(f"{size:>10} {elapsed:>10.4f} {elapsed / size * 1e6:>10.2f}")
+# main
+
+###############################################################################
+
+if __name__ == "__main__":
+    main()
+# __main__
@@ -0,0 +1,58 @@
+"""
+Benchmark of the Azure batch planner: requests issued per 10k strings.
+
+Packs synthetic string sets with different length distributions using the
+default Azure limits (49,500 characters and 1,000 texts per request), in
+order and sorted by length, and reports the number of requests and the
+planning time.
+
+Usage:
+    python benchmarks/bench_batching.py [count]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "gettext_cloud_translator"))
+
+from batching import pack_batches  # noqa: E402  pylint: disable=C0413
+
+###############################################################################
+
+WORDS = "the quick brown fox jumps over lazy dog settings account delete save item user".split()
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+# sentence
+
+###############################################################################
+
+DISTRIBUTIONS = {
+    "labels (1-3 words)": lambda rng: sentence(rng, rng.randint(1, 3)),
+    "mixed UI strings": lambda rng: sentence(rng, int(rng.lognormvariate(2.0, 1.0)) + 1),
+    "paragraphs (50-400 words)": lambda rng: sentence(rng, rng.randint(50, 400)),
+    "bimodal labels/paragraphs": lambda rng: sentence(rng, rng.choice([2, 2, 2, 600])),
+}
+
+###############################################################################
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    print(f"{'distribution':<28} {'in order':>9} {'sorted':>9} {'plan ms':>9}")
+    for name, generate in DISTRIBUTIONS.items():
+        rng = random.Random(42)
+        texts = [generate(rng) for _ in range(count)]
+        in_order = len(pack_batches(texts, 49500, 1000))
+        start = time.perf_counter()
+        by_length = len(pack_batches(texts, 49500, 1000, sort_by_length=True))
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{name:<28} {in_order:>9} {by_length:>9} {elapsed:>9.1f}")
+# main
+
+###############################################################################
+
+if __name__ == "__main__":
+    main()
+# __main__
@@ -0,0 +1,94 @@
+"""
+End to end benchmark of the CLI against the local mock server.
+
+Generates synthetic Spanish catalogs of each size, with one msgid in ten
+repeated, runs the CLI on them against the mock Azure/OpenAI server and
+reports the strings translated per second, the requests issued, the bytes
+sent and the peak RSS of the CLI process. Run it before and after a change
+to batching or concurrency to catch regressions.
+
+Usage:
+    python benchmarks/bench_e2e.py [--sizes 1000,10000,100000] [--backend azure]
+                                   [--latency 0.02] [--jitter 0.01] [--throttle-every 0]
+                                   [-- extra CLI arguments, e.g. --workers 8 --async]
+"""
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import polib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "gettext_cloud_translator", "tests"))
+
+from mock_server import MockServer  # noqa: E402  pylint: disable=C0413
+
+CLI = os.path.join(os.path.dirname(__file__), "..", "gettext_cloud_translator", "gettext_cloud_translator.py")
+
+WORDS = "the quick brown fox jumps over lazy dog settings account delete save item user".split()
+
+###############################################################################
+
+def write_catalog(path, count, rng):
+    """Writes a catalog of `count` untranslated entries, one in ten repeating an earlier msgid in another context."""
+    po_file = polib.POFile()
+    po_file.metadata = {"Language": "es", "Content-Type": "text/plain; charset=UTF-8"}
+    msgids = []
+    for index in range(count):
+        if msgids and index % 10 == 9:
+            po_file.append(polib.POEntry(msgid=rng.choice(msgids), msgctxt=f"context {index}", msgstr=""))
+            continue
+        words = " ".join(rng.choice(WORDS) for _ in range(int(rng.lognormvariate(1.5, 0.8)) + 1))
+        # A unique suffix of letters, since texts differing by a number share a template
+        msgids.append(f"{words} {''.join(chr(97 + int(digit)) for digit in str(index))}")
+        po_file.append(polib.POEntry(msgid=msgids[-1], msgstr=""))
+    po_file.save(path)
+# write_catalog
+
+###############################################################################
+
+def run(server, path, backend, extra):
+    """Runs the CLI once. Returns its exit code, wall time in seconds and peak RSS in MiB."""
+    command = [sys.executable, CLI, "--backend", backend, "--apikey", "key", "--endpoint", server.url,
+               "--file", path, "--dstlang", "es", "--no-tm", *extra]
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    return os.waitstatus_to_exitcode(status), elapsed, usage.ru_maxrss / 1024
+# run
+
+###############################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="End to end benchmark against the local mock server")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma separated catalog sizes")
+    parser.add_argument("--backend", default="azure", choices=["azure", "chatgpt"])
+    parser.add_argument("--latency", default=0.02, type=float, help="Seconds every mock request waits")
+    parser.add_argument("--jitter", default=0.01, type=float, help="Maximum random extra wait, in seconds")
+    parser.add_argument("--throttle-every", default=0, type=int, help="Answer one in this many requests with a 429")
+    args, extra = parser.parse_known_args()
+    extra = [argument for argument in extra if argument != "--"] or ["--bulk"]
+
+    print(f"backend {args.backend}, CLI arguments: {' '.join(extra)}")
+    print(f"{'entries':>8} {'seconds':>8} {'strings/s':>10} {'requests':>9} {'429s':>5} {'MiB sent':>9} "
+          f"{'peak RSS':>9} {'exit':>5}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in (int(size) for size in args.sizes.split(",")):
+            path = os.path.join(directory, f"bench-{size}.po")
+            write_catalog(path, size, random.Random(42))
+            with MockServer(args.latency, args.jitter, args.throttle_every) as server:
+                code, elapsed, rss = run(server, path, args.backend, extra)
+            print(f"{size:>8} {elapsed:>8.2f} {size / elapsed:>10.0f} {server.requests:>9} {server.throttled:>5} "
+                  f"{server.bytes_received / 2 ** 20:>9.2f} {rss:>8.1f}M {code:>5}")
+# main
+
+###############################################################################
+
+if __name__ == "__main__":
+    main()
+# __main__
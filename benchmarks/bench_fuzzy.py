@@ -0,0 +1,95 @@
+"""
+Benchmark of the fuzzy matching index.
+
+Indexes synthetic interface strings, then looks up variants of some of them
+that differ by a plural or a word, and reports the index size on disk, the
+lookup latency and how many variants found the string they came from.
+
+Usage:
+    python benchmarks/bench_fuzzy.py [entries] [lookups]
+"""
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "gettext_cloud_translator"))
+
+from fuzzy_index import FuzzyIndex  # noqa: E402  pylint: disable=C0413
+
+WORDS = [
+    "account", "add", "address", "admin", "all", "amount", "apply", "archive", "back", "cancel", "change",
+    "channel", "check", "clear", "close", "comment", "confirm", "contact", "copy", "create", "current",
+    "customer", "date", "default", "delete", "description", "disable", "download", "draft", "edit", "email",
+    "enable", "error", "export", "file", "filter", "folder", "group", "help", "history", "image", "import",
+    "invoice", "item", "language", "link", "list", "load", "message", "name", "new", "next", "order", "owner",
+    "page", "password", "payment", "permission", "preview", "previous", "print", "private", "profile",
+    "project", "public", "queue", "record", "refresh", "remove", "report", "request", "reset", "role", "save",
+    "search", "select", "send", "settings", "share", "show", "status", "subscription", "tag", "task", "team",
+    "template", "update", "upload", "user", "value", "version", "view", "warning", "workspace",
+]
+
+###############################################################################
+
+def make_string(generator):
+    words = generator.choices(WORDS, k=generator.randint(3, 8))
+    return " ".join(words).capitalize() + generator.choice(["", ".", " %s", " %(count)d", ":"])
+# make_string
+
+###############################################################################
+
+def variant(generator, text):
+    """Returns a string differing from `text` by a plural or a replaced word."""
+    words = text.split(" ")
+    index = generator.randrange(len(words))
+    if generator.random() < 0.5:
+        words[index] += "s"
+    else:
+        words[index] = generator.choice(WORDS)
+    return " ".join(words)
+# variant
+
+###############################################################################
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    generator = random.Random(1)
+    strings = list(dict.fromkeys(make_string(generator) for _ in range(entries)))
+
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, "fuzzy.sqlite3")
+        index = FuzzyIndex(path, "en")
+        start = time.perf_counter()
+        for offset in range(0, len(strings), 10000):
+            index.add({text: text.upper() for text in strings[offset:offset + 10000]}, "es")
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(path)
+        print(f"Indexed {len(strings)} strings in {elapsed:.1f}s, {size / 2**20:.1f} MiB "
+              f"({size / len(strings):.0f} bytes per string)")
+
+        sources = generator.sample(strings, lookups)
+        latencies = []
+        found = 0
+        for source in sources:
+            text = variant(generator, source)
+            start = time.perf_counter()
+            match = index.match(text, "es")
+            latencies.append(time.perf_counter() - start)
+            found += match is not None and match[0] in (source, text)
+        latencies.sort()
+        print(f"{lookups} lookups: p50 {latencies[len(latencies) // 2] * 1000:.3f}ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.3f}ms, "
+              f"mean {statistics.mean(latencies) * 1000:.3f}ms, "
+              f"{found / lookups:.1%} matched their source above the threshold")
+        index.close()
+# main
+
+###############################################################################
+
+if __name__ == "__main__":
+    main()
+# __main__
@@ -0,0 +1,81 @@
+"""
+Benchmark of the language check on a tree of mixed-language catalogs.
+
+Builds a locale tree with one catalog per language and domain, then times
+how long finding the catalogs of one language takes when every catalog is
+parsed in full and read its Language header afterwards, against reading the
+header alone and only parsing the catalogs that match.
+
+Usage:
+    python benchmarks/bench_header.py [languages] [entries per catalog]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import polib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "gettext_cloud_translator"))
+
+from catalog_header import read_header  # noqa: E402  pylint: disable=C0413
+
+DOMAINS = ("django", "djangojs", "admin")
+
+###############################################################################
+
+def build_tree(root, languages, entries):
+    """Writes locale/<lang>/LC_MESSAGES/<domain>.po catalogs. Returns their paths."""
+    paths = []
+    for index in range(languages):
+        language = f"l{index:02d}"
+        for domain in DOMAINS:
+            po_file = polib.POFile()
+            po_file.metadata = {"Language": language, "Content-Type": "text/plain; charset=UTF-8"}
+            for entry in range(entries):
+                po_file.append(polib.POEntry(msgid=f"{domain} string {entry}", msgstr=""))
+            path = os.path.join(root, language, "LC_MESSAGES", f"{domain}.po")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            po_file.save(path)
+            paths.append(path)
+    return paths
+# build_tree
+
+###############################################################################
+
+def full_parse(paths, language):
+    return [path for path in paths if polib.pofile(path).metadata.get("Language") == language]
+# full_parse
+
+###############################################################################
+
+def header_first(paths, language):
+    matches = []
+    for path in paths:
+        if read_header(path).get("Language") == language:
+            polib.pofile(path)
+            matches.append(path)
+    return matches
+# header_first
+
+###############################################################################
+
+def main():
+    languages = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    entries = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    with tempfile.TemporaryDirectory() as root:
+        paths = build_tree(root, languages, entries)
+        print(f"{len(paths)} catalogs of {entries} entries, {languages} languages, one of them wanted")
+        for name, function in (("full parse", full_parse), ("header first", header_first)):
+            start = time.perf_counter()
+            matches = function(paths, "l00")
+            elapsed = time.perf_counter() - start
+            print(f"{name:<14} {elapsed:>8.3f}s  {len(matches)} matching catalogs")
+# main
+
+###############################################################################
+
+if __name__ == "__main__":
+    main()
+# __main__
@@ -0,0 +1,83 @@
+"""
+Benchmark of the CLI startup: import time and wall time of a run with
+nothing to translate.
+
+Runs the CLI under `python -X importtime` for each backend on a catalog
+whose entries are all translated, reports the wall time, the total import
+time and the slowest top-level imports, and fails when the import time
+exceeds the budget. Such a run must import neither the OpenAI SDK nor
+requests, since it sends no request.
+
+Usage:
+    python benchmarks/bench_startup.py [budget_ms]
+"""
+
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import polib
+
+CLI = os.path.join(os.path.dirname(__file__), "..", "gettext_cloud_translator", "gettext_cloud_translator.py")
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+# Modules a run that sends no request must not import
+NETWORK_MODULES = ("openai", "requests")
+
+###############################################################################
+
+def write_catalog(path):
+    po_file = polib.POFile()
+    po_file.metadata = {"Language": "es", "Content-Type": "text/plain; charset=UTF-8"}
+    po_file.append(polib.POEntry(msgid="Open", msgstr="Abrir"))
+    po_file.save(path)
+# write_catalog
+
+###############################################################################
+
+def run(backend, path):
+    """Runs the CLI once. Returns the wall time in ms and the {module: cumulative us} of the top-level imports."""
+    command = [sys.executable, "-X", "importtime", CLI, "--backend", backend, "--apikey", "key",
+               "--file", path, "--dstlang", "es", "--no-tm"]
+    start = time.perf_counter()
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+    elapsed = (time.perf_counter() - start) * 1000
+    imports = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match and len(match.group(3)) == 1:
+            imports[match.group(4)] = int(match.group(2))
+    return elapsed, imports
+# run
+
+###############################################################################
+
+def main():
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else 150.0
+    over_budget = False
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "es.po")
+        write_catalog(path)
+        for backend in ("azure", "chatgpt"):
+            elapsed, imports = run(backend, path)
+            total = sum(imports.values()) / 1000
+            network = [module for module in NETWORK_MODULES if module in imports]
+            status = "ok" if total <= budget and not network else "FAIL"
+            over_budget = over_budget or status != "ok"
+            print(f"{backend:<8} wall {elapsed:>7.1f} ms  imports {total:>7.1f} ms  budget {budget:.0f} ms  {status}")
+            for module, cumulative in sorted(imports.items(), key=lambda item: -item[1])[:5]:
+                print(f"           {module:<28} {cumulative / 1000:>7.1f} ms")
+            if network:
+                print(f"           imported without sending a request: {', '.join(network)}")
+    sys.exit(1 if over_budget else 0)
+# main
+
+###############################################################################
+
+if __name__ == "__main__":
+    main()
+# __main__
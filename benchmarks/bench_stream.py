@@ -0,0 +1,86 @@
+"""
+Peak memory benchmark of the streaming mode on a very large catalog.
+
+Writes a synthetic Spanish catalog, half of its entries already translated,
+and translates it with the CLI against the local mock server, once loading
+the catalog in full and once with --stream, reporting the wall time and the
+peak RSS of the CLI process for each.
+
+Usage:
+    python benchmarks/bench_stream.py [--entries 500000] [--latency 0.0]
+                                      [-- extra CLI arguments, e.g. --stream-batch 500]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "gettext_cloud_translator", "tests"))
+
+from mock_server import MockServer  # noqa: E402  pylint: disable=C0413
+
+CLI = os.path.join(os.path.dirname(__file__), "..", "gettext_cloud_translator", "gettext_cloud_translator.py")
+
+WORDS = "the quick brown fox jumps over lazy dog settings account delete save item user".split()
+
+###############################################################################
+
+def letters(index):
+    """Spells a number in letters, since texts differing by a number share a template."""
+    return "".join(chr(97 + int(digit)) for digit in str(index))
+# letters
+
+###############################################################################
+
+def write_catalog(path, count):
+    """Writes a catalog of `count` entries, one in two translated, line by line so the benchmark stays small."""
+    with open(path, "w", encoding="utf-8") as output:
+        output.write('msgid ""\nmsgstr ""\n"Language: es\\n"\n"Content-Type: text/plain; charset=UTF-8\\n"\n\n')
+        for index in range(count):
+            words = " ".join(WORDS[(index * 7 + offset) % len(WORDS)] for offset in range(index % 9 + 2))
+            msgstr = f"traducido {letters(index)}" if index % 2 else ""
+            output.write(f'#: src/module_{index % 500}.py:{index}\n'
+                         f'msgid "{words} {letters(index)}"\nmsgstr "{msgstr}"\n\n')
+# write_catalog
+
+###############################################################################
+
+def run(server, path, extra):
+    """Runs the CLI once. Returns its exit code, wall time in seconds and peak RSS in MiB."""
+    command = [sys.executable, CLI, "--backend", "azure", "--apikey", "key", "--endpoint", server.url,
+               "--file", path, "--dstlang", "es", "--no-tm", "--bulk", *extra]
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    return os.waitstatus_to_exitcode(status), elapsed, usage.ru_maxrss / 1024
+# run
+
+###############################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory of a full and a streamed run on a large catalog")
+    parser.add_argument("--entries", default=500000, type=int, help="Number of entries of the catalog")
+    parser.add_argument("--latency", default=0.0, type=float, help="Seconds every mock request waits")
+    args, extra = parser.parse_known_args()
+    extra = [argument for argument in extra if argument != "--"]
+
+    print(f"{args.entries} entries, {args.entries // 2} pending")
+    print(f"{'mode':<8} {'seconds':>8} {'requests':>9} {'peak RSS':>9} {'exit':>5}")
+    with tempfile.TemporaryDirectory() as directory:
+        for mode, arguments in (("full", []), ("stream", ["--stream"])):
+            path = os.path.join(directory, f"{mode}.po")
+            write_catalog(path, args.entries)
+            with MockServer(args.latency) as server:
+                code, elapsed, rss = run(server, path, [*arguments, *extra])
+            print(f"{mode:<8} {elapsed:>8.2f} {server.requests:>9} {rss:>8.1f}M {code:>5}")
+# main
+
+###############################################################################
+
+if __name__ == "__main__":
+    main()
+# __main__
@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import threading
+import time
+
+from abc import ABC, abstractmethod
+from functools import partial
+
+from translator_service import ServiceCommon, TranslatorService
+
+###############################################################################
+
+class BatchScheduler:
+    """
+    Runs batch calls from one event loop with at most `concurrency` of them
+    in flight, however many are queued, so thousands of batches from many
+    catalogs and backends can share one scheduler. A call is only turned into
+    a coroutine once it gets a slot.
+    """
+
+    def __init__(self, concurrency) -> None:
+        self.concurrency = max(1, concurrency)
+        self.semaphore = None
+        self.in_flight = 0
+        self.peak = 0
+        self.completed = 0
+    # __init__
+
+    ###########################################################################
+
+    async def submit(self, call):
+        """Awaits `call()` once fewer than `concurrency` calls are in flight."""
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        async with self.semaphore:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            try:
+                return await call()
+            finally:
+                self.in_flight -= 1
+                self.completed += 1
+    # submit
+
+    ###########################################################################
+
+    async def run(self, calls):
+        """Runs the calls, returning their results in the same order."""
+        return await asyncio.gather(*(self.submit(call) for call in calls))
+    # run
+# BatchScheduler
+
+###############################################################################
+
+class AsyncTranslatorService(ServiceCommon, ABC):
+    """
+    A service whose requests are coroutines. Backends implement
+    translate_batch(), which sends one batch, and may override plan_batches();
+    translate() looks the texts up in the translation memory, plans the rest
+    into batches and sends them through a BatchScheduler.
+    """
+
+    @abstractmethod
+    async def translate_batch(self, texts, dstlang=None):
+        """Translates one batch of texts. Returns the results in the {"msgid", "msgstr", "dstlang"} form."""
+    # translate_batch
+
+    ###########################################################################
+
+    def plan_batches(self, texts, dstlang=None, bulk=None):
+        """Splits the texts into batches: --bulksize texts per batch in bulk mode, one otherwise."""
+        bulk = self.config.bulk if bulk is None else bulk
+        size = self.config.bulksize if bulk else 1
+        return [texts[i:i + size] for i in range(0, len(texts), size)]
+    # plan_batches
+
+    ###########################################################################
+
+    def batch_chars(self, texts):
+        return sum(len(text) for text in texts)
+    # batch_chars
+
+    ###########################################################################
+
+    def estimate_requests(self, texts, targets=1):
+        return len(self.plan_batches(texts, self.config.dstlang)) * targets
+    # estimate_requests
+
+    ###########################################################################
+
+    async def send_batch(self, texts, dstlang):
+        """Sends a batch of texts into `dstlang` with send_request()."""
+        return await self.send_request(partial(self.translate_batch, dstlang=dstlang), texts, self.batch_chars(texts))
+    # send_batch
+
+    ###########################################################################
+
+    async def send_request(self, send, batch, chars):
+        """
+        Awaits `send(batch)` through the rate limiter, which keeps it within
+        the quota and retries it. A batch that still fails is logged and yields
+        no results. The results of a completed batch are passed to `on_batch`.
+        """
+        async def attempt(batch):
+            start = time.perf_counter()
+            try:
+                return await send(batch)
+            finally:
+                self.observe(start, chars)
+
+        try:
+            if self.limiter is None:
+                result = await attempt(batch)
+            else:
+                result = await self.limiter.call_async(attempt, batch, chars, f"Batch of {len(batch)} texts")
+        except Exception as e:  # pylint: disable=W0718
+            logging.error("Giving up on a batch of %i texts: %s", len(batch), e)
+            return []
+        if self.on_batch is not None:
+            self.on_batch(result)
+        return result
+    # send_request
+
+    ###########################################################################
+
+    async def translate(self, texts, dstlang=None, bulk=None, scheduler=None):
+        """
+        Translates the texts into `dstlang`, sending the batches through
+        `scheduler`, or through one bounded by --workers when none is given.
+        """
+        dstlang = dstlang or self.config.dstlang
+        cached, texts = self.recall(texts, dstlang)
+        scheduler = scheduler or BatchScheduler(self.config.workers)
+        results = await scheduler.run([
+            partial(self.send_batch, batch, dstlang) for batch in self.plan_batches(texts, dstlang, bulk)
+        ])
+        translated_texts = [translation for result in results for translation in result]
+        self.remember(translated_texts, dstlang)
+        return cached + translated_texts
+    # translate
+
+    ###########################################################################
+
+    async def translate_multi(self, texts, dstlangs, bulk=None, scheduler=None):
+        """Translates the texts into every language at once through one scheduler. Returns a {dstlang: results} dict."""
+        scheduler = scheduler or BatchScheduler(self.config.workers)
+        results = await asyncio.gather(*(self.translate(texts, dstlang, bulk, scheduler) for dstlang in dstlangs))
+        return dict(zip(dstlangs, results))
+    # translate_multi
+
+    ###########################################################################
+
+    async def check(self):
+        return True
+    # check
+
+    ###########################################################################
+
+    async def aclose(self):
+        """Closes the HTTP client, when the backend opened one."""
+    # aclose
+# AsyncTranslatorService
+
+###############################################################################
+
+class SyncTranslatorAdapter(TranslatorService):
+    """
+    Exposes an AsyncTranslatorService through the synchronous interface the
+    CLI uses. The coroutines run on an event loop of its own, in a background
+    thread started on the first request, so the clients of the service stay
+    bound to one loop and warm between calls.
+    """
+
+    def __init__(self, service) -> None:
+        self.service = service
+        self.config = service.config
+        self.memory = service.memory
+        self.fuzzy_index = service.fuzzy_index
+        self.limiter = service.limiter
+        self.loop = None
+        self.thread = None
+        self.lock = threading.Lock()
+    # __init__
+
+    ###########################################################################
+
+    @property
+    def on_batch(self):
+        return self.service.on_batch
+    # on_batch
+
+    @on_batch.setter
+    def on_batch(self, callback):
+        self.service.on_batch = callback
+    # on_batch
+
+    @property
+    def metrics(self):
+        return self.service.metrics
+    # metrics
+
+    @metrics.setter
+    def metrics(self, metrics):
+        self.service.metrics = metrics
+    # metrics
+
+    ###########################################################################
+
+    def run(self, coroutine):
+        """Runs a coroutine on the loop of the adapter and waits for its result."""
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self.loop.run_forever, name="translator-loop", daemon=True)
+                self.thread.start()
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        try:
+            return future.result()
+        except KeyboardInterrupt:
+            future.cancel()
+            raise
+    # run
+
+    ###########################################################################
+
+    def translate_in_bulk(self, texts, dstlang=None):
+        return self.run(self.service.translate(texts, dstlang, bulk=True))
+    # translate_in_bulk
+
+    def translate_one_by_one(self, texts, dstlang=None):
+        return self.run(self.service.translate(texts, dstlang, bulk=False))
+    # translate_one_by_one
+
+    def translate_multi(self, texts, dstlangs):
+        return self.run(self.service.translate_multi(texts, dstlangs))
+    # translate_multi
+
+    ###########################################################################
+
+    def estimate_requests(self, texts, targets=1):
+        return self.service.estimate_requests(texts, targets)
+    # estimate_requests
+
+    def check(self):
+        return self.run(self.service.check())
+    # check
+
+    def connection_stats(self):
+        return self.service.connection_stats()
+    # connection_stats
+
+    def token_stats(self):
+        return self.service.token_stats()
+    # token_stats
+
+    ###########################################################################
+
+    def close(self):
+        """Closes the service, then stops the event loop."""
+        if self.loop is not None:
+            self.run(self.service.aclose())
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+            self.loop = None
+        self.service.close()
+    # close
+# SyncTranslatorAdapter
@@ -0,0 +1,316 @@
+import json
+import logging
+import threading
+
+###############################################################################
+
+SEPARATORS = ("\n\n", "\n", ". ", " ")
+
+# Adaptive batch size, as shares of the hard limit of the backend: where it
+# starts, how much it grows at a time, and how small it may get
+ADAPTIVE_START = 0.25
+ADAPTIVE_STEP = 0.0625
+ADAPTIVE_FLOOR = 1 / 64
+
+# Batches completed at a size before deciding to grow or back off, weight of
+# the last one in the moving average of the latency per character, and how
+# much that latency may rise on growing before the size backs off
+ADAPTIVE_SAMPLES = 3
+ADAPTIVE_SMOOTHING = 0.3
+ADAPTIVE_TOLERANCE = 0.1
+
+# Batches after which a size that backed off is tried again
+ADAPTIVE_RETRY = 20
+
+###############################################################################
+
+def split_text(text, max_chars):
+    """
+    Splits a text longer than `max_chars` into fragments of at most that size,
+    cutting after the last paragraph, line, sentence or word boundary that
+    fits, or in the middle of a word when there is none. Concatenating the
+    fragments gives back the text.
+    """
+    fragments = []
+    while len(text) > max_chars:
+        window = text[:max_chars]
+        cut = max_chars
+        for separator in SEPARATORS:
+            position = window.rfind(separator)
+            if position > 0:
+                cut = position + len(separator)
+                break
+        fragments.append(text[:cut])
+        text = text[cut:]
+    fragments.append(text)
+    return fragments
+# split_text
+
+###############################################################################
+
+def join_fragments(fragments, translations):
+    """
+    Joins the translations of the fragments of a split text, keeping the
+    whitespace each fragment originally ended with.
+    """
+    parts = []
+    for fragment, translation in zip(fragments, translations):
+        trailing = fragment[len(fragment.rstrip()):]
+        parts.append(translation.rstrip() + trailing if trailing else translation)
+    return "".join(parts)
+# join_fragments
+
+###############################################################################
+
+def body_bytes(text):
+    """
+    Returns the size of a text as an element of a JSON request body. Every
+    element is counted with the ", " requests puts between two of them, and
+    the first one's counts for the enclosing brackets.
+    """
+    return len(json.dumps({"text": text}).encode("utf-8")) + 2
+# body_bytes
+
+###############################################################################
+
+def pack_batches(texts, max_chars, max_elements, max_bytes=None, sort_by_length=False, targets=1):
+    """
+    Packs texts into batches that respect a character limit, an element-count
+    limit and, optionally, a request body size limit in bytes. Characters are
+    counted once per target language. Returns the batches as lists of indices
+    into `texts`.
+
+    By default the texts are packed in order. With `sort_by_length`, they are
+    also packed longest first into the first batch with room for them, which
+    issues fewer requests when the lengths vary a lot, and the plan with the
+    fewest batches wins.
+
+    A text that alone exceeds a limit is sent in a batch of its own; texts the
+    service cannot take at all must be split with split_text() beforehand.
+    """
+    weights = [(len(text) * targets, body_bytes(text) if max_bytes else 0) for text in texts]
+    return pack_weights(weights, max_chars, max_elements, max_bytes, sort_by_length)
+# pack_batches
+
+###############################################################################
+
+def pack_weights(weights, max_weight, max_elements, max_size=None, sort_by_length=False, base_size=0):
+    """
+    Packs items given as (weight, size) pairs into batches whose total weight,
+    item count and, optionally, total size plus `base_size` stay within the
+    limits. This is pack_batches() for any measure of the items, e.g. tokens.
+    Returns the batches as lists of indices into `weights`.
+    """
+    limits = (max_weight, max_elements, max_size, base_size)
+    batches = pack_in_order(weights, *limits)
+    if sort_by_length:
+        # Two limits at once defeat first fit decreasing now and then, so keep
+        # whichever plan issues fewer requests.
+        by_length = pack_by_length(weights, *limits)
+        if len(by_length) < len(batches):
+            batches = by_length
+    return batches
+# pack_weights
+
+###############################################################################
+
+def fits(state, weight, size, max_weight, max_elements, max_size):
+    """Tells whether an item fits in a batch given as [indices, weight, size]."""
+    return (state[1] + weight <= max_weight and len(state[0]) < max_elements
+            and (not max_size or state[2] + size <= max_size))
+# fits
+
+###############################################################################
+
+def pack_in_order(weights, max_weight, max_elements, max_size, base_size):
+    """Packs the items in order, starting a new batch whenever the next one does not fit."""
+    limits = (max_weight, max_elements, max_size)
+    batches = []
+    state = [[], 0, base_size]
+    for index, (weight, size) in enumerate(weights):
+        if state[0] and not fits(state, weight, size, *limits):
+            batches.append(state[0])
+            state = [[], 0, base_size]
+        state[0].append(index)
+        state[1] += weight
+        state[2] += size
+    if state[0]:
+        batches.append(state[0])
+    return batches
+# pack_in_order
+
+###############################################################################
+
+def pack_by_length(weights, max_weight, max_elements, max_size, base_size):
+    """
+    Packs the items heaviest first into the first batch with room for them.
+    Batches that cannot take even the lightest item are closed, so the scan
+    stays short on large inputs.
+    """
+    limits = (max_weight, max_elements, max_size)
+    order = sorted(range(len(weights)), key=lambda index: weights[index][0], reverse=True)
+    lightest = weights[order[-1]] if order else (0, 0)
+    batches, open_batches = [], []
+    for index in order:
+        weight, size = weights[index]
+        for state in open_batches:
+            if fits(state, weight, size, *limits):
+                break
+        else:
+            state = [[], 0, base_size]
+            batches.append(state[0])
+            open_batches.append(state)
+        state[0].append(index)
+        state[1] += weight
+        state[2] += size
+        if not fits(state, lightest[0], lightest[1], *limits):
+            open_batches.remove(state)
+    return [sorted(batch) for batch in batches]
+# pack_by_length
+
+###############################################################################
+
+class BatchSizeController:
+    """
+    Adapts the size limit of the batches of a backend as a run goes, additive
+    increase, multiplicative decrease: the limit grows by a step while the
+    latency per character of the batches holds or improves, backs off a step
+    when it gets worse, and is halved when a batch times out, is throttled,
+    fails or comes back with translations missing. It stays between a floor
+    and `maximum`, the hard limit of the backend. Every change is logged.
+
+    Results are only weighed against the size their batch was packed at,
+    which the thread sending it sets in `local.limit`.
+    """
+
+    def __init__(self, name, maximum) -> None:
+        self.name = name
+        self.maximum = max(1, int(maximum))
+        self.minimum = max(1, int(self.maximum * ADAPTIVE_FLOOR))
+        self.step = max(1, int(self.maximum * ADAPTIVE_STEP))
+        self.size = max(self.minimum, int(self.maximum * ADAPTIVE_START))
+        self.cost = None
+        self.samples = 0
+        self.reference = None
+        self.ceiling = None
+        self.since_backoff = 0
+        self.grown = 0
+        self.shrunk = 0
+        self.local = threading.local()
+        self.lock = threading.Lock()
+    # __init__
+
+    ###########################################################################
+
+    def limit(self):
+        with self.lock:
+            return self.size
+    # limit
+
+    ###########################################################################
+
+    def record(self, seconds, weight):
+        """Weighs the latency of a completed batch of `weight` characters, growing or backing off the size."""
+        limit = getattr(self.local, "limit", None)
+        with self.lock:
+            if weight <= 0 or (limit is not None and limit != self.size):
+                return
+            sample = seconds / weight
+            self.cost = sample if self.cost is None else self.cost + ADAPTIVE_SMOOTHING * (sample - self.cost)
+            self.samples += 1
+            self.since_backoff += 1
+            if self.ceiling is not None and self.since_backoff >= ADAPTIVE_RETRY:
+                self.ceiling = None
+            if self.samples < ADAPTIVE_SAMPLES:
+                return
+            cost = f"{self.cost * 1000:.3f}ms per character"
+            if self.reference is not None and self.cost > self.reference * (1 + ADAPTIVE_TOLERANCE):
+                reference = self.reference
+                # The smaller size is measured afresh, and not grown back past this one for a while
+                self.reference = None
+                self.ceiling = self.size
+                self.since_backoff = 0
+                self.resize(self.size - self.step, f"{cost}, up from {reference * 1000:.3f}ms")
+            elif self.size < self.maximum and (self.ceiling is None or self.size + self.step < self.ceiling):
+                self.reference = self.cost
+                self.grown += 1
+                self.resize(min(self.size + self.step, self.maximum), cost)
+    # record
+
+    ###########################################################################
+
+    def shrink(self, reason):
+        """Halves the size after a failed batch, unless it was already reduced below that batch's."""
+        limit = getattr(self.local, "limit", None)
+        with self.lock:
+            if limit is not None and limit > self.size:
+                return
+            self.reference = None
+            self.ceiling = None
+            self.shrunk += 1
+            self.resize(self.size // 2, reason)
+    # shrink
+
+    ###########################################################################
+
+    def resize(self, size, reason):
+        """Moves to a new size and starts measuring it afresh. Called with the lock held."""
+        size = max(self.minimum, min(self.maximum, size))
+        if size != self.size:
+            logging.info("Batch size of %s: %i -> %i (%s)", self.name, self.size, size, reason)
+        self.size = size
+        self.cost = None
+        self.samples = 0
+    # resize
+
+    ###########################################################################
+
+    def stats(self):
+        with self.lock:
+            return {"size": self.size, "maximum": self.maximum, "grown": self.grown, "shrunk": self.shrunk}
+    # stats
+# BatchSizeController
+
+###############################################################################
+
+class BatchFeed:
+    """
+    Hands out the batches of a list of items one at a time, each packed when
+    a worker takes it, within the limit its BatchSizeController allows at
+    that moment. `pack(window, limit)` returns the first batch of `window`,
+    the next `window_size` items, which must be a prefix of it.
+    """
+
+    def __init__(self, items, pack, window_size, controller) -> None:
+        self.items = items
+        self.pack = pack
+        self.window_size = window_size
+        self.controller = controller
+        self.position = 0
+        self.sequence = 0
+        self.closed = False
+        self.lock = threading.Lock()
+    # __init__
+
+    ###########################################################################
+
+    def take(self):
+        """Returns the next (sequence number, batch, limit it was packed at), or None when done."""
+        with self.lock:
+            if self.closed or self.position >= len(self.items):
+                return None
+            limit = self.controller.limit()
+            batch = self.pack(self.items[self.position:self.position + self.window_size], limit)
+            self.position += len(batch)
+            self.sequence += 1
+            return self.sequence, batch, limit
+    # take
+
+    ###########################################################################
+
+    def close(self):
+        """Stops handing out batches, e.g. when the run is interrupted."""
+        with self.lock:
+            self.closed = True
+    # close
+# BatchFeed
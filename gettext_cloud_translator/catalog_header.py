@@ -0,0 +1,55 @@
+import codecs
+
+import polib
+
+###############################################################################
+
+# Bytes read at most while looking for the header entry
+HEADER_LIMIT = 65536
+
+###############################################################################
+
+def read_header(path, limit=HEADER_LIMIT):
+    """
+    Reads the metadata of a catalog from its header entry alone, the
+    msgid "" entry that comes first, without parsing the rest of the file.
+    Returns the {name: value} dict of the header, an empty dict when the
+    catalog has no header, or None when it cannot tell within `limit` bytes
+    or the catalog does not start with msgid "", and has to be parsed in full.
+    """
+    strings = None
+    with open(path, "rb") as handle:
+        for index, raw in enumerate(handle):
+            limit -= len(raw)
+            if limit < 0:
+                return None
+            if index == 0 and raw.startswith(codecs.BOM_UTF8):
+                # Editors on Windows often start the file with a byte order mark
+                raw = raw[len(codecs.BOM_UTF8):]
+            line = raw.strip()
+            if strings is None:
+                if not line or line.startswith(b"#"):
+                    continue
+                if line != b'msgid ""':
+                    return None
+                strings = []
+            elif not strings:
+                # The line after msgid "" is msgstr for the header, a
+                # continuation of the msgid for any other entry
+                if not line.startswith(b"msgstr "):
+                    return {}
+                strings.append(line[len(b"msgstr "):])
+            elif line.startswith(b'"'):
+                strings.append(line)
+            else:
+                break
+    if not strings:
+        return {}
+    text = polib.unescape("".join(string.decode("utf-8", "replace")[1:-1] for string in strings))
+    metadata = {}
+    for entry in text.split("\n"):
+        name, separator, value = entry.partition(":")
+        if separator:
+            metadata[name.strip()] = value.strip()
+    return metadata
+# read_header
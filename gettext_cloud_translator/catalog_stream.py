@@ -0,0 +1,240 @@
+import codecs
+import os
+import stat
+import tempfile
+
+import polib
+
+###############################################################################
+
+# Keywords starting the lines that hold a string of an entry
+KEYWORDS = ("msgctxt", "msgid_plural", "msgid", "msgstr")
+
+# A batch is sent once it holds --stream-batch pending texts, or this many
+# times as many entries, so the entries of a mostly translated catalog are
+# written out instead of piling up behind a batch that never fills
+BUFFERED_ENTRIES = 10
+
+###############################################################################
+
+def read_entries(lines):
+    """
+    Splits the lines of a catalog into entries, one list of lines each, the
+    comments before an entry and the blank lines after it included. Only the
+    entry being read is held in memory.
+    """
+    block = []
+    complete = False
+    for line in lines:
+        stripped = line.lstrip()
+        # A comment or a new msgctxt/msgid after a msgstr starts the next entry
+        if complete and stripped.startswith(("#", "msgctxt", "msgid")):
+            yield block
+            block = []
+            complete = False
+        block.append(line)
+        if stripped.startswith(("msgstr", "#~ msgstr")):
+            complete = True
+    if block:
+        yield block
+# read_entries
+
+###############################################################################
+
+def parse_entry(block):
+    """
+    Parses the lines of one entry. Returns a dict with its "msgid", "msgstr",
+    "flags", whether it is "plural" or "obsolete", and the line indexes the
+    entry is rewritten at: "flags_line", "first_line" (its first msgctxt or
+    msgid line) and the "msgstr_lines" (start, end) span.
+    """
+    entry = {"msgid": "", "msgstr": "", "flags": [], "plural": False, "obsolete": False,
+             "flags_line": None, "first_line": None, "msgstr_lines": None}
+    strings = {}
+    keyword = None
+    for index, line in enumerate(block):
+        stripped = line.strip()
+        if stripped.startswith("#,"):
+            entry["flags_line"] = index
+            entry["flags"] = [flag.strip() for flag in stripped[2:].split(",") if flag.strip()]
+        elif stripped.startswith("#~"):
+            entry["obsolete"] = True
+        elif stripped.startswith('"') and keyword is not None:
+            strings[keyword].append(stripped[1:-1])
+            if keyword == "msgstr":
+                entry["msgstr_lines"] = (entry["msgstr_lines"][0], index + 1)
+        elif stripped and not stripped.startswith("#"):
+            keyword, _, value = stripped.partition(" ")
+            if keyword.startswith("msgstr["):
+                entry["plural"] = True
+            if keyword not in KEYWORDS:
+                keyword = None
+                continue
+            if entry["first_line"] is None:
+                entry["first_line"] = index
+            if keyword == "msgid_plural":
+                entry["plural"] = True
+            elif keyword == "msgstr":
+                entry["msgstr_lines"] = (index, index + 1)
+            strings[keyword] = [value.strip()[1:-1]]
+    for name in ("msgid", "msgstr"):
+        entry[name] = polib.unescape("".join(strings.get(name, [])))
+    return entry
+# parse_entry
+
+###############################################################################
+
+def is_pending(entry):
+    """Whether an entry waits for a translation: a singular, current, non fuzzy entry without msgstr."""
+    return (bool(entry["msgid"]) and not entry["msgstr"] and entry["msgstr_lines"] is not None
+            and not entry["plural"] and not entry["obsolete"] and "fuzzy" not in entry["flags"])
+# is_pending
+
+###############################################################################
+
+def format_string(keyword, text):
+    """Formats a string of an entry the way polib does, one line per line of text, without wrapping."""
+    lines = text.splitlines(keepends=True)
+    if len(lines) <= 1:
+        return [f'{keyword} "{polib.escape(text)}"\n']
+    return [f'{keyword} ""\n'] + [f'"{polib.escape(line)}"\n' for line in lines]
+# format_string
+
+###############################################################################
+
+def set_flags(block, entry, flags):
+    """Rewrites the flags comment of an entry, removing it when no flag is left."""
+    line = [f"#, {', '.join(flags)}\n"] if flags else []
+    if entry["flags_line"] is not None:
+        position, replaced = entry["flags_line"], 1
+    elif entry["first_line"] is not None:
+        position, replaced = entry["first_line"], 0
+    else:
+        return
+    block[position:position + replaced] = line
+    # The lines after the flags moved
+    shift = len(line) - replaced
+    entry["flags_line"] = position if line else None
+    entry["first_line"] += shift
+    if entry["msgstr_lines"] is not None:
+        entry["msgstr_lines"] = tuple(index + shift for index in entry["msgstr_lines"])
+    entry["flags"] = list(flags)
+# set_flags
+
+###############################################################################
+
+def apply_translation(block, entry, msgstr, previous_msgid=None):
+    """
+    Writes a translation into the lines of an entry. With `previous_msgid`,
+    the translation of a similar string, the entry is flagged fuzzy and that
+    string recorded as its previous msgid, as msgmerge does.
+    """
+    start, end = entry["msgstr_lines"]
+    block[start:end] = format_string("msgstr", msgstr)
+    if previous_msgid is not None:
+        if "fuzzy" not in entry["flags"]:
+            set_flags(block, entry, entry["flags"] + ["fuzzy"])
+        # The previous msgid comes after the flags, right before the entry
+        previous = [f"#| {line}" for line in format_string("msgid", previous_msgid)]
+        block[entry["first_line"]:entry["first_line"]] = previous
+        entry["first_line"] += len(previous)
+        entry["msgstr_lines"] = tuple(index + len(previous) for index in entry["msgstr_lines"])
+# apply_translation
+
+###############################################################################
+
+def catalog_encoding(metadata):
+    """Returns the encoding the Content-Type header of a catalog declares, polib's default when it is not valid."""
+    charset = metadata.get("Content-Type", "").partition("charset=")[2].strip()
+    try:
+        return codecs.lookup(charset).name
+    except LookupError:
+        return polib.default_encoding
+# catalog_encoding
+
+###############################################################################
+
+class EntryBatch:
+    """
+    The entries read since the previous batch, in catalog order, the pending
+    ones indexed by msgid, and the future of their translations once sent.
+    """
+
+    def __init__(self) -> None:
+        self.blocks = []
+        self.pending = {}
+        self.future = None
+    # __init__
+
+    ###########################################################################
+
+    def add(self, block, entry=None):
+        """Adds the lines of an entry, pending translation when `entry` is given."""
+        self.blocks.append(block)
+        if entry is not None:
+            self.pending.setdefault(entry["msgid"], []).append((block, entry))
+    # add
+
+    ###########################################################################
+
+    def full(self, size):
+        return len(self.pending) >= size or len(self.blocks) >= size * BUFFERED_ENTRIES
+    # full
+
+    ###########################################################################
+
+    def done(self):
+        return self.future is None or self.future.done()
+    # done
+# EntryBatch
+
+###############################################################################
+
+class AtomicFile:
+    """
+    A file written next to `path` and renamed over it on commit(), so readers
+    see the old or the new file, never a half written one. The permissions of
+    the original are kept. Leaving the block without committing removes it.
+    """
+
+    def __init__(self, path, encoding) -> None:
+        self.path = path
+        directory, name = os.path.split(os.path.abspath(path))
+        handle, self.temp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+        self.output = open(handle, "w", encoding=encoding)  # pylint: disable=R1732
+        self.committed = False
+    # __init__
+
+    ###########################################################################
+
+    def __enter__(self):
+        return self
+    # __enter__
+
+    ###########################################################################
+
+    def __exit__(self, *exc_info):
+        if not self.committed:
+            self.output.close()
+            if os.path.exists(self.temp_path):
+                os.remove(self.temp_path)
+    # __exit__
+
+    ###########################################################################
+
+    def write(self, text):
+        self.output.write(text)
+    # write
+
+    ###########################################################################
+
+    def commit(self):
+        self.output.flush()
+        os.fsync(self.output.fileno())
+        self.output.close()
+        if os.path.exists(self.path):
+            os.chmod(self.temp_path, stat.S_IMODE(os.stat(self.path).st_mode))
+        os.replace(self.temp_path, self.path)
+        self.committed = True
+    # commit
+# AtomicFile
@@ -0,0 +1,109 @@
+import json
+import logging
+import os
+import threading
+
+###############################################################################
+
+class CheckpointJournal:
+    """
+    An append-only journal of the translations completed during a run, plus
+    batch cursors recording the progress. A run that dies partway through
+    replays the journal on restart instead of paying for that work again.
+
+    Every line is a JSON object, either a result
+    {"msgid", "msgstr", "srclang", "dstlang"} or a cursor {"batch", "texts"}.
+    A truncated last line, left by a killed process, is cut off on load, so
+    the records appended after it start on a line of their own.
+    """
+
+    def __init__(self, path, srclang) -> None:
+        self.path = path
+        self.srclang = srclang
+        self.batches = 0
+        self.lock = threading.Lock()
+        self.journal = None
+    # __init__
+
+    ###########################################################################
+
+    def load(self):
+        """Returns the results journaled by previous runs, as a {dstlang: results} dict."""
+        results = {}
+        if not os.path.exists(self.path):
+            return results
+        self.truncate()
+        with open(self.path, encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logging.warning("Ignoring an unreadable record in checkpoint %s", self.path)
+                    continue
+                if "batch" in record:
+                    self.batches = max(self.batches, record["batch"])
+                elif record.get("srclang") == self.srclang and record.get("msgstr"):
+                    results.setdefault(record["dstlang"], []).append({
+                        "msgid": record["msgid"],
+                        "msgstr": record["msgstr"],
+                        "dstlang": record["dstlang"]
+                    })
+        logging.info("Resuming from checkpoint %s: %i batches, %i translations", self.path, self.batches,
+                     sum(len(translations) for translations in results.values()))
+        return results
+    # load
+
+    ###########################################################################
+
+    def truncate(self):
+        """Cuts the journal back to its last complete line, dropping a record left half written."""
+        with open(self.path, "rb+") as journal:
+            size = journal.seek(0, os.SEEK_END)
+            end = size
+            # Look for the last newline backwards, a block at a time
+            while end > 0:
+                start = max(0, end - 4096)
+                journal.seek(start)
+                newline = journal.read(end - start).rfind(b"\n")
+                if newline >= 0:
+                    end = start + newline + 1
+                    break
+                end = start
+            if end < size:
+                logging.warning("Dropping a truncated record in checkpoint %s", self.path)
+                journal.truncate(end)
+    # truncate
+
+    ###########################################################################
+
+    def append(self, translated_texts):
+        """Journals the results of one completed batch and flushes them to disk."""
+        with self.lock:
+            if self.journal is None:
+                self.journal = open(self.path, "a", encoding="utf-8")  # pylint: disable=R1732
+            self.batches += 1
+            for translation in translated_texts:
+                if translation["msgstr"]:
+                    self.journal.write(json.dumps({
+                        "msgid": translation["msgid"],
+                        "msgstr": translation["msgstr"],
+                        "srclang": self.srclang,
+                        "dstlang": translation["dstlang"]
+                    }, ensure_ascii=False) + "\n")
+            self.journal.write(json.dumps({"batch": self.batches, "texts": len(translated_texts)}) + "\n")
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+    # append
+
+    ###########################################################################
+
+    def close(self, completed=False):
+        """Closes the journal, removing it when the run completed."""
+        with self.lock:
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+            if completed and os.path.exists(self.path):
+                os.remove(self.path)
+    # close
+# CheckpointJournal
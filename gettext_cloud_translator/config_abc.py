@@ -2,6 +2,67 @@ from abc import ABC, abstractmethod
 
 class TranslatorConfiguration(ABC):
     def __init__(self, args) -> None:
-        pass
+        # Service endpoint, when not the public one
+        self.endpoint = args.endpoint
+
+        # Checkpoint journal, flushed to the catalogs every few batches or seconds
+        self.checkpoint = args.checkpoint
+        self.checkpoint_batches = args.checkpoint_batches
+        self.checkpoint_seconds = args.checkpoint_seconds
+
+        # Streaming mode: catalogs are read, translated and written entry by
+        # entry, in batches of texts of which a few are in flight at a time
+        self.stream = args.stream
+        self.stream_batch = max(1, args.stream_batch)
+        self.stream_inflight = max(1, args.stream_inflight)
+
+        # Number of catalogs processed in parallel
+        self.jobs = max(1, args.jobs)
+
+        # Maximum number of requests in flight
+        self.workers = max(1, args.workers)
+
+        # Batch sizes adapted to the latency and failures observed, within the
+        # limits of the backend
+        self.adaptive_batch = args.adaptive_batch
+
+        # Routing between several backends: batch size, and whether a slow
+        # batch is hedged on a second backend
+        self.route_batch = max(1, args.route_batch)
+        self.hedge = args.hedge
+
+        # Quota of the backend, and how many times a failed request is retried
+        self.chars_per_minute = args.chars_per_minute
+        self.requests_per_second = args.requests_per_second
+        self.max_retries = args.max_retries
+
+        # Texts are translated as templates, their placeholders, markup and
+        # numbers masked, unless disabled
+        self.mask_placeholders = not args.no_placeholder_masking
+
+        # Incremental runs: catalog state file, and templates to diff
+        self.incremental = args.incremental
+        self.pot_diff = args.pot_diff
+
+        # Files the run metrics are written to
+        self.metrics_json = args.metrics_json
+        self.metrics_prometheus = args.metrics_prometheus
+
+        # Fuzzy matching against the strings translated before: "prefill"
+        # applies close matches as fuzzy entries, "context" passes them to the
+        # model along with the texts
+        self.fuzzy_tm = args.fuzzy_tm
+        self.fuzzy_tm_file = args.fuzzy_tm_file
+        self.fuzzy_threshold = args.fuzzy_threshold
+
+        # Translation memory shared by every backend
+        self.tm_file = args.tm
+        self.tm_max_entries = args.tm_max_entries
+        if args.no_tm:
+            self.tm_mode = "off"
+        elif args.tm_readonly:
+            self.tm_mode = "readonly"
+        else:
+            self.tm_mode = "readwrite"
     # __init__
-# TranslatorConfiguration
\ No newline at end of file
+# TranslatorConfiguration
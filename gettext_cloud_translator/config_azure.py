@@ -1,16 +1,30 @@
+import logging
+
 from config_abc import TranslatorConfiguration
 
 ###############################################################################
 
 class AzureConfiguration(TranslatorConfiguration):
     def __init__(self, args) -> None:
+        super().__init__(args)
         self.apikey = args.apikey
         self.location = args.location
-        self.file = args.file
+        self.files = args.file
         self.bulk = args.bulk
         self.bulksize = 49500 if args.bulksize > 49500 else args.bulksize
+        self.batch_elements = 1000 if args.batch_elements > 1000 else args.batch_elements
+        self.batch_bytes = args.batch_bytes
+        self.sort_by_length = args.sort_by_length
         self.fuzzy = args.fuzzy
         self.srclang = args.srclang
-        self.dstlang = args.dstlang
+        self.dstlangs = [dstlang.strip() for dstlang in (args.dstlang or "").split(",") if dstlang.strip()]
+        self.dstlang = self.dstlangs[0] if self.dstlangs else None
+        self.pool_size = args.pool_size if args.pool_size else self.workers
+        self.keepalive = not args.no_keepalive
+        self.connect_timeout = args.connect_timeout
+        self.read_timeout = args.read_timeout
+        if self.fuzzy_tm == "context":
+            logging.warning("The Azure backend takes no context, prefilling the fuzzy matches instead")
+            self.fuzzy_tm = "prefill"
     # __init__    
 # ChatGptConfiguration
\ No newline at end of file
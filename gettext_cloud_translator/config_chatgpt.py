@@ -2,14 +2,46 @@ from config_abc import TranslatorConfiguration
 
 ###############################################################################
 
+# Context window and maximum output, in tokens, of the known models. Dated
+# snapshots such as gpt-4o-2024-08-06 use the limits of their family.
+MODEL_LIMITS = {
+    "gpt-3.5-turbo": (16385, 4096),
+    "gpt-4": (8192, 8192),
+    "gpt-4-turbo": (128000, 4096),
+    "gpt-4o": (128000, 16384),
+    "gpt-4o-mini": (128000, 16384),
+    "gpt-4.1": (1047576, 32768),
+    "gpt-4.1-mini": (1047576, 32768),
+    "gpt-4.1-nano": (1047576, 32768),
+}
+DEFAULT_MODEL_LIMITS = (16385, 4096)
+
+###############################################################################
+
+def model_limits(model):
+    """Returns the (context tokens, output tokens) limits of a model."""
+    families = [family for family in MODEL_LIMITS if model == family or model.startswith(family + "-")]
+    return MODEL_LIMITS[max(families, key=len)] if families else DEFAULT_MODEL_LIMITS
+# model_limits
+
+###############################################################################
+
 class ChatGptConfiguration(TranslatorConfiguration):
     def __init__(self, args) -> None:
+        super().__init__(args)
         self.apikey = args.apikey
-        self.file = args.file
+        self.files = args.file
         self.model = args.model
-        self.bulksize = 50 if args.bulksize > 50 else args.bulksize
+        self.bulk = args.bulk
+        # Batches are sized by tokens; --bulksize only bounds the number of texts
+        self.bulksize = 500 if args.bulksize > 500 else args.bulksize
+        context_tokens, output_tokens = model_limits(self.model)
+        self.max_request_tokens = args.max_request_tokens or context_tokens
+        self.max_output_tokens = args.max_output_tokens or output_tokens
+        self.tokenizer = args.tokenizer
         self.fuzzy = args.fuzzy
         self.srclang = args.srclang
-        self.dstlang = args.dstlang
+        self.dstlangs = [dstlang.strip() for dstlang in (args.dstlang or "").split(",") if dstlang.strip()]
+        self.dstlang = self.dstlangs[0] if self.dstlangs else None
     # __init__    
 # ChatGptConfiguration
\ No newline at end of file
@@ -0,0 +1,479 @@
+import argparse
+import copy
+import hmac
+import json
+import logging
+import os
+import secrets
+import socketserver
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from translator_factory import TranslatorFactory
+from translator_service import TranslatorService
+
+###############################################################################
+
+# Texts translated per chunk of a string list, each chunk streamed back as
+# soon as it is done
+STREAM_CHUNK = 500
+
+# Options of a client run that change its translations. The daemon keeps one
+# service per backend and combination of them, started with the daemon's
+# options for the rest; those a client does not give are the daemon's
+TRANSLATION_OPTIONS = ("srclang", "model", "location", "bulk", "tm", "tm_readonly", "tm_max_entries", "no_tm",
+                       "fuzzy_tm", "fuzzy_tm_file", "fuzzy_threshold")
+
+# Options naming files a client run reads, with the daemon's privileges.
+# They must be absolute, the daemon runs in another directory
+PATH_OPTIONS = ("file", "pot_diff")
+
+# Options naming files a run writes, which clients may not set: only the
+# daemon's own translation memory and fuzzy index are written
+OUTPUT_OPTIONS = ("incremental", "checkpoint", "metrics_json", "metrics_prometheus", "tm", "fuzzy_tm_file")
+
+# File the daemon writes the token of its TCP clients to, readable by its owner only
+DEFAULT_TOKEN_FILE = os.path.join(
+    os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+    "gettext-cloud-translator",
+    "daemon.token"
+)
+
+###############################################################################
+
+class TranslationCache:
+    """An in-memory LRU of recent translations, keyed by (service key, dstlang, text)."""
+
+    def __init__(self, max_entries) -> None:
+        self.max_entries = max(0, max_entries)
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+    # __init__
+
+    ###########################################################################
+
+    def get(self, key):
+        with self.lock:
+            translation = self.entries.get(key)
+            if translation is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return translation
+    # get
+
+    ###########################################################################
+
+    def put(self, key, translation):
+        if not self.max_entries:
+            return
+        with self.lock:
+            self.entries[key] = translation
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+    # put
+# TranslationCache
+
+###############################################################################
+
+class TranslationDaemon:
+    """
+    Keeps one warm service per backend and TRANSLATION_OPTIONS, with its
+    HTTP clients, connection pool, rate limiter and translation memory, in
+    front of an LRU of recent translations, for every client of the daemon.
+
+    Identical requests from concurrent clients are coalesced text by text:
+    a text already being translated into a language is waited for instead of
+    being sent again.
+    """
+
+    def __init__(self, args, parser, pipeline) -> None:
+        self.args = args
+        self.parser = parser
+        self.pipeline = pipeline
+        self.services = {}
+        self.cache = TranslationCache(args.cache_entries)
+        self.in_flight = {}
+        self.coalesced = 0
+        self.lock = threading.Lock()
+    # __init__
+
+    ###########################################################################
+
+    @staticmethod
+    def service_key(args):
+        """Returns the key of the service translating a run: its backend and TRANSLATION_OPTIONS."""
+        return (args.backend, *(getattr(args, name) for name in TRANSLATION_OPTIONS))
+    # service_key
+
+    ###########################################################################
+
+    def service(self, args):
+        """Returns the service translating a run, creating it on its first request."""
+        key = self.service_key(args)
+        with self.lock:
+            if key not in self.services:
+                service_args = copy.copy(self.args)
+                service_args.backend = args.backend
+                for name in TRANSLATION_OPTIONS:
+                    setattr(service_args, name, getattr(args, name))
+                self.services[key] = TranslatorFactory().create_translator(service_args)
+                logging.info("Started the %s backend (%i running)", args.backend, len(self.services))
+            return self.services[key]
+    # service
+
+    ###########################################################################
+
+    def translate(self, args, texts, dstlangs):
+        """
+        Translates the texts into every language in `dstlangs` through the
+        cache, the translations in flight and the service of the run `args`.
+        Returns a {dstlang: results} dict.
+        """
+        service = self.service(args)
+        service_key = self.service_key(args)
+        results = {dstlang: [] for dstlang in dstlangs}
+        owned = {}
+        waiting = []
+        with self.lock:
+            for dstlang in dstlangs:
+                for text in dict.fromkeys(texts):
+                    key = (service_key, dstlang, text)
+                    translation = self.cache.get(key)
+                    if translation is not None:
+                        results[dstlang].append(translation)
+                    elif key in self.in_flight:
+                        waiting.append((dstlang, self.in_flight[key]))
+                        self.coalesced += 1
+                    else:
+                        self.in_flight[key] = Future()
+                        owned.setdefault(text, []).append(dstlang)
+
+        groups = {}
+        for text, targets in owned.items():
+            groups.setdefault(tuple(targets), []).append(text)
+        try:
+            for targets, group in groups.items():
+                try:
+                    translated = service.translate_multi(group, list(targets))
+                except Exception as e:  # pylint: disable=W0718
+                    logging.error("Error translating %i texts into %s: %s", len(group), ", ".join(targets), e)
+                    translated = {}
+                for dstlang in targets:
+                    found = {translation["msgid"]: translation for translation in translated.get(dstlang, [])
+                             if translation["msgstr"]}
+                    for text in group:
+                        translation = found.get(text)
+                        key = (service_key, dstlang, text)
+                        if translation is not None:
+                            results[dstlang].append(translation)
+                            # Fuzzy matches are answered again, not cached as translations
+                            if translation.get("fuzzy") is None:
+                                self.cache.put(key, translation)
+                        with self.lock:
+                            self.in_flight.pop(key).set_result(translation)
+        finally:
+            # Release the clients waiting for texts this request could not translate
+            with self.lock:
+                for text, targets in owned.items():
+                    for dstlang in targets:
+                        future = self.in_flight.pop((service_key, dstlang, text), None)
+                        if future is not None:
+                            future.set_result(None)
+
+        for dstlang, future in waiting:
+            translation = future.result()
+            if translation is not None:
+                results[dstlang].append(translation)
+        return results
+    # translate
+
+    ###########################################################################
+
+    def run_args(self, argv):
+        """
+        Parses the options of a client run, the backend and TRANSLATION_OPTIONS
+        defaulting to the daemon's. Raises ValueError for a relative path or
+        an output file other than the daemon's.
+        """
+        defaults = argparse.Namespace(**{name: getattr(self.args, name) for name in TRANSLATION_OPTIONS})
+        args = self.parser.parse_args(["--backend", self.args.backend, *argv], namespace=defaults)
+        args.apikey = self.args.apikey
+        for name in OUTPUT_OPTIONS:
+            value = getattr(args, name)
+            if value is not None and value != getattr(self.args, name, None):
+                raise ValueError(f"--{name.replace('_', '-')} cannot be set by a client of the daemon")
+        for name in PATH_OPTIONS:
+            value = getattr(args, name)
+            if value is None:
+                continue
+            for path in value if isinstance(value, list) else [value]:
+                if not os.path.isabs(path):
+                    raise ValueError(f"--{name.replace('_', '-')} must be an absolute path: {path}")
+        return args
+    # run_args
+
+    ###########################################################################
+
+    def translate_catalogs(self, argv, emit):
+        """
+        Runs the catalog pipeline on the catalogs of a client run, its
+        requests going through the daemon. Returns the per-file summaries.
+        """
+        args = self.run_args(argv)
+        service = self.service(args)
+        config = type(service.config)(args)
+        return self.pipeline(DaemonService(self, args, service, config, emit)).translate()
+    # translate_catalogs
+
+    ###########################################################################
+
+    def stats(self):
+        with self.lock:
+            return {
+                "backends": sorted({key[0] for key in self.services}),
+                "services": len(self.services),
+                "cache": {"entries": len(self.cache.entries), "hits": self.cache.hits, "misses": self.cache.misses},
+                "coalesced": self.coalesced,
+                "in_flight": len(self.in_flight),
+            }
+    # stats
+
+    ###########################################################################
+
+    def close(self):
+        with self.lock:
+            for service in self.services.values():
+                service.close()
+            self.services.clear()
+    # close
+# TranslationDaemon
+
+###############################################################################
+
+class DaemonService(TranslatorService):
+    """
+    The service a catalog run of a client sees: its configuration is the
+    client's, its requests go through the daemon, and every completed group
+    is reported to the client.
+    """
+
+    def __init__(self, daemon, args, service, config, emit) -> None:  # pylint: disable=W0231
+        self.daemon = daemon
+        self.args = args
+        self.service = service
+        self.config = config
+        self.emit = emit
+    # __init__
+
+    ###########################################################################
+
+    def translate_multi(self, texts, dstlangs):
+        results = self.daemon.translate(self.args, texts, dstlangs)
+        self.emit({"event": "translated", "texts": len(texts),
+                   "translated": {dstlang: len(translations) for dstlang, translations in results.items()}})
+        return results
+    # translate_multi
+
+    def translate_in_bulk(self, texts, dstlang=None):
+        dstlang = dstlang or self.config.dstlang
+        return self.translate_multi(texts, [dstlang])[dstlang]
+    # translate_in_bulk
+
+    def translate_one_by_one(self, texts, dstlang=None):
+        return self.translate_in_bulk(texts, dstlang)
+    # translate_one_by_one
+
+    ###########################################################################
+
+    def estimate_requests(self, texts, targets=1):
+        return self.service.estimate_requests(texts, targets)
+    # estimate_requests
+# DaemonService
+
+###############################################################################
+
+class DaemonRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /status returns the daemon statistics. POST /translate takes
+    {"texts": [...], "args": [...]} and POST /catalogs {"args": [...]},
+    `args` being the command line options of the run. Both answer with one
+    JSON object per line, streamed as the work completes.
+
+    Client runs read and write their catalogs with the daemon's privileges,
+    so requests must be JSON, come from no web page (no Origin header) and,
+    on the TCP port, carry the token the daemon wrote to its token file as
+    a bearer token. The Unix socket is only accessible to its owner.
+    """
+    server_version = "gettext-cloud-translator"
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "local"
+    # address_string
+
+    ###########################################################################
+
+    def log_message(self, format, *args):  # pylint: disable=W0622
+        logging.debug("%s %s", self.address_string(), format % args)
+    # log_message
+
+    ###########################################################################
+
+    def refuse(self, post=False):
+        """
+        Answers an error and returns True for a request a browser could have
+        sent, or without the token of the daemon when it has one.
+        """
+        token = self.server.token
+        if self.headers.get("Origin") is not None:
+            self.send_error(403, "Cross-origin requests are refused")
+        elif token is not None and not hmac.compare_digest(self.headers.get("Authorization", ""),
+                                                           f"Bearer {token}"):
+            self.send_error(401, "Missing or invalid token")
+        elif post and self.headers.get_content_type() != "application/json":
+            self.send_error(415, "Requests must be application/json")
+        else:
+            return False
+        return True
+    # refuse
+
+    ###########################################################################
+
+    def do_GET(self):  # pylint: disable=C0103
+        if self.path != "/status":
+            self.send_error(404)
+            return
+        if self.refuse():
+            return
+        self.start_stream()
+        self.emit(self.server.daemon.stats())
+    # do_GET
+
+    ###########################################################################
+
+    def do_POST(self):  # pylint: disable=C0103
+        if self.path not in ("/translate", "/catalogs"):
+            self.send_error(404)
+            return
+        if self.refuse(post=True):
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            argv = [str(argument) for argument in request.get("args", [])]
+        except (ValueError, TypeError, AttributeError) as e:
+            self.send_error(400, str(e))
+            return
+        daemon = self.server.daemon
+        self.start_stream()
+        try:
+            if self.path == "/catalogs":
+                for summary in daemon.translate_catalogs(argv, self.emit):
+                    self.emit({"event": "catalog", **summary})
+            else:
+                args = daemon.run_args(argv)
+                dstlangs = [dstlang.strip() for dstlang in (args.dstlang or "").split(",") if dstlang.strip()]
+                texts = [str(text) for text in request.get("texts", [])]
+                for offset in range(0, len(texts), STREAM_CHUNK):
+                    results = daemon.translate(args, texts[offset:offset + STREAM_CHUNK], dstlangs)
+                    for translations in results.values():
+                        for translation in translations:
+                            self.emit({"event": "translation", **translation})
+            self.emit({"event": "done"})
+        except SystemExit:
+            self.emit({"event": "error", "error": "invalid options"})
+        except Exception as e:  # pylint: disable=W0718
+            logging.error("Error serving %s: %s", self.path, e)
+            self.emit({"event": "error", "error": str(e)})
+    # do_POST
+
+    ###########################################################################
+
+    def start_stream(self):
+        """Starts a response whose body is read until the connection closes."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+    # start_stream
+
+    ###########################################################################
+
+    def emit(self, record):
+        """Writes one JSON line to the client and flushes it."""
+        self.wfile.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+        self.wfile.flush()
+    # emit
+# DaemonRequestHandler
+
+###############################################################################
+
+class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+# UnixHTTPServer
+
+###############################################################################
+
+def create_server(daemon, socket_path=None, port=0, token=None):
+    """
+    Creates the HTTP server of the daemon, on a Unix socket or a local TCP
+    port. TCP requests must carry `token`, which is required for them.
+    """
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, DaemonRequestHandler)
+        os.chmod(socket_path, 0o600)
+        token = None
+    else:
+        if not token:
+            raise ValueError("A daemon on a TCP port requires a token")
+        server = ThreadingHTTPServer(("127.0.0.1", port), DaemonRequestHandler)
+    server.daemon = daemon
+    server.token = token
+    return server
+# create_server
+
+###############################################################################
+
+def write_token(path):
+    """Generates the token of a daemon start and writes it to `path`, readable by its owner only."""
+    token = secrets.token_urlsafe(32)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if os.path.exists(path):
+        os.remove(path)
+    handle = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with open(handle, "w", encoding="utf-8") as output:
+        output.write(token)
+    return token
+# write_token
+
+###############################################################################
+
+def serve(args, parser, pipeline):
+    """
+    Serves translation requests until interrupted. Client runs are parsed
+    with `parser` and their catalogs translated by `pipeline`.
+    """
+    daemon = TranslationDaemon(args, parser, pipeline)
+    token = None if args.socket else write_token(args.token_file)
+    server = create_server(daemon, args.socket, args.port, token)
+    logging.info("Serving on %s", args.socket or f"http://127.0.0.1:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Shutting down")
+    finally:
+        server.server_close()
+        daemon.close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+# serve
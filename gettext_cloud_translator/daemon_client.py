@@ -0,0 +1,167 @@
+"""
+Thin client of the gettext-cloud-translator daemon (gettext_cloud_translator.py
+--serve). It only imports the standard library, so it starts in a few
+milliseconds; the backends, their connections, rate limiter and caches stay
+warm in the daemon.
+
+Usage:
+    python daemon_client.py --file locale/ --dstlang es,fr [run options]
+    python daemon_client.py --texts strings.txt --dstlang es [run options]
+    python daemon_client.py --status
+
+The run options are those of gettext_cloud_translator.py, e.g. --bulk or
+--fuzzy-tm prefill, and are parsed by the daemon, which refuses those naming
+files to write. A daemon on a TCP port is sent the token it wrote to its
+--token-file.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import sys
+
+from functools import partial
+from urllib.parse import urlsplit
+
+###############################################################################
+
+# Run options naming files, with the number of paths each takes. They are
+# made absolute, the daemon may run in another directory; it refuses the
+# options naming files to write, such as --metrics-json or --checkpoint
+PATH_OPTIONS = {"--pot-diff": 2}
+
+# File the daemon writes the token of its TCP clients to
+DEFAULT_TOKEN_FILE = os.path.join(
+    os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+    "gettext-cloud-translator",
+    "daemon.token"
+)
+
+###############################################################################
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """An HTTP connection over a Unix socket."""
+
+    def __init__(self, path) -> None:
+        super().__init__("localhost")
+        self.socket_path = path
+    # __init__
+
+    ###########################################################################
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+    # connect
+# UnixHTTPConnection
+
+###############################################################################
+
+def stream(connection, method, path, body=None, token=None):
+    """Sends a request to the daemon and yields the JSON records of its answer as they arrive."""
+    payload = json.dumps(body).encode("utf-8") if body is not None else None
+    headers = {"Content-Type": "application/json"}
+    if token is not None:
+        headers["Authorization"] = f"Bearer {token}"
+    connection.request(method, path, payload, headers)
+    response = connection.getresponse()
+    if response.status != 200:
+        raise RuntimeError(f"The daemon answered {response.status} {response.reason}")
+    for line in response:
+        if line.strip():
+            yield json.loads(line)
+# stream
+
+###############################################################################
+
+def absolute_paths(run_args):
+    """Returns the run options with the paths of PATH_OPTIONS made absolute, as --option value or --option=value."""
+    result = []
+    remaining = 0
+    for argument in run_args:
+        option, equals, value = argument.partition("=")
+        if remaining:
+            result.append(os.path.abspath(argument))
+            remaining -= 1
+        elif equals and option in PATH_OPTIONS:
+            result.append(f"{option}={os.path.abspath(value)}")
+        else:
+            result.append(argument)
+            remaining = PATH_OPTIONS.get(argument, 0)
+    return result
+# absolute_paths
+
+###############################################################################
+
+def build_parser():
+    """Builds the command line argument parser of the client."""
+    parser = argparse.ArgumentParser(description="Submit catalogs or strings to a gettext-cloud-translator daemon")
+    parser.add_argument("--socket", help="Unix socket of the daemon")
+    parser.add_argument("--url", default="http://127.0.0.1:8765", help="URL of the daemon, when not on a Unix socket. Defaults to http://127.0.0.1:8765")
+    parser.add_argument("--file", nargs="+", action="extend", help="Catalogs, directories or glob patterns to translate")
+    parser.add_argument("--texts", help="File with one string to translate per line, '-' for the standard input. The translations are printed as JSON lines")
+    parser.add_argument("--status", action="store_true", help="Print the daemon statistics")
+    parser.add_argument("--token-file", default=DEFAULT_TOKEN_FILE, help=f"Token file of a daemon on a TCP port. Defaults to {DEFAULT_TOKEN_FILE}")
+    return parser
+# build_parser
+
+###############################################################################
+
+def main():
+    """Submits the catalogs or strings and prints the results as they are streamed back."""
+    parser = build_parser()
+    args, run_args = parser.parse_known_args()
+    run_args = absolute_paths(run_args)
+    token = None
+    if args.socket:
+        connection = UnixHTTPConnection(args.socket)
+    else:
+        url = urlsplit(args.url)
+        connection = http.client.HTTPConnection(url.hostname, url.port or 80)
+        try:
+            with open(args.token_file, encoding="utf-8") as handle:
+                token = handle.read().strip()
+        except OSError as e:
+            parser.error(f"cannot read the token of the daemon: {e}")
+    send = partial(stream, connection, token=token)
+
+    if args.status:
+        records = send("GET", "/status")
+    elif args.texts:
+        with (sys.stdin if args.texts == "-" else open(args.texts, encoding="utf-8")) as handle:
+            texts = [line.rstrip("\n") for line in handle if line.strip()]
+        records = send("POST", "/translate", {"texts": texts, "args": run_args})
+    elif args.file:
+        # Paths are resolved here, the daemon may run in another directory
+        patterns = [os.path.abspath(pattern) for pattern in args.file]
+        records = send("POST", "/catalogs", {"args": ["--file", *patterns, *run_args]})
+    else:
+        parser.error("one of --file, --texts or --status is required")
+
+    failed = False
+    for record in records:
+        event = record.pop("event", None)
+        if event in ("translation", None):
+            print(json.dumps(record, ensure_ascii=False), flush=True)
+        elif event == "translated":
+            print(f"translated {record['texts']} texts: "
+                  + ", ".join(f"{dstlang} {count}" for dstlang, count in record["translated"].items()),
+                  file=sys.stderr, flush=True)
+        elif event == "catalog":
+            failed |= record["status"] == "error"
+            print(f"{record['file']}  {record['language'] or ''}  {record['status']}  "
+                  f"{record['pending']} pending  {record['translated']} translated", flush=True)
+        elif event == "error":
+            failed = True
+            print(f"error: {record['error']}", file=sys.stderr, flush=True)
+    connection.close()
+    sys.exit(1 if failed else 0)
+# main
+
+###############################################################################
+
+if __name__ == "__main__":
+    main()
+# __main__
@@ -0,0 +1,214 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import unicodedata
+
+from translation_memory import DEFAULT_TM_FILE
+
+###############################################################################
+
+DEFAULT_FUZZY_FILE = os.path.join(os.path.dirname(DEFAULT_TM_FILE), "fuzzy.sqlite3")
+
+# Characters per n-gram of the normalized source strings
+NGRAM = 3
+
+# MinHash signatures have BANDS * ROWS values; two strings share an LSH bucket
+# when all ROWS values of one band agree, which makes strings above a trigram
+# Jaccard similarity of about 0.6 likely candidates
+BANDS = 8
+ROWS = 4
+SIZE = BANDS * ROWS
+
+# Strings read at most per bucket, and candidates scored at most per lookup,
+# so crowded buckets do not slow lookups down
+MAX_BUCKET = 64
+MAX_CANDIDATES = 8
+
+# Signature values, packed to hash the bands into bucket keys
+VALUES = struct.Struct(f">{SIZE}Q")
+
+# Reads the strings sharing a bucket with the text, those sharing the most
+# bands first
+MATCH_QUERY = (
+    "SELECT s.msgid, s.msgstr FROM (SELECT id, COUNT(*) AS shared FROM ("
+    + " UNION ALL ".join([f"SELECT * FROM (SELECT id FROM buckets WHERE key = ? LIMIT {MAX_BUCKET})"] * BANDS)
+    + f") GROUP BY id ORDER BY shared DESC LIMIT {MAX_CANDIDATES}) c"
+    " CROSS JOIN strings s ON s.id = c.id WHERE s.srclang = ? AND s.dstlang = ?"
+)
+
+###############################################################################
+
+def ngrams(text):
+    """Returns the set of character n-grams of a text, case and whitespace normalized."""
+    text = " " + " ".join(unicodedata.normalize("NFC", text).casefold().split()) + " "
+    return {text[i:i + NGRAM] for i in range(max(1, len(text) - NGRAM + 1))}
+# ngrams
+
+###############################################################################
+
+def similarity(grams, other):
+    """Returns the Jaccard similarity of two n-gram sets."""
+    return len(grams & other) / len(grams | other)
+# similarity
+
+###############################################################################
+
+def signature(grams):
+    """
+    Returns the MinHash signature of an n-gram set, by one permutation
+    hashing: every n-gram is hashed once, into one of SIZE bins that keep
+    their minimum. An empty bin takes the value of the nearest filled bin on
+    its right, offset by the distance, so short strings still get SIZE values.
+    The hash does not depend on the process, so persisted signatures stay valid.
+    """
+    bins = [None] * SIZE
+    for gram in grams:
+        value = int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest(), "big")
+        slot, value = value % SIZE, value // SIZE
+        if bins[slot] is None or value < bins[slot]:
+            bins[slot] = value
+    values = list(bins)
+    nearest, distance = None, 0
+    for index in reversed(range(2 * SIZE)):
+        slot = index % SIZE
+        if bins[slot] is not None:
+            nearest, distance = bins[slot], 0
+        elif nearest is not None:
+            distance += 1
+            values[slot] = nearest + (distance << 59)
+    return values
+# signature
+
+###############################################################################
+
+class FuzzyIndex:
+    """
+    A persistent index of translated source strings, backed by SQLite, that
+    finds the translation of the most similar string to a new one.
+
+    Strings are compared on their character trigrams. Their MinHash signature
+    is cut into bands and every band is hashed into an LSH bucket, so a lookup
+    is one indexed query for the few strings sharing a bucket with the text,
+    whatever the size of the index, followed by an exact similarity check of
+    those candidates. Bucket keys are 31 bit integers, which SQLite stores in
+    four bytes.
+    """
+
+    def __init__(self, path, srclang="", threshold=0.75) -> None:
+        self.path = path
+        self.srclang = srclang
+        self.threshold = threshold
+        self.lookups = 0
+        self.matches = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS strings ("
+            " id INTEGER PRIMARY KEY, srclang TEXT NOT NULL, dstlang TEXT NOT NULL,"
+            " msgid TEXT NOT NULL, msgstr TEXT NOT NULL, UNIQUE (srclang, dstlang, msgid))"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key INTEGER NOT NULL, id INTEGER NOT NULL,"
+            " PRIMARY KEY (key, id)) WITHOUT ROWID"
+        )
+        self.connection.commit()
+    # __init__
+
+    ###########################################################################
+
+    @classmethod
+    def from_config(cls, config):
+        """Opens the index configured in `config`, or returns None when --fuzzy-tm is not set."""
+        if not config.fuzzy_tm:
+            return None
+        return cls(config.fuzzy_tm_file, config.srclang, config.fuzzy_threshold)
+    # from_config
+
+    ###########################################################################
+
+    def bucket_keys(self, grams, dstlang):
+        """Returns the LSH bucket key of every band of the signature of an n-gram set."""
+        values = VALUES.pack(*signature(grams))
+        prefix = f"{self.srclang}:{dstlang}:".encode("utf-8")
+        return [
+            int.from_bytes(hashlib.blake2b(
+                prefix + bytes([band]) + values[band * ROWS * 8:(band + 1) * ROWS * 8], digest_size=4
+            ).digest(), "big") >> 1
+            for band in range(BANDS)
+        ]
+    # bucket_keys
+
+    ###########################################################################
+
+    def match(self, text, dstlang):
+        """
+        Returns the (source, translation, similarity) of the indexed string most
+        similar to `text`, or None when none reaches the threshold.
+        """
+        grams = ngrams(text)
+        keys = self.bucket_keys(grams, dstlang)
+        with self.lock:
+            rows = self.connection.execute(MATCH_QUERY, (*keys, self.srclang, dstlang)).fetchall()
+        best = None
+        for msgid, msgstr in rows:
+            score = similarity(grams, ngrams(msgid))
+            if score >= self.threshold and (best is None or score > best[2]):
+                best = (msgid, msgstr, score)
+        return best
+    # match
+
+    ###########################################################################
+
+    def lookup(self, texts, dstlang):
+        """Returns a {text: (source, translation, similarity)} dict for the texts with a close match."""
+        found = {}
+        for text in texts:
+            best = self.match(text, dstlang)
+            if best is not None:
+                found[text] = best
+        with self.lock:
+            self.lookups += len(texts)
+            self.matches += len(found)
+        return found
+    # lookup
+
+    ###########################################################################
+
+    def add(self, translations, dstlang):
+        """Indexes a {source: translation} dict, updating the translation of the sources already indexed."""
+        if not translations:
+            return
+        with self.lock:
+            for msgid, msgstr in translations.items():
+                row = self.connection.execute(
+                    "SELECT id, msgstr FROM strings WHERE srclang = ? AND dstlang = ? AND msgid = ?",
+                    (self.srclang, dstlang, msgid)
+                ).fetchone()
+                if row is not None:
+                    if row[1] != msgstr:
+                        self.connection.execute("UPDATE strings SET msgstr = ? WHERE id = ?", (msgstr, row[0]))
+                    continue
+                cursor = self.connection.execute(
+                    "INSERT INTO strings (srclang, dstlang, msgid, msgstr) VALUES (?, ?, ?, ?)",
+                    (self.srclang, dstlang, msgid, msgstr)
+                )
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO buckets (key, id) VALUES (?, ?)",
+                    [(key, cursor.lastrowid) for key in self.bucket_keys(ngrams(msgid), dstlang)]
+                )
+            self.connection.commit()
+        logging.debug("Indexed %i translated strings for fuzzy matching", len(translations))
+    # add
+
+    ###########################################################################
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+    # close
+# FuzzyIndex
@@ -32,14 +32,31 @@ SOFTWARE.
 """
 
 import argparse
+import glob
 import logging
 import os
+import sys
+import threading
+import time
 import polib
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 from dotenv import load_dotenv
 from version import __version__
 from translator_factory import TranslatorFactory
-from rich.pretty import pprint
+from translation_memory import DEFAULT_TM_FILE
+from fuzzy_index import DEFAULT_FUZZY_FILE
+from daemon import DEFAULT_TOKEN_FILE
+from translation_plan import TranslationPlan
+from placeholders import PlaceholderMasker, mask_translations
+from catalog_header import read_header
+from catalog_stream import (AtomicFile, EntryBatch, apply_translation, catalog_encoding, is_pending, parse_entry,
+                            read_entries, set_flags)
+from checkpoint import CheckpointJournal
+from incremental import CatalogState, pot_changes
+from metrics import Metrics
 
 ###############################################################################
 
@@ -53,38 +70,64 @@ class GettextCloudTranslator:
     def __init__(self, service) -> None:
         self.service = service
         self.config = service.config
-
-        if self.config.fuzzy:
-            self.disable_fuzzy_translations(self.config.file)        
+        self.lock = threading.Lock()
+        self.plan = None
+        self.masker = None
+        self.journal = None
+        self.catalogs = {}
+        self.dirty = set()
+        self.batches_since_flush = 0
+        self.last_flush = time.monotonic()
+        self.metrics = Metrics()
+        self.service.metrics = self.metrics
+        self.state = CatalogState(self.config.incremental) if self.config.incremental else None
+        self.changed_msgids = pot_changes(*self.config.pot_diff) if self.config.pot_diff else None
     # __init__
 
     ###########################################################################
 
-    def disable_fuzzy_translations(self):
+    def disable_fuzzy_translations(self, po_file):
         """
-        Disables fuzzy translations in a .po file by removing the 'fuzzy' flags from entries.
+        Disables fuzzy translations in a parsed catalog by removing the 'fuzzy'
+        flags from its entries. Returns how many entries were changed.
         """
-        try:
-            po_file = polib.pofile(self.config.file)
+        fuzzy_entries = [entry for entry in po_file if 'fuzzy' in entry.flags]
+        for entry in fuzzy_entries:
+            entry.flags.remove('fuzzy')
+        if fuzzy_entries:
+            logging.info("Fuzzy translations disabled in file: %s", po_file.fpath)
+        return len(fuzzy_entries)
+    # disable_fuzzy_translations
 
-            fuzzy_entries = [entry for entry in po_file if 'fuzzy' in entry.flags]
-            for entry in fuzzy_entries:
-                entry.flags.remove('fuzzy')
+    ###########################################################################
 
-            self.po_file.save(self.config.file)
-            logging.info("Fuzzy translations disabled in file: %s", self.config.file)
-        except Exception as e:  # pylint: disable=W0718
-            logging.error("Error while disabling fuzzy translations in file %s: %s", self.config.filepo_file_path, e)    
-    # disable_fuzzy_translations    
+    def index_po_entries(self, po_file):
+        """
+        Builds a msgid -> entries index of the entries pending translation, so
+        that applying the results costs a dict lookup instead of a catalog scan.
+        The same msgid may appear under several msgctxt values; since the
+        backends never see the context, all of them share the translation.
+        With --pot-diff, only the msgids new in the current template are indexed.
+        Plural entries are left out, as in stream mode: polib would not write
+        a single translation back into their msgstr_plural.
+        """
+        po_index = {}
+        for entry in po_file:
+            if not entry.msgstr and entry.msgid and not entry.msgid_plural and 'fuzzy' not in entry.flags:
+                if self.changed_msgids is None or entry.msgid in self.changed_msgids:
+                    po_index.setdefault(entry.msgid, []).append(entry)
+        return po_index
+    # index_po_entries
 
     ###########################################################################
 
-    def update_po_entry(self, original_text, translated_text, po_file):
-        """Updates a .po file entry with the translated text."""
-        entry = po_file.find(original_text)
-        if entry:
-            logging.info("Applying to %s", entry.msgid)
+    def update_po_entry(self, original_text, translated_text, po_index):
+        """Updates the indexed .po file entries with the translated text. Returns how many were updated."""
+        entries = po_index.get(original_text, [])
+        for entry in entries:
+            logging.debug("Applying to %s", entry.msgid)
             entry.msgstr = translated_text
+        return len(entries)
     # update_po_entry 
 
     ###########################################################################
@@ -93,76 +136,634 @@ class GettextCloudTranslator:
         """
         Applies the translated texts to the .po file.
         """
+        po_index = self.index_po_entries(po_file)
+        updated = 0
 
         for translation in translated_texts:
             if translation["msgstr"]:
-                self.update_po_entry(translation["msgid"], translation["msgstr"], po_file)
+                updated += self.update_po_entry(translation["msgid"], translation["msgstr"], po_index)
             else:
                 logging.warning("No original text found for index %s", translation["msgid"])
+        return updated
     # apply_translations_to_po_file
   
     ###########################################################################
 
-    def process_translations(self, texts_to_translate):
-        """Processes translations either in bulk or one by one."""
-        if self.config.bulk:          
-            return self.service.translate_in_bulk(texts_to_translate)
-        else:
-            return self.service.translate_one_by_one(texts_to_translate)
+    def process_translations(self, texts_to_translate, dstlangs):
+        """
+        Translates the texts into every language in `dstlangs`, either in bulk
+        or one by one. Returns a {dstlang: results} dict.
+        """
+        return self.service.translate_multi(texts_to_translate, dstlangs)
     # process_translations    
 
     ###########################################################################    
 
     def translate(self):
+        """
+        Translates every catalog matched by --file. Catalogs are loaded and
+        saved up to --jobs at a time, and their pending entries are planned
+        together so each unique text is only translated once. Unless
+        --no-placeholder-masking is set, texts that only differ by their
+        placeholders, markup or numbers are translated once as a template.
+        With --incremental, the catalogs unchanged since the last run are
+        skipped without being parsed. With --stream, each catalog is streamed
+        through the service entry by entry instead, see stream_catalog().
+        """
+        with self.metrics.phase("parse"):
+            files, unchanged = self.select_catalogs()
+        if self.config.stream:
+            return self.finish(self.map_files(self.stream_catalog, files), unchanged)
+
+        with self.metrics.phase("parse"):
+            catalogs = self.map_files(self.load_catalog, files)
+
+        with self.metrics.phase("plan"):
+            plan = TranslationPlan(self.config.srclang)
+            fuzzy_index = self.service.fuzzy_index
+            for summary, po_file in catalogs:
+                if po_file is not None:
+                    if fuzzy_index is not None:
+                        self.seed_fuzzy_index({entry.msgid: entry.msgstr for entry in po_file.translated_entries()
+                                               if entry.msgstr}, summary["language"])
+                    po_index = self.index_po_entries(po_file)
+                    summary["pending"] = sum(len(entries) for entries in po_index.values())
+                    plan.add_catalog(summary["file"], po_index, summary["language"])
+                    self.catalogs[summary["file"]] = po_file
+
+            updated = {}
+            if self.config.checkpoint:
+                self.journal = CheckpointJournal(self.config.checkpoint, self.config.srclang)
+                for dstlang, translated_texts in self.journal.load().items():
+                    for path, count in plan.resolve(translated_texts, dstlang).items():
+                        updated[path] = updated.get(path, 0) + count
+                self.plan = plan
+                self.service.on_batch = self.checkpoint_batch
+
+            groups = plan.groups()
+            unmasked_groups = groups
+            if self.config.mask_placeholders:
+                self.masker = PlaceholderMasker()
+                groups, verbatim = self.masker.mask_groups(groups)
+                for path, count in plan.fan_out(verbatim).items():
+                    updated[path] = updated.get(path, 0) + count
+        if groups:
+            self.log_savings(plan, unmasked_groups, groups)
+        else:
+            logging.info("No pending entries, nothing to translate")
+
+        try:
+            for dstlangs, texts_to_translate in groups.items():
+                try:
+                    with self.metrics.phase("network"):
+                        results = self.process_translations(texts_to_translate, list(dstlangs))
+                except Exception as e:  # pylint: disable=W0718
+                    logging.error("Error translating %i texts into %s: %s",
+                                  len(texts_to_translate), ", ".join(dstlangs), e)
+                    continue
+
+                for dstlang, translated_texts in results.items():
+                    logging.info("Applying %i %s translations", len(translated_texts), dstlang)
+                    self.metrics.count("strings_translated", len(translated_texts))
+                    with self.lock, self.metrics.phase("apply"):
+                        for path, count in plan.fan_out(self.unmask(translated_texts), dstlang).items():
+                            updated[path] = updated.get(path, 0) + count
+        except KeyboardInterrupt:
+            if self.journal is not None:
+                logging.warning("Interrupted, flushing the completed batches to the catalogs")
+                self.flush_catalogs()
+                self.journal.close()
+            raise
+
+        for summary, _ in catalogs:
+            summary["translated"] = updated.get(summary["file"], 0)
+
+        with self.metrics.phase("save"):
+            summaries = [summary for summary, _ in self.map_files(self.save_catalog, catalogs)]
+        return self.finish(summaries, unchanged)
+    # translate
+
+    ###########################################################################
+
+    def select_catalogs(self):
+        """
+        Finds the catalogs matched by --file. Returns those to translate and,
+        with --incremental, those unchanged since the last run.
+        """
+        files = find_catalogs(self.config.files)
+        if not files:
+            logging.warning("No .po files found in: %s", ", ".join(self.config.files))
+        unchanged = []
+        if self.state is not None:
+            unchanged = [path for path in files if self.state.unchanged(path)]
+            skipped = set(unchanged)
+            files = [path for path in files if path not in skipped]
+            logging.info("Incremental: %i catalogs unchanged since the last run", len(unchanged))
+        return files, unchanged
+    # select_catalogs
+
+    ###########################################################################
+
+    def finish(self, summaries, unchanged):
+        """Records the state of the run, writes its metrics and prints the summary. Returns the summaries."""
+        if self.state is not None:
+            for summary in summaries:
+                # With --pot-diff the pending count leaves out the entries outside the diff, so the catalog
+                # is not recorded: a record left by an earlier run only matches if the file was not changed
+                if summary["status"] == "done" and self.changed_msgids is None:
+                    self.state.record(summary["file"], summary["pending"] - summary["translated"])
+            self.state.save()
+            summaries += [{"file": path, "language": None, "status": "unchanged", "pending": 0, "translated": 0,
+                           "fuzzy_cleared": 0, "seconds": 0.0} for path in unchanged]
+        if self.journal is not None:
+            self.journal.close(completed=all(summary["status"] != "error" for summary in summaries))
+        if self.masker is not None:
+            self.metrics.count("placeholder_mismatches", self.masker.mangled)
+        self.metrics.collect(self.service)
+        self.metrics.write(self.config.metrics_json, self.config.metrics_prometheus)
+        self.print_summary(summaries)
+        self.log_summary()
+        return summaries
+    # finish
+
+    ###########################################################################
+
+    def checkpoint_batch(self, translated_texts):
+        """
+        Journals the results of a completed batch and applies them to their
+        catalogs, which are flushed to disk every --checkpoint-batches batches
+        or --checkpoint-seconds seconds.
+        """
+        translated_texts = self.unmask(translated_texts)
+        self.journal.append(translated_texts)
+        with self.lock:
+            self.dirty.update(self.plan.fan_out(translated_texts))
+            self.batches_since_flush += 1
+            due = (self.batches_since_flush >= self.config.checkpoint_batches
+                   or time.monotonic() - self.last_flush >= self.config.checkpoint_seconds)
+        if due:
+            self.flush_catalogs()
+    # checkpoint_batch
+
+    ###########################################################################
+
+    def unmask(self, translated_texts):
+        """Maps translated templates back to the texts they were masked from, when masking."""
+        if self.masker is None:
+            return translated_texts
+        return self.masker.unmask_results(translated_texts)
+    # unmask
+
+    ###########################################################################
+
+    def flush_catalogs(self):
+        """Saves the catalogs changed since the last flush."""
+        with self.lock:
+            for path in sorted(self.dirty):
+                save_atomically(self.catalogs[path])
+            logging.info("Checkpoint: flushed %i catalogs", len(self.dirty))
+            self.dirty.clear()
+            self.batches_since_flush = 0
+            self.last_flush = time.monotonic()
+    # flush_catalogs
+
+    ###########################################################################
+
+    def map_files(self, function, items):
+        """Applies `function` to every item, up to --jobs at a time, keeping their order."""
+        if self.config.jobs <= 1 or len(items) <= 1:
+            return [function(item) for item in items]
+        with ThreadPoolExecutor(max_workers=self.config.jobs) as executor:
+            return list(executor.map(function, items))
+    # map_files
+
+    ###########################################################################    
+
+    def load_catalog(self, path):
+        """
+        Parses one catalog and, with --fuzzy, clears its fuzzy flags in the
+        same pass. Returns its summary and the parsed catalog, or None when it
+        is skipped or cannot be read.
+        """
+        summary = {"file": path, "language": None, "status": "skipped", "pending": 0, "translated": 0,
+                   "fuzzy_cleared": 0, "seconds": 0.0}
+        start = time.perf_counter()
+        po_file = None
         try:            
-            po_file = polib.pofile(self.config.file)
-            file_lang = po_file.metadata.get('Language', '')
+            # Skip the catalogs of other languages before parsing them in full
+            metadata = read_header(path)
+            if metadata is None:
+                po_file = polib.pofile(path)
+                metadata = po_file.metadata
+            file_lang = metadata.get('Language', '')
+            summary["language"] = file_lang[:2]
             
-            if file_lang[:2] != self.config.dstlang:
-                logging.warning("Skipping .po file due to inferred language mismatch: %s", self.config.file)
-                return
-
-            texts_to_translate = [
-                entry.msgid
-                for entry in po_file
-                if not entry.msgstr and entry.msgid and 'fuzzy' not in entry.flags
-            ]
-            
-            translated_texts = self.process_translations(texts_to_translate)
+            if file_lang[:2] not in self.config.dstlangs:
+                logging.warning("Skipping .po file due to inferred language mismatch: %s", path)
+                po_file = None
+            elif po_file is None:
+                po_file = polib.pofile(path)
+            if po_file is not None and self.config.fuzzy:
+                summary["fuzzy_cleared"] = self.disable_fuzzy_translations(po_file)
+        except Exception as e:  # pylint: disable=W0718
+            summary["status"] = "error"
+            logging.error("Error processing file %s: %s", path, e)    
+        summary["seconds"] = time.perf_counter() - start
+        return summary, po_file
+    # load_catalog
+
+    ###########################################################################
+
+    def save_catalog(self, catalog):
+        """
+        Saves one translated catalog, unless none of its entries changed, so
+        its modification time stays as it was. Returns its summary and the catalog.
+        """
+        summary, po_file = catalog
+        if po_file is None:
+            return catalog
+        start = time.perf_counter()
+        try:
+            if summary["translated"] or summary["fuzzy_cleared"]:
+                save_atomically(po_file)
+                logging.info("Finished processing .po file: %s", summary["file"])
+            else:
+                logging.info("Nothing changed in .po file, not saving it: %s", summary["file"])
+            summary["status"] = "done"
+        except Exception as e:  # pylint: disable=W0718
+            summary["status"] = "error"
+            logging.error("Error saving file %s: %s", summary["file"], e)
+        summary["seconds"] += time.perf_counter() - start
+        return catalog
+    # save_catalog
+
+    ###########################################################################
+
+    def seed_fuzzy_index(self, translations, language):
+        """Adds the {msgid: msgstr} translations of a catalog to the fuzzy index, masked like the texts sent."""
+        if self.config.mask_placeholders:
+            translations = mask_translations(translations)
+        self.service.fuzzy_index.add(translations, language)
+    # seed_fuzzy_index
+
+    ###########################################################################
+
+    def stream_catalog(self, path):
+        """
+        Translates one catalog without parsing it in full: its entries are
+        read one at a time, the pending ones sent in batches of --stream-batch
+        texts as they fill, and the entries are written out in order, to a
+        file renamed over the catalog at the end, as soon as the batch they
+        belong to is translated. At most --stream-inflight batches are held,
+        so memory is bounded by the batch size rather than the catalog size.
+        Texts are deduplicated and masked within a batch, not across the run.
+        Returns the summary of the catalog.
+        """
+        summary = {"file": path, "language": None, "status": "skipped", "pending": 0, "translated": 0,
+                   "fuzzy_cleared": 0, "seconds": 0.0}
+        start = time.perf_counter()
+        try:
+            metadata = read_header(path)
+            if metadata is None:
+                metadata = polib.pofile(path).metadata
+            language = metadata.get('Language', '')[:2]
+            summary["language"] = language
+
+            if language not in self.config.dstlangs:
+                logging.warning("Skipping .po file due to inferred language mismatch: %s", path)
+            else:
+                encoding = catalog_encoding(metadata)
+                with open(path, encoding=encoding) as source, AtomicFile(path, encoding) as output, \
+                        ThreadPoolExecutor(max_workers=self.config.stream_inflight) as executor:
+                    self.stream_entries(read_entries(source), language, output, executor, summary)
+                    if summary["translated"] or summary["fuzzy_cleared"]:
+                        with self.metrics.phase("save"):
+                            output.commit()
+                        logging.info("Finished processing .po file: %s", path)
+                    else:
+                        logging.info("Nothing changed in .po file, not saving it: %s", path)
+                summary["status"] = "done"
+        except Exception as e:  # pylint: disable=W0718
+            summary["status"] = "error"
+            logging.error("Error processing file %s: %s", path, e)
+        summary["seconds"] = time.perf_counter() - start
+        return summary
+    # stream_catalog
+
+    ###########################################################################
 
-            logging.info("Applying %i translations to %s", len(translated_texts), self.config.file)
-            self.apply_translations_to_po_file(translated_texts, po_file)
+    def stream_entries(self, blocks, language, output, executor, summary):
+        """
+        Streams the entries of a catalog to `output`, clearing their fuzzy
+        flags with --fuzzy and translating the pending ones in batches. The
+        batches are written in order as they complete, the oldest waited for
+        once more than --stream-inflight are in flight.
+        """
+        in_flight = deque()
+        batch = EntryBatch()
+        translations = {}
+        fuzzy_index = self.service.fuzzy_index
+        for block in blocks:
+            entry = parse_entry(block)
+            if self.config.fuzzy and "fuzzy" in entry["flags"]:
+                set_flags(block, entry, [flag for flag in entry["flags"] if flag != "fuzzy"])
+                summary["fuzzy_cleared"] += 1
+            if is_pending(entry) and (self.changed_msgids is None or entry["msgid"] in self.changed_msgids):
+                batch.add(block, entry)
+                summary["pending"] += 1
+            else:
+                batch.add(block)
+                if fuzzy_index is not None and entry["msgid"] and entry["msgstr"] and "fuzzy" not in entry["flags"] \
+                        and not entry["plural"] and not entry["obsolete"]:
+                    translations[entry["msgid"]] = entry["msgstr"]
+                    if len(translations) >= self.config.stream_batch:
+                        self.seed_fuzzy_index(translations, language)
+                        translations = {}
+
+            if batch.full(self.config.stream_batch):
+                self.send_batch(batch, language, executor, in_flight)
+                batch = EntryBatch()
+                while in_flight and (len(in_flight) > self.config.stream_inflight or in_flight[0].done()):
+                    self.write_batch(in_flight.popleft(), output, summary)
+
+        if translations:
+            self.seed_fuzzy_index(translations, language)
+        self.send_batch(batch, language, executor, in_flight)
+        while in_flight:
+            self.write_batch(in_flight.popleft(), output, summary)
+    # stream_entries
 
-            po_file.save()
+    ###########################################################################
+
+    def send_batch(self, batch, language, executor, in_flight):
+        """Sends the pending texts of a batch, if any, and queues it to be written."""
+        if batch.pending:
+            batch.future = executor.submit(self.translate_batch, list(batch.pending), language)
+        in_flight.append(batch)
+    # send_batch
 
-            logging.info("Finished processing .po file: %s", self.config.file)
+    ###########################################################################
+
+    def translate_batch(self, texts, dstlang):
+        """
+        Translates the texts of a streamed batch, as templates unless
+        --no-placeholder-masking is set. Returns the results, those of a
+        failed request left out.
+        """
+        masker = PlaceholderMasker() if self.config.mask_placeholders else None
+        groups = {(dstlang,): texts}
+        results = []
+        if masker is not None:
+            groups, results = masker.mask_groups(groups)
+        try:
+            for dstlangs, texts_to_translate in groups.items():
+                with self.metrics.phase("network"):
+                    translated = self.process_translations(texts_to_translate, list(dstlangs))
+                for translated_texts in translated.values():
+                    self.metrics.count("strings_translated", len(translated_texts))
+                    results += masker.unmask_results(translated_texts) if masker is not None else translated_texts
         except Exception as e:  # pylint: disable=W0718
-            logging.error("Error processing file %s: %s", self.config.file, e)    
-    # process_po_file
+            logging.error("Error translating %i texts into %s: %s", len(texts), dstlang, e)
+        if masker is not None:
+            self.metrics.count("placeholder_mismatches", masker.mangled)
+        return results
+    # translate_batch
+
+    ###########################################################################
+
+    def write_batch(self, batch, output, summary):
+        """Waits for the translations of a batch, applies them to its entries and writes them out."""
+        translated_texts = batch.future.result() if batch.future is not None else []
+        with self.metrics.phase("apply"):
+            for translation in translated_texts:
+                if not translation["msgstr"]:
+                    logging.warning("No original text found for index %s", translation["msgid"])
+                    continue
+                for block, entry in batch.pending.get(translation["msgid"], []):
+                    apply_translation(block, entry, translation["msgstr"], translation.get("fuzzy"))
+                    summary["translated"] += 1
+            for block in batch.blocks:
+                output.write("".join(block))
+    # write_batch
+
+    ###########################################################################
+
+    def log_savings(self, plan, unmasked_groups, groups):
+        """
+        Logs how many characters and requests the deduplication, the target
+        grouping and the placeholder masking saved, compared to sending the
+        pending texts of every catalog on their own. Characters are billed
+        once per target language.
+        """
+        catalog_texts = plan.catalog_texts()
+        baseline = sum(self.service.estimate_requests(texts) for texts in catalog_texts.values())
+        requests = sum(self.service.estimate_requests(texts, len(dstlangs)) for dstlangs, texts in groups.items())
+        saved_requests = baseline - requests
+        saved_chars = (sum(len(text) for texts in catalog_texts.values() for text in texts)
+                       - sum(len(text) * len(dstlangs) for dstlangs, texts in groups.items() for text in texts))
+        if self.masker is not None:
+            logging.info("Masked placeholders: %i unique texts reduced to %i templates, %i characters shorter",
+                         sum(len(texts) for texts in unmasked_groups.values()),
+                         sum(len(texts) for texts in groups.values()), self.masker.saved_chars())
+        logging.info("Planned %i unique texts for %i pending entries: saved %i characters and %i requests",
+                     sum(len(texts) for texts in groups.values()), plan.pending_entries, saved_chars, saved_requests)
+    # log_savings
+
+    ###########################################################################
+
+    def print_summary(self, summaries):
+        """Prints the per-file summary of the run."""
+        if not summaries:
+            return
+        width = max(len("file"), *(len(summary["file"]) for summary in summaries))
+        print(f"{'file':<{width}}  {'lang':<5}  {'status':<7}  {'pending':>8}  {'translated':>10}  {'seconds':>8}")
+        for summary in summaries:
+            print(f"{summary['file']:<{width}}  {summary['language'] or '':<5}  {summary['status']:<7}  "
+                  f"{summary['pending']:>8}  {summary['translated']:>10}  {summary['seconds']:>8.2f}")
+    # print_summary
+
+    ###########################################################################
+
+    def log_summary(self):
+        """Logs the run statistics."""
+        logging.info("Phases: %s", ", ".join(
+            f"{name} {seconds:.2f}s" for name, seconds in self.metrics.phases.items()
+        ))
+        latency = self.metrics.latency
+        if latency.count:
+            logging.info("Requests: %i, %i characters sent, latency p50 <= %ss, p95 <= %ss, mean %.3fs",
+                         self.metrics.counters["requests"], self.metrics.counters["chars_sent"],
+                         latency.quantile(0.5), latency.quantile(0.95), latency.sum / latency.count)
+        stats = self.service.connection_stats()
+        if stats is not None:
+            logging.info("HTTP: %i requests over %i connections (%i reused)",
+                         stats["requests"], stats["connections"], stats["reused"])
+        stats = self.service.limiter_stats()
+        if stats is not None:
+            logging.info("Rate limiter: %i throttled, %i retries, %i failed batches",
+                         stats["throttled"], stats["retries"], stats["failures"])
+        stats = self.service.token_stats()
+        if stats is not None and stats["requests"]:
+            logging.info("Tokens: %i prompt + %i completion over %i requests (%.0f per request)",
+                         stats["prompt_tokens"], stats["completion_tokens"], stats["requests"],
+                         (stats["prompt_tokens"] + stats["completion_tokens"]) / stats["requests"])
+        memory = self.service.memory
+        if memory is not None:
+            logging.info("Translation memory: %i hits, %i misses (%s)", memory.hits, memory.misses, memory.path)
+        controller = self.service.batch_size
+        if controller is not None:
+            stats = controller.stats()
+            logging.info("Adaptive batch size of %s: %i of at most %i, after %i increases and %i decreases",
+                         controller.name, stats["size"], stats["maximum"], stats["grown"], stats["shrunk"])
+        stats = self.service.routing_stats()
+        if stats is not None:
+            for backend, backend_stats in stats.items():
+                logging.info("Routing: %s took %i batches (%i texts, %.1f%% failed recently), latency p50 %ss, "
+                             "p95 %ss, %i of %i hedges won", backend, backend_stats["batches"], backend_stats["texts"],
+                             backend_stats["error_rate"] * 100, backend_stats["p50_seconds"],
+                             backend_stats["p95_seconds"], backend_stats["hedges_won"], backend_stats["hedges"])
+        fuzzy_index = self.service.fuzzy_index
+        if fuzzy_index is not None:
+            logging.info("Fuzzy index: %i of %i texts matched (%s)",
+                         fuzzy_index.matches, fuzzy_index.lookups, fuzzy_index.path)
+    # log_summary
 # GettextCloudTranslator
 
 ###############################################################################
 
-def main():
-    """Main function to parse arguments and initiate processing."""
+def find_catalogs(patterns):
+    """
+    Expands files, directories (searched recursively) and glob patterns into
+    the sorted list of .po files they match, without duplicates.
+    """
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _, names in os.walk(pattern):
+                files.extend(os.path.join(root, name) for name in names if name.endswith(".po"))
+        elif glob.has_magic(pattern):
+            files.extend(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+        else:
+            files.append(pattern)
+    return sorted(set(files))
+# find_catalogs
+
+###############################################################################
+
+def save_atomically(po_file):
+    """
+    Writes a catalog to a temporary file next to it, then renames it over
+    the original, so readers see the old or the new catalog, never a half
+    written one. The permissions of the original are kept.
+    """
+    with AtomicFile(po_file.fpath, po_file.encoding) as output:
+        output.write(str(po_file))
+        output.commit()
+# save_atomically
+
+###############################################################################
+
+def build_parser():
+    """Builds the command line argument parser."""
     parser = argparse.ArgumentParser(description="Scan and process .po files")
     parser.add_argument("--version", action="version", version=f'%(prog)s {__version__}')
     parser.add_argument("--backend", required=True, default="azure", choices=["chatgpt", "azure"])
     parser.add_argument("--apikey", help="Service API key")
+    parser.add_argument("--route", help="Comma separated backends to route batches to along with --backend, each batch going to the fastest healthy one. The API key of a backend is read from <BACKEND>_API_KEY, e.g. CHATGPT_API_KEY, when set")
+    parser.add_argument("--route-batch", default=250, type=int, help="Number of texts per routed batch, with --route. Defaults to 250")
+    parser.add_argument("--hedge", action="store_true", help="With --route, send a batch to a second backend too when the first has not answered within its p95 latency")
     parser.add_argument("--model", default="gpt-3.5-turbo-1106", help="OpenAI model to use for translations, for the ChatGPT backend.")
     parser.add_argument("--location", help="Microsoft Azure location")
-    parser.add_argument("--file", required=True, help="Input .po file")
+    parser.add_argument("--file", nargs="+", action="extend", help="Input .po files, directories or glob patterns such as 'locale/*/LC_MESSAGES/*.po'. Required unless --serve is set")
     parser.add_argument("--srclang", required=False, choices=["en", "es"], default="en", help="The ISO code for the language of the source strings. Defaults to 'en' (English)")
-    parser.add_argument("--dstlang", required=False, help="The ISO code for the language to translate to")
+    parser.add_argument("--dstlang", required=False, help="The ISO code for the language to translate to. Several comma separated codes translate the catalogs of each language in one pass")
     parser.add_argument("--fuzzy", action="store_true", help="Remove fuzzy entries")
     parser.add_argument("--bulk", action="store_true", help="Use bulk translation mode")
     parser.add_argument("--bulksize", default=49500, type=int, help="Batch size for bulk translation")        
+    parser.add_argument("--batch-elements", default=1000, type=int, help="Maximum number of texts per bulk request, for the Azure backend. Defaults to 1000")
+    parser.add_argument("--batch-bytes", type=int, help="Maximum size of a bulk request body, in bytes, for the Azure backend")
+    parser.add_argument("--max-request-tokens", type=int, help="Token budget of a request, prompt and expected output, for the ChatGPT backend. Defaults to the model's context window")
+    parser.add_argument("--max-output-tokens", type=int, help="Maximum expected output tokens of a request, for the ChatGPT backend. Defaults to the model's limit")
+    parser.add_argument("--tokenizer", default="estimate", choices=["estimate", "tiktoken"], help="How tokens are counted to size ChatGPT batches. 'tiktoken' requires the tiktoken package")
+    parser.add_argument("--no-placeholder-masking", action="store_true", help="Send texts verbatim instead of translating the texts that only differ by their placeholders, markup or numbers once, as a template")
+    parser.add_argument("--adaptive-batch", action="store_true", help="Adapt the size of bulk batches as the run goes: grow it while the latency per character improves, shrink it on timeouts, throttling or truncated replies, within --bulksize characters for Azure and --max-request-tokens for ChatGPT. Decisions are logged. Not applied with --async")
+    parser.add_argument("--sort-by-length", action="store_true", help="Pack bulk requests longest text first, to issue fewer requests")
+    parser.add_argument("--jobs", default=4, type=int, help="Number of catalogs processed in parallel. Defaults to 4")
+    parser.add_argument("--workers", default=4, type=int, help="Maximum number of concurrent requests. Defaults to 4")
+    parser.add_argument("--async", dest="async_io", action="store_true", help="Send the requests from one event loop instead of --workers threads")
+    parser.add_argument("--chars-per-minute", type=int, help="Maximum number of characters sent per minute. Unlimited by default")
+    parser.add_argument("--requests-per-second", type=float, help="Maximum number of requests sent per second. Unlimited by default")
+    parser.add_argument("--max-retries", default=5, type=int, help="Number of retries of a throttled or failed request. Defaults to 5")
+    parser.add_argument("--pool-size", type=int, help="Size of the HTTP connection pool. Defaults to --workers")
+    parser.add_argument("--no-keepalive", action="store_true", help="Close the HTTP connection after every request")
+    parser.add_argument("--connect-timeout", default=10.0, type=float, help="HTTP connect timeout, in seconds")
+    parser.add_argument("--read-timeout", default=60.0, type=float, help="HTTP read timeout, in seconds")
+    parser.add_argument("--endpoint", help="Service endpoint URL, when not the public one")
+    parser.add_argument("--incremental", help="State file with the hash of every catalog; catalogs unchanged since the last run are skipped without parsing")
+    parser.add_argument("--pot-diff", nargs=2, metavar=("OLD_POT", "NEW_POT"), help="Only translate the msgids new in NEW_POT compared to OLD_POT")
+    parser.add_argument("--metrics-json", help="Write the run metrics (phase timings, request latencies, retries...) to this JSON file")
+    parser.add_argument("--metrics-prometheus", help="Write the run metrics to this file in the Prometheus textfile format")
+    parser.add_argument("--profile", help="Profile the run with cProfile and write the pstats output to this file")
+    parser.add_argument("--check", action="store_true", help="Check the credentials with a request that is not billed before translating")
+    parser.add_argument("--serve", action="store_true", help="Run as a daemon keeping the backends warm for the daemon_client.py clients, instead of translating --file")
+    parser.add_argument("--socket", help="Unix socket the daemon listens on. Defaults to a local TCP port, see --port")
+    parser.add_argument("--port", default=8765, type=int, help="Local TCP port the daemon listens on. Defaults to 8765")
+    parser.add_argument("--token-file", default=DEFAULT_TOKEN_FILE, help=f"File the daemon writes the token its TCP clients must send to, readable by its owner only. Defaults to {DEFAULT_TOKEN_FILE}")
+    parser.add_argument("--cache-entries", default=100000, type=int, help="Number of recent translations the daemon keeps in memory. Defaults to 100000")
+    parser.add_argument("--stream", action="store_true", help="Stream each catalog entry by entry, sending its pending texts in batches as they fill and writing the entries out as they are translated, instead of loading whole catalogs. For catalogs too large to hold in memory")
+    parser.add_argument("--stream-batch", default=1000, type=int, help="Number of texts per batch with --stream. Defaults to 1000")
+    parser.add_argument("--stream-inflight", default=2, type=int, help="Number of batches in flight with --stream, which bounds the entries held in memory. Defaults to 2")
+    parser.add_argument("--checkpoint", help="Journal file recording completed batches, so an interrupted run can resume")
+    parser.add_argument("--checkpoint-batches", default=10, type=int, help="Flush the catalogs every this many batches. Defaults to 10")
+    parser.add_argument("--checkpoint-seconds", default=30.0, type=float, help="Flush the catalogs at least this often, in seconds. Defaults to 30")
+    parser.add_argument("--tm", default=os.getenv("GCT_TM_FILE", DEFAULT_TM_FILE), help=f"Translation memory file. Defaults to {DEFAULT_TM_FILE}")
+    parser.add_argument("--tm-readonly", action="store_true", help="Look translations up in the translation memory, but do not store new ones")
+    parser.add_argument("--tm-max-entries", default=1000000, type=int, help="Maximum number of entries kept in the translation memory")
+    parser.add_argument("--no-tm", action="store_true", help="Bypass the translation memory")
+    parser.add_argument("--fuzzy-tm", choices=["prefill", "context"], help="Match the pending texts against the strings translated before: 'prefill' applies close matches as fuzzy entries for review instead of translating them, 'context' passes them to the ChatGPT backend along with the texts")
+    parser.add_argument("--fuzzy-tm-file", default=os.getenv("GCT_FUZZY_FILE", DEFAULT_FUZZY_FILE), help=f"Fuzzy matching index file. Defaults to {DEFAULT_FUZZY_FILE}")
+    parser.add_argument("--fuzzy-threshold", default=0.75, type=float, help="Minimum similarity, from 0 to 1, of a fuzzy match. Defaults to 0.75")
+    return parser
+# build_parser
+
+###############################################################################
 
+def main():
+    """Main function to parse arguments and initiate processing."""
+    parser = build_parser()
     args = parser.parse_args()
     args.apikey = args.apikey if args.apikey else os.getenv("API_KEY")
 
-    translator = GettextCloudTranslator(TranslatorFactory().create_translator(args))
-    translator.translate()
+    if args.serve:
+        from daemon import serve  # pylint: disable=C0415
+        serve(args, parser, GettextCloudTranslator)
+        return
+    if not args.file:
+        parser.error("the following arguments are required: --file")
+    if args.stream and args.checkpoint:
+        parser.error("--checkpoint cannot be combined with --stream, which writes the catalogs as it goes")
+
+    service = TranslatorFactory().create_translator(args)
+    if args.check and not service.check():
+        sys.exit(1)
+    translator = GettextCloudTranslator(service)
+    profiler = None
+    if args.profile:
+        import cProfile  # pylint: disable=C0415
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        summaries = translator.translate()
+    finally:
+        service.close()
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            logging.info("Profile written to %s, read it with: python -m pstats %s", args.profile, args.profile)
+    pending = sum(summary["pending"] for summary in summaries)
+    if pending and not sum(summary["translated"] for summary in summaries):
+        logging.error("None of the %i pending entries could be translated", pending)
+        sys.exit(1)
 # main
 
 ###############################################################################
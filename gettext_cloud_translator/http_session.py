@@ -0,0 +1,79 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+###############################################################################
+
+class CountingAdapter(HTTPAdapter):
+    """
+    An HTTPAdapter that counts the requests it sends and the TCP connections
+    it opens for them, so connection reuse can be reported.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.requests = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+    # __init__
+
+    ###########################################################################
+
+    def count_connection(self):
+        with self.lock:
+            self.connections += 1
+    # count_connection
+
+    ###########################################################################
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        pool_classes = {}
+        for scheme, pool_class in self.poolmanager.pool_classes_by_scheme.items():
+            adapter = self
+
+            class CountingConnection(pool_class.ConnectionCls):
+                def connect(self):
+                    adapter.count_connection()
+                    super().connect()
+                # connect
+            # CountingConnection
+
+            pool_classes[scheme] = type(pool_class.__name__, (pool_class,), {"ConnectionCls": CountingConnection})
+        self.poolmanager.pool_classes_by_scheme = pool_classes
+    # init_poolmanager
+
+    ###########################################################################
+
+    def send(self, request, **kwargs):  # pylint: disable=W0221
+        with self.lock:
+            self.requests += 1
+        return super().send(request, **kwargs)
+    # send
+
+    ###########################################################################
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "connections": self.connections,
+                "reused": max(0, self.requests - self.connections)
+            }
+    # stats
+# CountingAdapter
+
+###############################################################################
+
+def create_session(pool_size):
+    """
+    Creates a requests session whose connection pool keeps up to `pool_size`
+    connections alive per host. Returns the session and its adapter.
+    """
+    session = requests.Session()
+    adapter = CountingAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session, adapter
+# create_session
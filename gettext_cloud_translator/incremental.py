@@ -0,0 +1,102 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import polib
+
+###############################################################################
+
+def file_digest(path):
+    """Returns the sha256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+# file_digest
+
+###############################################################################
+
+def pot_changes(old_path, new_path):
+    """
+    Compares two templates. Returns the set of msgids that are new in the
+    current one, or whose context or plural form changed.
+    """
+    def keys(path):
+        return {(entry.msgctxt, entry.msgid, entry.msgid_plural) for entry in polib.pofile(path) if entry.msgid}
+
+    return {msgid for _, msgid, _ in keys(new_path) - keys(old_path)}
+# pot_changes
+
+###############################################################################
+
+class CatalogState:
+    """
+    The content hash of every catalog as the last incremental run left it,
+    and how many of its entries were still pending then, in a JSON file.
+
+    A catalog whose hash did not change and that had nothing pending is
+    skipped without being parsed. The size and modification time are checked
+    first, so the hash is only computed for files that were touched.
+    """
+
+    def __init__(self, path) -> None:
+        self.path = path
+        self.catalogs = {}
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as handle:
+                    self.catalogs = json.load(handle)
+            except ValueError:
+                logging.warning("Ignoring the unreadable incremental state %s", path)
+    # __init__
+
+    ###########################################################################
+
+    def unchanged(self, path):
+        """Tells whether a catalog is as the last run left it, with nothing pending."""
+        record = self.catalogs.get(os.path.abspath(path))
+        if record is None or record["pending"]:
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if stat.st_size != record["size"]:
+            return False
+        if stat.st_mtime_ns == record["mtime_ns"]:
+            return True
+        if file_digest(path) != record["sha256"]:
+            return False
+        with self.lock:
+            record["mtime_ns"] = stat.st_mtime_ns
+        return True
+    # unchanged
+
+    ###########################################################################
+
+    def record(self, path, pending):
+        """Records the current content of a catalog and how many entries it still has pending."""
+        stat = os.stat(path)
+        with self.lock:
+            self.catalogs[os.path.abspath(path)] = {
+                "sha256": file_digest(path),
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "pending": pending
+            }
+    # record
+
+    ###########################################################################
+
+    def save(self):
+        """Writes the state aside and renames it over the previous one."""
+        with self.lock:
+            with open(f"{self.path}.tmp", "w", encoding="utf-8") as handle:
+                json.dump(self.catalogs, handle, indent=1, sort_keys=True)
+            os.replace(f"{self.path}.tmp", self.path)
+    # save
+# CatalogState
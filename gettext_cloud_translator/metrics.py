@@ -0,0 +1,216 @@
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+###############################################################################
+
+# Upper bounds, in seconds, of the request latency histogram buckets
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PHASES = ("parse", "plan", "network", "apply", "save")
+
+###############################################################################
+
+class Histogram:
+    """A thread-safe histogram with fixed bucket bounds, in the Prometheus sense."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+    # __init__
+
+    ###########################################################################
+
+    def observe(self, value):
+        with self.lock:
+            index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+    # observe
+
+    ###########################################################################
+
+    def quantile(self, q):
+        """Returns the upper bound of the bucket holding the `q` quantile, or None when empty."""
+        with self.lock:
+            if not self.count:
+                return None
+            rank = q * self.count
+            seen = 0
+            for bound, count in zip(self.buckets, self.counts):
+                seen += count
+                if seen >= rank:
+                    return bound
+            return float("inf")
+    # quantile
+
+    ###########################################################################
+
+    def to_dict(self):
+        with self.lock:
+            cumulative, buckets = 0, {}
+            for bound, count in zip(self.buckets, self.counts):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            buckets["+Inf"] = self.count
+            return {"count": self.count, "sum": round(self.sum, 6), "buckets": buckets}
+    # to_dict
+# Histogram
+
+###############################################################################
+
+class Metrics:
+    """
+    The instrumentation of one run: wall time per phase, request latencies,
+    characters sent, and, collected from the service at the end of the run,
+    tokens, translation memory hits, retries and connections.
+    """
+
+    def __init__(self) -> None:
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.latency = Histogram()
+        self.counters = {"requests": 0, "chars_sent": 0, "strings_translated": 0}
+        self.service = {}
+        self.lock = threading.Lock()
+    # __init__
+
+    ###########################################################################
+
+    @contextmanager
+    def phase(self, name):
+        """Adds the wall time of the block to the phase `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed
+    # phase
+
+    ###########################################################################
+
+    def observe_request(self, seconds, chars):
+        """Records one request: its latency and the characters it sent."""
+        self.latency.observe(seconds)
+        with self.lock:
+            self.counters["requests"] += 1
+            self.counters["chars_sent"] += chars
+    # observe_request
+
+    ###########################################################################
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+    # count
+
+    ###########################################################################
+
+    def collect(self, service):
+        """
+        Collects the statistics the service keeps: tokens, memory hits, fuzzy
+        matches, retries, connections, the adaptive batch size and, when
+        routing, per-backend batches.
+        """
+        stats = {
+            "tokens": service.token_stats(),
+            "rate_limiter": service.limiter_stats(),
+            "http": service.connection_stats(),
+            "routing": service.routing_stats(),
+        }
+        if service.memory is not None:
+            stats["translation_memory"] = {"hits": service.memory.hits, "misses": service.memory.misses}
+        if service.batch_size is not None:
+            stats["batch_size"] = service.batch_size.stats()
+        if service.fuzzy_index is not None:
+            stats["fuzzy_index"] = {"lookups": service.fuzzy_index.lookups, "matches": service.fuzzy_index.matches}
+        self.service = {name: value for name, value in stats.items() if value is not None}
+    # collect
+
+    ###########################################################################
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "phases": {name: round(seconds, 6) for name, seconds in self.phases.items()},
+                "requests": {"latency_seconds": self.latency.to_dict(), **self.counters},
+                **self.service,
+            }
+    # to_dict
+
+    ###########################################################################
+
+    def to_prometheus(self):
+        """Returns the metrics in the Prometheus text exposition format."""
+        metrics = self.to_dict()
+        lines = [
+            "# HELP gct_phase_seconds Wall time spent in each phase of the run.",
+            "# TYPE gct_phase_seconds gauge",
+        ]
+        lines += [f'gct_phase_seconds{{phase="{name}"}} {seconds}' for name, seconds in metrics["phases"].items()]
+
+        latency = metrics["requests"]["latency_seconds"]
+        lines += ["# HELP gct_request_seconds Latency of the requests sent.", "# TYPE gct_request_seconds histogram"]
+        lines += [f'gct_request_seconds_bucket{{le="{bound}"}} {count}' for bound, count in latency["buckets"].items()]
+        lines += [f"gct_request_seconds_sum {latency['sum']}", f"gct_request_seconds_count {latency['count']}"]
+
+        counters = {
+            "gct_chars_sent_total": metrics["requests"]["chars_sent"],
+            "gct_strings_translated_total": metrics["requests"]["strings_translated"],
+        }
+        if "placeholder_mismatches" in metrics["requests"]:
+            counters["gct_placeholder_mismatches_total"] = metrics["requests"]["placeholder_mismatches"]
+        if "rate_limiter" in metrics:
+            counters["gct_retries_total"] = metrics["rate_limiter"]["retries"]
+            counters["gct_throttled_total"] = metrics["rate_limiter"]["throttled"]
+            counters["gct_failed_batches_total"] = metrics["rate_limiter"]["failures"]
+        if "http" in metrics:
+            counters["gct_http_connections_total"] = metrics["http"]["connections"]
+        for name, value in counters.items():
+            lines += [f"# TYPE {name} counter", f"{name} {value}"]
+        if "tokens" in metrics:
+            lines.append("# TYPE gct_tokens_total counter")
+            lines += [f'gct_tokens_total{{kind="{kind}"}} {metrics["tokens"][f"{kind}_tokens"]}'
+                      for kind in ("prompt", "completion")]
+        if "translation_memory" in metrics:
+            lines.append("# TYPE gct_tm_lookups_total counter")
+            lines += [f'gct_tm_lookups_total{{result="{result}"}} {count}'
+                      for result, count in (("hit", metrics["translation_memory"]["hits"]),
+                                            ("miss", metrics["translation_memory"]["misses"]))]
+        if "routing" in metrics:
+            for name, key in (("gct_route_batches_total", "batches"), ("gct_route_failed_texts_total", "failed"),
+                              ("gct_hedged_batches_total", "hedges")):
+                lines.append(f"# TYPE {name} counter")
+                lines += [f'{name}{{backend="{backend}"}} {stats[key]}'
+                          for backend, stats in metrics["routing"].items()]
+        if "fuzzy_index" in metrics:
+            lines.append("# TYPE gct_fuzzy_lookups_total counter")
+            fuzzy = metrics["fuzzy_index"]
+            lines += [f'gct_fuzzy_lookups_total{{result="{result}"}} {count}'
+                      for result, count in (("match", fuzzy["matches"]), ("miss", fuzzy["lookups"] - fuzzy["matches"]))]
+        return "\n".join(lines) + "\n"
+    # to_prometheus
+
+    ###########################################################################
+
+    def write(self, json_path=None, prometheus_path=None):
+        """
+        Writes the metrics as JSON and as a Prometheus textfile. Each file is
+        written aside and renamed, so a collector never reads half a file.
+        """
+        for path, content in ((json_path, lambda: json.dumps(self.to_dict(), indent=2) + "\n"),
+                              (prometheus_path, self.to_prometheus)):
+            if path:
+                with open(f"{path}.tmp", "w", encoding="utf-8") as handle:
+                    handle.write(content())
+                os.replace(f"{path}.tmp", path)
+    # write
+# Metrics
@@ -0,0 +1,153 @@
+import logging
+import re
+import threading
+
+###############################################################################
+
+# What is masked before sending a text, in order of precedence: printf
+# placeholders (%s, %5.2f, %(name)s, %1$s, %%, without the space flag, so
+# "100% of" is left alone), brace placeholders ({0}, {name}, {:.2f}, {}),
+# HTML tags with their attributes, character references, and numbers
+PLACEHOLDER = re.compile(
+    r"%(?:\(\w+\)|\d+\$)?[-+#0]*(?:\d+|\*)?(?:\.(?:\d+|\*))?(?:hh|h|ll|l|L|q|j|z|t)?[diouxXeEfFgGcrsa%]"
+    r"|\{[\w.\[\]]*(?:![rsa])?(?::[^{}]*)?\}"
+    r"|</?[A-Za-z][^<>]*>"
+    r"|&(?:[A-Za-z]+|#\d+|#x[0-9A-Fa-f]+);"
+    r"|\d+(?:[.,]\d+)*"
+)
+
+# The tokens placeholders are masked into, numbered in order of appearance
+TOKEN = re.compile(r"\{(\d+)\}")
+
+# A template with no letters left has nothing to translate
+LETTER = re.compile(r"[^\W\d_]")
+
+###############################################################################
+
+def mask(text):
+    """
+    Replaces the placeholders, markup and numbers of a text with {0}, {1}...
+    tokens. Returns the template and the list of the values masked.
+    """
+    values = []
+
+    def token(match):
+        values.append(match.group(0))
+        return f"{{{len(values) - 1}}}"
+
+    return PLACEHOLDER.sub(token, text), values
+# mask
+
+###############################################################################
+
+def unmask(template, values):
+    """
+    Restores the masked values in a translated template. Returns None when
+    the tokens did not survive the translation, each exactly once.
+    """
+    if sorted(int(index) for index in TOKEN.findall(template)) != list(range(len(values))):
+        return None
+    return TOKEN.sub(lambda match: values[int(match.group(1))], template)
+# unmask
+
+###############################################################################
+
+def mask_translations(translations):
+    """
+    Masks a {text: translation} dict of existing translations the way texts
+    are masked before being sent, so they can be matched against templates.
+    The tokens of a translation follow the values of its text; the pairs
+    whose values differ, such as a number spelled out, are left out.
+    """
+    templates = {}
+    for text, translation in translations.items():
+        template, values = mask(text)
+        translated_template, translated_values = mask(translation)
+        if sorted(values) != sorted(translated_values):
+            continue
+        unused = {}
+        for index, value in enumerate(values):
+            unused.setdefault(value, []).append(index)
+        tokens = [f"{{{unused[value].pop(0)}}}" for value in translated_values]
+        templates[template] = TOKEN.sub(lambda match, tokens=tokens: tokens[int(match.group(1))], translated_template)
+    return templates
+# mask_translations
+
+###############################################################################
+
+class PlaceholderMasker:
+    """
+    Reduces the texts of a run to their templates, so texts that only differ
+    by their placeholders, markup or numbers are translated once, and maps
+    the translated templates back to every text, checking that no token was
+    lost or duplicated on the way.
+    """
+
+    def __init__(self) -> None:
+        self.originals = {}
+        self.mangled = 0
+        self.lock = threading.Lock()
+    # __init__
+
+    ###########################################################################
+
+    def mask_groups(self, groups):
+        """
+        Masks the texts of {(dstlang, ...): [text, ...]} groups and regroups
+        the unique templates by the languages any of their texts needs.
+        Returns the groups of templates, and the results of the texts with
+        nothing to translate, which are kept as they are.
+        """
+        targets = {}
+        for dstlangs, texts in groups.items():
+            for text in texts:
+                template, values = mask(text)
+                self.originals.setdefault(template, {})[text] = values
+                targets.setdefault(template, set()).update(dstlangs)
+
+        masked = {}
+        verbatim = []
+        for template, dstlangs in targets.items():
+            if LETTER.search(TOKEN.sub("", template)):
+                masked.setdefault(tuple(sorted(dstlangs)), []).append(template)
+            else:
+                verbatim += [{"msgid": text, "msgstr": text, "dstlang": dstlang}
+                             for text in self.originals[template] for dstlang in sorted(dstlangs)]
+        return masked, verbatim
+    # mask_groups
+
+    ###########################################################################
+
+    def unmask_results(self, translated_texts):
+        """
+        Maps translated templates back to the texts they were masked from.
+        The translations that lost or duplicated a token are logged and left
+        out. The similar string a fuzzy match came from gets the values of
+        the text too, when it has the same tokens.
+        """
+        results = []
+        for translation in translated_texts:
+            originals = self.originals.get(translation["msgid"], {translation["msgid"]: []})
+            for text, values in originals.items():
+                msgstr = unmask(translation["msgstr"], values) if translation["msgstr"] else translation["msgstr"]
+                if msgstr is None:
+                    with self.lock:
+                        self.mangled += 1
+                    logging.warning("Dropping the %s translation of %r, its placeholders did not survive: %r",
+                                    translation.get("dstlang"), text, translation["msgstr"])
+                    continue
+                result = {**translation, "msgid": text, "msgstr": msgstr}
+                if translation.get("fuzzy") is not None:
+                    result["fuzzy"] = unmask(translation["fuzzy"], values) or translation["fuzzy"]
+                results.append(result)
+        return results
+    # unmask_results
+
+    ###########################################################################
+
+    def saved_chars(self):
+        """Returns how many characters fewer the templates are than the texts they were masked from."""
+        return (sum(len(text) for originals in self.originals.values() for text in originals)
+                - sum(len(template) for template in self.originals))
+    # saved_chars
+# PlaceholderMasker
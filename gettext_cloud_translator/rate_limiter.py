@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+
+###############################################################################
+
+class RetryableError(Exception):
+    """A request failed in a way that is worth retrying, e.g. a timeout or a 5xx."""
+
+    def __init__(self, message, retry_after=None) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+    # __init__
+# RetryableError
+
+###############################################################################
+
+class ThrottledError(RetryableError):
+    """The service rejected the request because the quota was exceeded (HTTP 429)."""
+# ThrottledError
+
+###############################################################################
+
+def parse_retry_after(value):
+    """Parses a Retry-After header holding a number of seconds. Returns None when absent or invalid."""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+# parse_retry_after
+
+###############################################################################
+
+class TokenBucket:
+    """
+    A thread-safe token bucket refilled at `rate` tokens per second, holding at
+    most `capacity` tokens. Requests larger than the bucket go into debt, so
+    they are let through and the following ones wait for the refill.
+    """
+
+    def __init__(self, rate, capacity) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    # __init__
+
+    ###########################################################################
+
+    def reserve(self, tokens):
+        """Takes `tokens` from the bucket. Returns how long to wait before they are available."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+    # reserve
+
+    ###########################################################################
+
+    def acquire(self, tokens):
+        """Takes `tokens` from the bucket, sleeping until they are available. Returns the time waited."""
+        wait = self.reserve(tokens)
+        if wait:
+            time.sleep(wait)
+        return wait
+    # acquire
+# TokenBucket
+
+###############################################################################
+
+class RateLimiter:
+    """
+    Keeps a backend within its quota, in characters per minute and requests
+    per second, and retries failed requests with jittered exponential backoff,
+    honoring the Retry-After the service sends along with a 429. A throttled
+    request pauses every worker sharing the limiter, not just its own.
+    """
+
+    def __init__(self, chars_per_minute=None, requests_per_second=None, max_retries=5,
+                 backoff_base=1.0, backoff_max=60.0) -> None:
+        self.chars = TokenBucket(chars_per_minute / 60.0, chars_per_minute) if chars_per_minute else None
+        self.requests = TokenBucket(requests_per_second, requests_per_second) if requests_per_second else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.paused_until = 0.0
+        self.throttled = 0
+        self.retries = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+    # __init__
+
+    ###########################################################################
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.chars_per_minute, config.requests_per_second, config.max_retries)
+    # from_config
+
+    ###########################################################################
+
+    def acquire(self, chars):
+        """Waits until the shared pause is over and both buckets allow the request."""
+        while True:
+            with self.lock:
+                delay = self.paused_until - time.monotonic()
+            if delay <= 0:
+                break
+            time.sleep(delay)
+        if self.requests:
+            self.requests.acquire(1)
+        if self.chars:
+            self.chars.acquire(chars)
+    # acquire
+
+    ###########################################################################
+
+    def backoff(self, attempt, retry_after=None):
+        """Returns how long to wait before the given retry attempt."""
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.backoff_base)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+    # backoff
+
+    ###########################################################################
+
+    def call(self, function, argument, chars=0, description="request"):
+        """
+        Calls `function(argument)` within the quota, retrying it on RetryableError.
+        Re-raises the last error once `max_retries` retries have failed.
+        """
+        attempt = 0
+        while True:
+            self.acquire(chars)
+            try:
+                return function(argument)
+            except RetryableError as e:
+                if attempt >= self.max_retries:
+                    with self.lock:
+                        self.failures += 1
+                    raise
+                delay = self.backoff(attempt, e.retry_after)
+                with self.lock:
+                    self.retries += 1
+                    if isinstance(e, ThrottledError):
+                        self.throttled += 1
+                        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                logging.warning("%s failed (%s), retrying in %.1fs (%i/%i)",
+                                description, e, delay, attempt + 1, self.max_retries)
+                time.sleep(delay)
+                attempt += 1
+    # call
+
+    ###########################################################################
+
+    async def acquire_async(self, chars):
+        """acquire() for coroutines: waits without blocking the event loop."""
+        while True:
+            with self.lock:
+                delay = self.paused_until - time.monotonic()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        # Both reservations start now, so the longer one covers the other
+        wait = max(self.requests.reserve(1) if self.requests else 0.0,
+                   self.chars.reserve(chars) if self.chars else 0.0)
+        if wait:
+            await asyncio.sleep(wait)
+    # acquire_async
+
+    ###########################################################################
+
+    async def call_async(self, function, argument, chars=0, description="request"):
+        """call() for coroutine functions: awaits `function(argument)` with the same quota and retries."""
+        attempt = 0
+        while True:
+            await self.acquire_async(chars)
+            try:
+                return await function(argument)
+            except RetryableError as e:
+                if attempt >= self.max_retries:
+                    with self.lock:
+                        self.failures += 1
+                    raise
+                delay = self.backoff(attempt, e.retry_after)
+                with self.lock:
+                    self.retries += 1
+                    if isinstance(e, ThrottledError):
+                        self.throttled += 1
+                        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                logging.warning("%s failed (%s), retrying in %.1fs (%i/%i)",
+                                description, e, delay, attempt + 1, self.max_retries)
+                await asyncio.sleep(delay)
+                attempt += 1
+    # call_async
+
+    ###########################################################################
+
+    def stats(self):
+        with self.lock:
+            return {"throttled": self.throttled, "retries": self.retries, "failures": self.failures}
+    # stats
+# RateLimiter
@@ -0,0 +1,202 @@
+"""
+Local stand-in for the Azure Translator /translate endpoint and the OpenAI
+chat completions and models endpoints, used by the tests and the benchmarks
+to run the CLI end to end without a cloud account.
+
+Every text is "translated" by upper-casing it. The server can add latency
+and jitter to every request, answer some of them with a 429, and reject
+requests over the Azure payload limits, like the real services do.
+
+Run it on its own with:
+    python gettext_cloud_translator/tests/mock_server.py --port 8080 --latency 0.05
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Limits of an Azure /translate request
+AZURE_MAX_ELEMENTS = 1000
+AZURE_MAX_CHARS = 50000
+
+
+class MockTranslatorHandler(BaseHTTPRequestHandler):
+    """
+    Answers Azure /translate and OpenAI /chat/completions and /models requests.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):  # pylint: disable=C0116
+        raw = self.rfile.read(int(self.headers["Content-Length"]))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.bytes_received += len(raw)
+            throttle = server.should_throttle()
+        time.sleep(server.delay())
+
+        if throttle:
+            self.reply(429, {"error": {"code": 429001, "message": "Too many requests"}}, {"Retry-After": "0"})
+            return
+        if server.max_bytes and len(raw) > server.max_bytes:
+            self.reject(413, "The request body is too large")
+            return
+
+        path = urlparse(self.path).path
+        if path.endswith("/translate"):
+            self.translate(json.loads(raw))
+        elif path.endswith("/chat/completions"):
+            self.complete(json.loads(raw))
+        else:
+            self.reject(404, f"Unknown endpoint {path}")
+
+    def do_GET(self):  # pylint: disable=C0116
+        path = urlparse(self.path).path
+        if "/models/" in path:
+            self.reply(200, {"id": path.rsplit("/", 1)[-1], "object": "model", "owned_by": "mock"})
+        else:
+            self.reject(404, f"Unknown endpoint {path}")
+
+    def translate(self, body):
+        """Answers an Azure /translate request."""
+        server = self.server
+        targets = parse_qs(urlparse(self.path).query).get("to", [])
+        chars = sum(len(item["text"]) for item in body) * max(1, len(targets))
+        if len(body) > server.max_elements or chars > server.max_chars:
+            self.reject(400, f"{len(body)} elements, {chars} characters over the request limits")
+            return
+        with server.lock:
+            server.texts += len(body)
+        self.reply(200, [
+            {"translations": [{"text": item["text"].upper(), "to": target} for target in targets]}
+            for item in body
+        ])
+
+    def complete(self, body):
+        """Answers an OpenAI chat completion, as JSON when the request asks for it."""
+        prompt = body["messages"][-1]["content"]
+        if body.get("response_format", {}).get("type") == "json_object":
+            texts = json.loads(prompt)
+            content = json.dumps({index: text.upper() for index, text in texts.items()}, ensure_ascii=False)
+        else:
+            texts = {"0": prompt.split(": ", 1)[-1]}
+            content = texts["0"].upper()
+        with self.server.lock:
+            self.server.texts += len(texts)
+        prompt_tokens = sum(len(message["content"]) for message in body["messages"]) // 4 + 1
+        self.reply(200, {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(content) // 4 + 1,
+                "total_tokens": prompt_tokens + len(content) // 4 + 1
+            }
+        })
+
+    def reject(self, status, message):
+        """Answers with an error the client must not retry."""
+        with self.server.lock:
+            self.server.rejected += 1
+        self.reply(status, {"error": {"code": status, "message": message}})
+
+    def reply(self, status, document, headers=None):
+        """Sends a JSON response."""
+        payload = json.dumps(document).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):  # pylint: disable=W0622
+        pass
+
+
+class MockServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server running MockTranslatorHandler in the background.
+
+    Every request waits `latency` seconds plus up to `jitter` more. One in
+    `throttle_every` requests, if set, is answered with a 429, and requests
+    over `max_elements` texts, `max_chars` characters or `max_bytes` bytes
+    are rejected.
+    """
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, jitter=0.0, throttle_every=0, max_elements=AZURE_MAX_ELEMENTS,
+                 max_chars=AZURE_MAX_CHARS, max_bytes=None, port=0, seed=0) -> None:
+        super().__init__(("127.0.0.1", port), MockTranslatorHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_every = throttle_every
+        self.max_elements = max_elements
+        self.max_chars = max_chars
+        self.max_bytes = max_bytes
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.texts = 0
+        self.bytes_received = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def should_throttle(self):
+        """Tells whether the current request is answered with a 429. Called with the lock held."""
+        if self.throttle_every and self.requests % self.throttle_every == 0:
+            self.throttled += 1
+            return True
+        return False
+
+    def delay(self):
+        """Returns how long the current request waits before it is answered."""
+        with self.lock:
+            return self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    """Runs the mock server in the foreground."""
+    parser = argparse.ArgumentParser(description="Local stand-in for the Azure and OpenAI translation endpoints")
+    parser.add_argument("--port", default=8080, type=int)
+    parser.add_argument("--latency", default=0.0, type=float, help="Seconds every request waits")
+    parser.add_argument("--jitter", default=0.0, type=float, help="Maximum random extra wait, in seconds")
+    parser.add_argument("--throttle-every", default=0, type=int, help="Answer one in this many requests with a 429")
+    parser.add_argument("--max-bytes", type=int, help="Reject request bodies larger than this")
+    args = parser.parse_args()
+    server = MockServer(args.latency, args.jitter, args.throttle_every, max_bytes=args.max_bytes, port=args.port)
+    print(f"Listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+This module contains unit tests for the asynchronous services and their scheduler.
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+from async_service import AsyncTranslatorService, BatchScheduler, SyncTranslatorAdapter
+from config_azure import AzureConfiguration
+from config_chatgpt import ChatGptConfiguration
+from gettext_cloud_translator.gettext_cloud_translator import build_parser
+from translator_azure import AsyncTranslatorAzure
+from translator_chatgpt import AsyncTranslatorChatGPT
+
+
+class SlowUpperService(AsyncTranslatorService):
+    """
+    Service upper-casing texts after a short sleep and tracking, in `flight`,
+    the batches in flight across every service sharing it.
+    """
+    def __init__(self, config, flight=None) -> None:  # pylint: disable=W0231
+        self.config = config
+        self.flight = flight or SimpleNamespace(current=0, peak=0)
+
+    async def translate_batch(self, texts, dstlang=None):
+        self.flight.current += 1
+        self.flight.peak = max(self.flight.peak, self.flight.current)
+        await asyncio.sleep(0.001)
+        self.flight.current -= 1
+        return [{"msgid": text, "msgstr": text.upper(), "dstlang": dstlang} for text in texts]
+
+
+def make_config(**overrides):
+    """
+    Returns the configuration attributes the async services read, with test defaults.
+    """
+    config = {"bulk": True, "bulksize": 2, "workers": 4, "dstlang": "es"}
+    config.update(overrides)
+    return SimpleNamespace(**config)
+
+
+def test_scheduler_bounds_batches_across_files():
+    """
+    Test that thousands of batches from several services share one bound and keep their order.
+    """
+    flight = SimpleNamespace(current=0, peak=0)
+    services = [SlowUpperService(make_config(), flight) for _ in range(3)]
+    scheduler = BatchScheduler(50)
+    texts = [f"text {i}" for i in range(1000)]
+
+    async def translate_all():
+        return await asyncio.gather(*(service.translate(texts, "es", scheduler=scheduler) for service in services))
+
+    results = asyncio.run(translate_all())
+
+    assert scheduler.completed == 1500
+    assert scheduler.peak == flight.peak == 50
+    assert [result["msgstr"] for result in results[0]] == [text.upper() for text in texts]
+
+
+def test_sync_adapter():
+    """
+    Test that the adapter serves the synchronous interface and forwards on_batch.
+    """
+    adapter = SyncTranslatorAdapter(SlowUpperService(make_config()))
+    batches = []
+    adapter.on_batch = batches.append
+
+    assert adapter.translate_in_bulk(["a", "b", "c"]) == [
+        {"msgid": text, "msgstr": text.upper(), "dstlang": "es"} for text in "abc"
+    ]
+    assert len(batches) == 2
+    assert adapter.translate_multi(["a"], ["es", "fr"]) == {
+        "es": [{"msgid": "a", "msgstr": "A", "dstlang": "es"}],
+        "fr": [{"msgid": "a", "msgstr": "A", "dstlang": "fr"}],
+    }
+    assert adapter.estimate_requests(["a", "b", "c"], targets=2) == 4
+    adapter.close()
+
+
+def test_async_chatgpt_re_requests_missing_indices():
+    """
+    Test the async ChatGPT batch, whose first reply misses an index.
+    """
+    args = build_parser().parse_args([
+        "--backend", "chatgpt", "--apikey", "key", "--file", "django.po", "--dstlang", "es", "--no-tm", "--bulk"
+    ])
+    translator = AsyncTranslatorChatGPT(ChatGptConfiguration(args))
+    payloads = []
+
+    async def create(model, messages, **kwargs):  # pylint: disable=W0613
+        payload = json.loads(messages[-1]["content"])
+        payloads.append(payload)
+        reply = {index: text.upper() for index, text in payload.items() if len(payloads) > 1 or index != "1"}
+        response = MagicMock()
+        response.choices[0].message.content = json.dumps(reply)
+        return response
+
+    translator.client = MagicMock()
+    translator.client.chat.completions.create = AsyncMock(side_effect=create)
+
+    translated_texts = asyncio.run(translator.translate(["a", "b", "c"]))
+
+    assert payloads == [{"0": "a", "1": "b", "2": "c"}, {"1": "b"}]
+    assert translated_texts == [{"msgid": text, "msgstr": text.upper(), "dstlang": "es"} for text in "abc"]
+
+
+class StubAsyncClient:
+    """
+    Stand-in for the httpx.AsyncClient of the async Azure backend, answering
+    like the Translator API with "<dstlang>:<TEXT>" and recording the target
+    languages of every request.
+    """
+    def __init__(self) -> None:
+        self.targets = []
+
+    async def post(self, url, params=None, headers=None, json=None):  # pylint: disable=W0613,W0621
+        self.targets.append(params["to"])
+        await asyncio.sleep(0)
+        translations = [{"translations": [{"text": f"{dstlang}:{item['text'].upper()}", "to": dstlang}
+                                          for dstlang in params["to"]]} for item in json]
+        return SimpleNamespace(status_code=200, headers={}, json=lambda: translations, raise_for_status=lambda: None)
+
+    async def aclose(self):
+        pass
+
+
+def make_async_azure(*extra):
+    """
+    Returns the async Azure backend, adapted to the synchronous interface, on a stub HTTP client.
+    """
+    args = build_parser().parse_args([
+        "--backend", "azure", "--apikey", "key", "--location", "westus", "--file", "django.po",
+        "--dstlang", "es", "--no-tm", "--bulk", *extra
+    ])
+    service = AsyncTranslatorAzure(AzureConfiguration(args))
+    service.client = StubAsyncClient()
+    return SyncTranslatorAdapter(service), service.client
+
+
+def test_async_azure_bulk():
+    """
+    Test the async Azure backend in bulk, packing the texts within --batch-elements.
+    """
+    adapter, client = make_async_azure("--batch-elements", "2")
+    translated_texts = adapter.translate_in_bulk(["a", "b", "c"])
+    adapter.close()
+
+    assert [translation["msgstr"] for translation in translated_texts] == ["es:A", "es:B", "es:C"]
+    assert client.targets == [["es"], ["es"]]
+
+
+def test_async_azure_combines_targets():
+    """
+    Test that the async Azure backend sends every text once with all its target languages.
+    """
+    adapter, client = make_async_azure()
+    assert adapter.estimate_requests(["a", "b", "c"], targets=3) == 1
+    results = adapter.translate_multi(["a", "b", "c"], ["es", "fr", "de"])
+    adapter.close()
+
+    assert client.targets == [["es", "fr", "de"]]
+    assert {dstlang: [translation["msgstr"] for translation in translations]
+            for dstlang, translations in results.items()} == {
+        dstlang: [f"{dstlang}:{text}" for text in "ABC"] for dstlang in ("es", "fr", "de")
+    }
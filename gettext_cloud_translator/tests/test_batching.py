@@ -0,0 +1,145 @@
+"""
+This module contains property-based tests for the batch planner.
+"""
+
+from hypothesis import example, given
+from hypothesis import strategies as st
+from requests.models import PreparedRequest
+from requests.structures import CaseInsensitiveDict
+
+from batching import BatchFeed, BatchSizeController, join_fragments, pack_batches, split_text
+from test_gettext_cloud_translator import StubService, make_config
+
+texts_strategy = st.lists(st.text(max_size=300), max_size=200)
+limits_strategy = st.tuples(
+    st.integers(min_value=1, max_value=2000),
+    st.integers(min_value=1, max_value=50),
+    st.one_of(st.none(), st.integers(min_value=10, max_value=5000)),
+    st.booleans(),
+    st.integers(min_value=1, max_value=4),
+)
+
+
+def request_body(texts):
+    """
+    Returns the body requests sends for a batch of texts.
+    """
+    request = PreparedRequest()
+    request.headers = CaseInsensitiveDict()
+    request.prepare_body(data=None, files=None, json=[{"text": text} for text in texts])
+    return request.body
+
+
+@given(texts_strategy, limits_strategy)
+@example(["x" * 10] * 200, (10 ** 6, 1000, 2000, False, 1))
+def test_every_text_is_sent_once_within_limits(texts, limits):
+    """
+    Test that batches cover every text exactly once and respect every limit,
+    except for a text that alone exceeds it.
+    """
+    max_chars, max_elements, max_bytes, sort_by_length, targets = limits
+    batches = pack_batches(texts, max_chars, max_elements, max_bytes, sort_by_length, targets)
+
+    assert sorted(index for batch in batches for index in batch) == list(range(len(texts)))
+    for batch in batches:
+        assert batch
+        assert len(batch) <= max_elements
+        if len(batch) > 1:
+            assert sum(len(texts[index]) * targets for index in batch) <= max_chars
+            if max_bytes:
+                assert len(request_body([texts[index] for index in batch])) <= max_bytes
+
+
+@given(texts_strategy, st.integers(min_value=1, max_value=2000), st.integers(min_value=1, max_value=50))
+def test_unsorted_packing_keeps_order(texts, max_chars, max_elements):
+    """
+    Test that without sorting the batches are consecutive runs of texts.
+    """
+    batches = pack_batches(texts, max_chars, max_elements)
+
+    assert [index for batch in batches for index in batch] == list(range(len(texts)))
+
+
+@given(st.text(max_size=2000), st.integers(min_value=1, max_value=300))
+def test_split_text_round_trip(text, max_chars):
+    """
+    Test that fragments fit the limit and join back into the text.
+    """
+    fragments = split_text(text, max_chars)
+
+    assert "".join(fragments) == text
+    assert all(len(fragment) <= max_chars for fragment in fragments)
+    assert join_fragments(fragments, fragments) == text
+
+
+def test_split_text_prefers_sentence_boundaries():
+    """
+    Test that a long text is cut after a sentence rather than inside a word.
+    """
+    assert split_text("One two. Three four five.", 12) == ["One two. ", "Three four ", "five."]
+
+
+def test_controller_grows_while_latency_holds_and_backs_off():
+    """
+    Test that the batch size grows by a step while the latency per character holds, and backs off when it rises.
+    """
+    controller = BatchSizeController("test", 1600)
+    assert (controller.limit(), controller.step, controller.minimum) == (400, 100, 25)
+
+    for _ in range(6):
+        controller.record(1.0, 1000)
+    assert controller.limit() == 600
+
+    for _ in range(3):
+        controller.record(2.0, 1000)
+    assert controller.limit() == 500
+    # Not grown back to the size that was slower for a while
+    for _ in range(9):
+        controller.record(1.0, 1000)
+    assert controller.limit() == 500
+    assert controller.stats() == {"size": 500, "maximum": 1600, "grown": 2, "shrunk": 0}
+
+
+def test_controller_shrinks_on_failure():
+    """
+    Test that a failed batch halves the size, once for the batches packed at the same size, and never below the floor.
+    """
+    controller = BatchSizeController("test", 1600)
+    controller.local.limit = controller.limit()
+    controller.shrink("timeout")
+    controller.shrink("timeout")
+    assert controller.limit() == 200
+    # The result of a batch packed at an older size is ignored
+    for _ in range(3):
+        controller.record(1.0, 1000)
+    assert controller.limit() == 200
+
+    controller.local.limit = None
+    for _ in range(10):
+        controller.shrink("throttled")
+    assert controller.limit() == 25 and controller.stats()["shrunk"] == 11
+
+
+def test_feed_packs_batches_at_the_current_limit():
+    """
+    Test that batches taken from a feed are packed at the limit of that moment, and their results come back in order.
+    """
+    controller = BatchSizeController("test", 16)
+    service = StubService(make_config(workers=1))
+    texts = [f"text {chr(97 + index)}" for index in range(20)]
+    feed = BatchFeed(texts, lambda window, limit: window[:limit], 10, controller)
+
+    sizes = []
+
+    def send(batch):
+        sizes.append(len(batch))
+        if len(sizes) == 2:
+            raise ConnectionError("timeout")
+        return [text.upper() for text in batch]
+
+    results = service.run_batches(send, feed)
+
+    # Halved after the failed batch, which is left out of the results
+    assert sizes[:3] == [4, 4, 2] and max(sizes) == 4
+    assert results == [text.upper() for text in texts[:4] + texts[8:]]
+
@@ -0,0 +1,70 @@
+"""
+This module contains unit tests for the header-only catalog reader.
+"""
+
+import codecs
+
+import polib
+import pytest
+
+from catalog_header import read_header
+from gettext_cloud_translator.gettext_cloud_translator import GettextCloudTranslator
+from test_gettext_cloud_translator import StubService, make_config, write_catalog
+
+
+@pytest.mark.parametrize("content, expected", [
+    ('# Spanish\n#, fuzzy\nmsgid ""\nmsgstr ""\n"Language: es_MX\\n"\n"X-Note: a \\"b\\"\\n"\n'
+     '\nmsgid "Open"\nmsgstr ""\n',
+     {"Language": "es_MX", "X-Note": 'a "b"'}),
+    ('msgid ""\nmsgstr "Language: fr\\n"\n', {"Language": "fr"}),
+    ('msgid "Open"\nmsgstr ""\n', None),
+    ('msgctxt "menu"\nmsgid ""\nmsgstr "Language: fr\\n"\n', None),
+    ('msgid ""\n"Open"\nmsgstr ""\n', {}),
+    ('', {}),
+])
+def test_read_header(tmp_path, content, expected):
+    """
+    Test header reading, with comments, escapes, no header, a context and a multi-line first msgid.
+    """
+    path = tmp_path / "django.po"
+    path.write_text(content, encoding="utf-8")
+
+    assert read_header(str(path)) == expected
+
+
+def test_read_header_matches_polib(tmp_path):
+    """
+    Test that the header reader agrees with polib on a catalog polib wrote.
+    """
+    path = tmp_path / "django.po"
+    write_catalog(path, "pt_BR", ["Open"] * 3)
+
+    assert read_header(str(path)) == polib.pofile(str(path)).metadata
+
+
+def test_read_header_after_byte_order_mark(tmp_path):
+    """
+    Test that a UTF-8 byte order mark before the header does not hide it.
+    """
+    path = tmp_path / "django.po"
+    write_catalog(path, "es", ["Open"])
+    path.write_bytes(codecs.BOM_UTF8 + path.read_bytes())
+
+    assert read_header(str(path))["Language"] == "es"
+    assert read_header(str(path)) == polib.pofile(str(path)).metadata
+
+
+def test_mismatched_catalogs_are_not_parsed(tmp_path, monkeypatch):
+    """
+    Test that catalogs of other languages are skipped before the full parse.
+    """
+    write_catalog(tmp_path / "es.po", "es", ["Open"])
+    write_catalog(tmp_path / "fr.po", "fr", ["Open"])
+    parsed = []
+    pofile = polib.pofile
+    monkeypatch.setattr(polib, "pofile", lambda path, **kwargs: parsed.append(path) or pofile(path, **kwargs))
+
+    summaries = GettextCloudTranslator(StubService(make_config(files=[str(tmp_path)]))).translate()
+
+    assert parsed == [str(tmp_path / "es.po")]
+    assert [(summary["language"], summary["status"]) for summary in summaries] == [("es", "done"), ("fr", "skipped")]
@@ -0,0 +1,119 @@
+"""
+This module contains tests for the streaming mode, which translates catalogs entry by entry.
+"""
+
+import io
+import threading
+import time
+
+import polib
+
+from catalog_stream import apply_translation, is_pending, parse_entry, read_entries, set_flags
+from gettext_cloud_translator.gettext_cloud_translator import GettextCloudTranslator
+from test_gettext_cloud_translator import StubService, make_config
+
+
+class FlightStubService(StubService):
+    """
+    Stub service recording the peak number of batches translated at once.
+    """
+    def __init__(self, config) -> None:
+        super().__init__(config)
+        self.current = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def translate_multi(self, texts, dstlangs):
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+        time.sleep(0.01)
+        with self.lock:
+            self.current -= 1
+            return super().translate_multi(texts, dstlangs)
+
+
+def build_catalog():
+    """
+    Returns a catalog mixing pending, translated, fuzzy, plural and obsolete entries.
+    """
+    po_file = polib.POFile()
+    po_file.metadata = {"Language": "es", "Content-Type": "text/plain; charset=UTF-8"}
+    po_file.append(polib.POEntry(msgid="Open", msgstr="", occurrences=[("app.py", "1")]))
+    po_file.append(polib.POEntry(msgid="First line\nSecond \"line\"", msgstr=""))
+    po_file.append(polib.POEntry(msgid="Close", msgstr="Cerrar"))
+    po_file.append(polib.POEntry(msgid="Save", msgstr="", flags=["fuzzy", "python-format"]))
+    po_file.append(polib.POEntry(msgid="Open", msgctxt="menu", msgstr=""))
+    po_file.append(polib.POEntry(msgid="%d file", msgid_plural="%d files", msgstr_plural={0: "", 1: ""}))
+    po_file.append(polib.POEntry(msgid="Old", msgstr="Viejo", obsolete=True))
+    for index in range(6):
+        po_file.append(polib.POEntry(msgid=f"Item {chr(97 + index)}", msgstr=""))
+    return po_file
+
+
+def test_read_and_rewrite_entries():
+    """
+    Test that entries are split and parsed without losing a line, and that translations and flags are
+    rewritten in place.
+    """
+    text = str(build_catalog())
+    blocks = list(read_entries(io.StringIO(text)))
+    assert "".join(line for block in blocks for line in block) == text
+
+    entries = [parse_entry(block) for block in blocks]
+    assert [entry["msgid"] for entry in entries if is_pending(entry)] == [
+        "Open", "First line\nSecond \"line\"", "Open", *(f"Item {chr(97 + index)}" for index in range(6))
+    ]
+
+    block, entry = blocks[4], entries[4]
+    assert entry["flags"] == ["fuzzy", "python-format"]
+    set_flags(block, entry, ["python-format"])
+    apply_translation(block, entry, "Guardar\n\"ya\"", previous_msgid="Save all")
+    saved = polib.pofile("".join(block))[0]
+    assert (saved.msgstr, saved.flags, saved.previous_msgid) == (
+        "Guardar\n\"ya\"", ["python-format", "fuzzy"], "Save all"
+    )
+
+
+def test_stream_matches_full_run(tmp_path):
+    """
+    Test that a streamed run translates the catalog as a full run does, a few batches at a time.
+    """
+    results = {}
+    for stream in (False, True):
+        path = tmp_path / f"{stream}.po"
+        build_catalog().save(str(path))
+        service = FlightStubService(make_config(files=[str(path)], fuzzy=True, stream=stream,
+                                                stream_batch=2, stream_inflight=2))
+        summaries = GettextCloudTranslator(service).translate()
+        assert (summaries[0]["status"], summaries[0]["fuzzy_cleared"]) == ("done", 1)
+        results[stream] = [(entry.msgid, entry.msgctxt, entry.msgstr, entry.flags, entry.obsolete)
+                           for entry in polib.pofile(str(path))]
+        # Plural entries are left alone in both modes
+        assert summaries[0]["pending"] == 10
+        assert all("%d file" not in texts for texts, _ in service.calls)
+        if stream:
+            assert all(len(texts) <= 2 for texts, _ in service.calls)
+            assert service.peak <= 2
+
+    assert results[True] == results[False]
+
+
+def test_stream_keeps_unchanged_catalog(tmp_path):
+    """
+    Test that a streamed catalog with nothing to translate is left as it was.
+    """
+    path = tmp_path / "es.po"
+    po_file = polib.POFile()
+    po_file.metadata = {"Language": "es"}
+    po_file.append(polib.POEntry(msgid="Open", msgstr="Abrir"))
+    po_file.save(str(path))
+    content = path.read_bytes()
+
+    service = StubService(make_config(files=[str(path)], stream=True))
+    summaries = GettextCloudTranslator(service).translate()
+
+    assert summaries[0]["status"] == "done"
+    assert service.calls == []
+    assert path.read_bytes() == content
+    assert [child.name for child in tmp_path.iterdir()] == ["es.po"]
@@ -0,0 +1,91 @@
+"""
+This module contains tests for checkpointed, resumable runs.
+"""
+
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import polib
+
+from checkpoint import CheckpointJournal
+from mock_server import MockServer
+
+SCRIPT = os.path.join(os.path.dirname(__file__), "..", "gettext_cloud_translator.py")
+
+
+def write_catalog(path, msgids):
+    """
+    Writes a Spanish catalog with the given untranslated msgids.
+    """
+    po_file = polib.POFile()
+    po_file.metadata = {"Language": "es", "Content-Type": "text/plain; charset=UTF-8"}
+    for msgid in msgids:
+        po_file.append(polib.POEntry(msgid=msgid, msgstr=""))
+    po_file.save(str(path))
+
+
+def run_cli(server, catalog, journal, tmp_path):
+    """
+    Starts the CLI against the mock server, one text per request.
+    """
+    return subprocess.Popen([
+        sys.executable, SCRIPT, "--backend", "azure", "--apikey", "key", "--endpoint", server.url,
+        "--file", str(catalog), "--dstlang", "es", "--workers", "1", "--no-tm",
+        "--checkpoint", str(journal), "--checkpoint-batches", "5",
+    ], cwd=tmp_path, env=dict(os.environ, API_KEY="key"), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def test_journal_ignores_truncated_record(tmp_path):
+    """
+    Test that a half-written last line does not prevent resuming, nor lose the records appended after it.
+    """
+    path = str(tmp_path / "journal")
+    journal = CheckpointJournal(path, "en")
+    journal.append([{"msgid": "Open", "msgstr": "Abrir", "dstlang": "es"}])
+    journal.close()
+    with open(path, "a", encoding="utf-8") as handle:
+        handle.write('{"msgid": "Clo')
+
+    journal = CheckpointJournal(path, "en")
+    assert journal.load() == {"es": [{"msgid": "Open", "msgstr": "Abrir", "dstlang": "es"}]}
+
+    # The next record is not glued onto the half-written line
+    journal.append([{"msgid": "Save", "msgstr": "Guardar", "dstlang": "es"}])
+    journal.close()
+    assert CheckpointJournal(path, "en").load() == {"es": [
+        {"msgid": "Open", "msgstr": "Abrir", "dstlang": "es"}, {"msgid": "Save", "msgstr": "Guardar", "dstlang": "es"}
+    ]}
+
+
+def test_killed_run_resumes(tmp_path):
+    """
+    Test that a run killed mid-way resumes without translating completed work again.
+    """
+    catalog = tmp_path / "django.po"
+    journal = tmp_path / "django.journal"
+    # Distinct words, since texts differing only by a number are translated once
+    msgids = [f"text {chr(97 + i // 10)}{chr(97 + i % 10)}" for i in range(40)]
+    write_catalog(catalog, msgids)
+
+    with MockServer(latency=0.05) as server:
+        process = run_cli(server, catalog, journal, tmp_path)
+        deadline = time.monotonic() + 30
+        while server.requests < 15 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        process.send_signal(signal.SIGKILL)
+        process.wait()
+
+        flushed = [entry for entry in polib.pofile(str(catalog)) if entry.msgstr]
+        assert len(flushed) >= 10
+        completed = sum(len(translations) for translations in CheckpointJournal(str(journal), "en").load().values())
+        assert completed >= len(flushed)
+        first_run = server.requests
+
+        assert run_cli(server, catalog, journal, tmp_path).wait(timeout=60) == 0
+
+    assert server.requests - first_run == len(msgids) - completed
+    assert all(entry.msgstr == entry.msgid.upper() for entry in polib.pofile(str(catalog)))
+    assert not journal.exists()
@@ -1,148 +1,127 @@
 """
-This module contains unit tests for the Cloud Translator.
+This module contains end to end tests of the command line tool, run against
+the local mock server instead of the cloud services.
 """
 
-from unittest.mock import MagicMock
+import json
+import os
+import pstats
+import subprocess
+import sys
 
 import polib
 import pytest
 
-from gettext_cloud_translator.cloud_translator import TranslationConfig, TranslationService
+from mock_server import MockServer
 
+SCRIPT = os.path.join(os.path.dirname(__file__), "..", "gettext_cloud_translator.py")
 
-@pytest.fixture(name='mock_openai_client')
-def fixture_mock_openai_client():
+MSGIDS = [
+    "HR", "TENANT", "HEALTHCARE", "TRANSPORT", "SERVICES", "AGRO", "CONSTRUCTION", "ENTERTAINMENT", "MINING",
+    "ENERGY", "FINANCE", "HOSPITALITY", "IT", "MANUFACTURING", "EDUCATION", "REALESTATE", "OTHER",
+]
+
+
+def write_catalog(path, msgids):
+    """
+    Writes a Spanish catalog with the given untranslated msgids.
+    """
+    po_file = polib.POFile()
+    po_file.metadata = {"Language": "es", "Content-Type": "text/plain; charset=UTF-8"}
+    for msgid in msgids:
+        po_file.append(polib.POEntry(msgid=msgid.title(), msgstr=""))
+    po_file.save(str(path))
+
+
+def run_cli(server, catalog, *extra):
+    """
+    Runs the CLI on a catalog against the mock server and returns its exit code.
+    """
+    return subprocess.run([
+        sys.executable, SCRIPT, "--apikey", "key", "--endpoint", server.url, "--file", str(catalog),
+        "--dstlang", "es", "--no-tm", *extra
+    ], cwd=catalog.parent, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False).returncode
+
+
+@pytest.mark.parametrize("extra", [
+    ("--backend", "azure"),
+    ("--backend", "azure", "--bulk"),
+    ("--backend", "chatgpt"),
+    ("--backend", "chatgpt", "--bulk", "--check"),
+    ("--backend", "chatgpt", "--bulk", "--async"),
+])
+def test_translate_catalog(tmp_path, extra):
     """
-    Fixture to mock the OpenAI client.
+    Test that every entry of a catalog is translated through each backend and mode.
     """
-    client = MagicMock()
-    client.chat.completions.create.return_value.choices[0].message.content = (
-        "0: HR\n"
-        "1: Tenant\n"
-        "2: Healthcare\n"
-        "3: Transport\n"
-        "4: Accounting & Consulting\n"
-        "5: Agriculture\n"
-        "6: Construction\n"
-        "7: Entertainment\n"
-        "8: Mining\n"
-        "9: Energy\n"
-        "10: Financial Services\n"
-        "11: Hospitality\n"
-        "12: IT\n"
-        "13: Manufacturing\n"
-        "14: Education\n"
-        "15: Real estate\n"
-        "16: Other\n"
-    )
-    return client
-
-
-@pytest.fixture(name='translation_config')
-def fixture_translation_config(mock_openai_client):
+    catalog = tmp_path / "django.po"
+    write_catalog(catalog, MSGIDS)
+
+    with MockServer() as server:
+        assert run_cli(server, catalog, *extra) == 0
+
+    assert [entry.msgstr for entry in polib.pofile(str(catalog))] == MSGIDS
+    assert server.texts == len(MSGIDS)
+    assert server.rejected == 0
+
+
+def test_throttled_requests_are_retried(tmp_path):
     """
-    Fixture to create a TranslationConfig instance.
+    Test that requests answered with a 429 are retried until every entry is translated.
     """
-    model = "gpt-3.5-turbo-1106"
-    return TranslationConfig(
-        client=mock_openai_client,
-        model=model,
-        bulk=True,
-        fuzzy=False,
-        folder_language=False
-    )
-
-
-@pytest.fixture(name='translation_service')
-def fixture_translation_service(translation_config):
+    catalog = tmp_path / "django.po"
+    write_catalog(catalog, MSGIDS)
+
+    with MockServer(jitter=0.01, throttle_every=3) as server:
+        assert run_cli(server, catalog, "--backend", "azure", "--workers", "2") == 0
+
+    assert [entry.msgstr for entry in polib.pofile(str(catalog))] == MSGIDS
+    assert server.throttled > 0
+
+
+def test_run_translating_nothing_fails(tmp_path):
     """
-    Fixture to create a TranslationService instance.
+    Test that a run giving up on every batch exits with an error status.
     """
-    return TranslationService(config=translation_config)
+    catalog = tmp_path / "django.po"
+    write_catalog(catalog, MSGIDS)
+
+    with MockServer(throttle_every=1) as server:
+        assert run_cli(server, catalog, "--backend", "azure", "--bulk", "--max-retries", "0") == 1
+
+    assert [entry.msgstr for entry in polib.pofile(str(catalog))] == [""] * len(MSGIDS)
 
 
-def test_validate_openai_connection(translation_service):
+def test_bulk_requests_stay_within_payload_limits(tmp_path):
     """
-    Test to validate the OpenAI connection.
+    Test that bulk requests respect element and body size limits the server enforces.
     """
-    assert translation_service.validate_openai_connection() is True
+    catalog = tmp_path / "django.po"
+    write_catalog(catalog, MSGIDS)
+
+    with MockServer(max_elements=5, max_bytes=200) as server:
+        assert run_cli(server, catalog, "--backend", "azure", "--bulk", "--batch-elements", "5",
+                       "--batch-bytes", "200") == 0
+
+    assert server.rejected == 0
+    assert server.requests == 4
+    assert [entry.msgstr for entry in polib.pofile(str(catalog))] == MSGIDS
 
 
-def test_translate_bulk(translation_service, tmp_path):
+def test_metrics_and_profile(tmp_path):
     """
-    Test the bulk translation functionality.
+    Test that a run writes its metrics and profile when asked to.
     """
-    # Create a temporary .po file
-    po_file_path = tmp_path / "django.po"
-    po_file_content = '''msgid ""
-msgstr ""
-"Project-Id-Version: PACKAGE VERSION\\n"
-"Report-Msgid-Bugs-To: \\n"
-"POT-Creation-Date: 2024-06-20 09:17+0000\\n"
-"Last-Translator: FULL NAME <EMAIL@ADDRESS>\\n"
-"Language-Team: LANGUAGE <LL@li.org>\\n"
-"Language: \\n"
-"MIME-Version: 1.0\\n"
-"Content-Type: text/plain; charset=UTF-8\\n"
-"Content-Transfer-Encoding: 8bit\\n"
-"Plural-Forms: nplurals=2; plural=(n != 1);\\n"
-
-msgid "HR"
-msgstr ""
-msgid "TENANT"
-msgstr ""
-msgid "HEALTHCARE"
-msgstr ""
-msgid "TRANSPORT"
-msgstr ""
-msgid "SERVICES"
-msgstr ""
-msgid "AGRO"
-msgstr ""
-msgid "CONSTRUCTION"
-msgstr ""
-msgid "ENTERTAINMENT"
-msgstr ""
-msgid "MINING"
-msgstr ""
-msgid "ENERGY"
-msgstr ""
-msgid "FINANCE"
-msgstr ""
-msgid "HOSPITALITY"
-msgstr ""
-msgid "IT"
-msgstr ""
-msgid "MANUFACTURING"
-msgstr ""
-msgid "EDUCATION"
-msgstr ""
-msgid "REALESTATE"
-msgstr ""
-msgid "OTHER"
-msgstr ""
-'''
-    po_file_path.write_text(po_file_content)
-
-    po_file = polib.pofile(po_file_path)
-    texts_to_translate = [entry.msgid for entry in po_file if not entry.msgstr]
-
-    # Perform translation
-    translated_texts = translation_service.translate_bulk(texts_to_translate, 'es', str(po_file_path), 0)
-
-    # Apply translations
-    translation_service.apply_translations_to_po_file(translated_texts, texts_to_translate, po_file)
-
-    # Save .po file
-    po_file.save(po_file_path)
-
-    # Reload .po file to check translations
-    translated_po_file = polib.pofile(po_file_path)
-
-    for entry in translated_po_file:
-        assert entry.msgstr != ""
-
-    # Check a few translations to ensure correctness
-    assert translated_po_file.find("HR").msgstr == "HR"
-    assert translated_po_file.find("TENANT").msgstr == "Tenant"
-    assert translated_po_file.find("HEALTHCARE").msgstr == "Healthcare"
+    catalog = tmp_path / "django.po"
+    write_catalog(catalog, MSGIDS)
+
+    with MockServer() as server:
+        assert run_cli(server, catalog, "--backend", "azure", "--bulk", "--metrics-json", "metrics.json",
+                       "--metrics-prometheus", "metrics.prom", "--profile", "run.pstats") == 0
+
+    metrics = json.loads((tmp_path / "metrics.json").read_text())
+    assert metrics["requests"]["requests"] == server.requests
+    assert metrics["requests"]["strings_translated"] == len(MSGIDS)
+    assert set(metrics["phases"]) == {"parse", "plan", "network", "apply", "save"}
+    assert "gct_chars_sent_total" in (tmp_path / "metrics.prom").read_text()
+    assert pstats.Stats(str(tmp_path / "run.pstats")).total_calls > 0
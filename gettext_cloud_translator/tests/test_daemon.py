@@ -0,0 +1,175 @@
+"""
+This module contains tests for the translation daemon and its thin client.
+"""
+
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import polib
+import pytest
+
+from daemon import TranslationDaemon, create_server, write_token
+from daemon_client import absolute_paths
+from gettext_cloud_translator.gettext_cloud_translator import GettextCloudTranslator, build_parser
+from mock_server import MockServer
+from test_gettext_cloud_translator import StubService, make_config
+
+CLIENT = os.path.join(os.path.dirname(__file__), "..", "daemon_client.py")
+
+
+class SlowStubService(StubService):
+    """
+    Stub service that takes a while to answer, so concurrent requests overlap.
+    """
+    def translate_multi(self, texts, dstlangs):
+        time.sleep(0.2)
+        return super().translate_multi(texts, dstlangs)
+
+
+def make_daemon(*extra):
+    """
+    Creates a daemon for the Azure backend with the given extra options.
+    """
+    parser = build_parser()
+    args = parser.parse_args(["--backend", "azure", "--apikey", "key", "--serve", "--no-tm", *extra])
+    return TranslationDaemon(args, parser, GettextCloudTranslator)
+
+
+def test_concurrent_requests_are_coalesced():
+    """
+    Test that texts requested by concurrent clients are translated once, then answered from the cache.
+    """
+    daemon = make_daemon()
+    service = SlowStubService(make_config())
+    daemon.services[daemon.service_key(daemon.args)] = service
+    results = []
+
+    def client(texts):
+        results.append(daemon.translate(daemon.run_args([]), texts, ["es"]))
+
+    threads = [threading.Thread(target=client, args=(texts,)) for texts in (["Open", "Close"], ["Close", "Open"])]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join()
+
+    assert service.calls == [(["Open", "Close"], ["es"])]
+    assert daemon.coalesced == 2
+    for result in results:
+        assert sorted(translation["msgstr"] for translation in result["es"]) == ["es:Close", "es:Open"]
+
+    assert daemon.translate(daemon.args, ["Open"], ["es"])["es"][0]["msgstr"] == "es:Open"
+    assert len(service.calls) == 1
+    assert daemon.stats()["cache"]["hits"] == 1
+
+
+def test_client_options_select_the_service():
+    """
+    Test that runs with different translation options get their own service and cache entries, and that
+    relative paths are refused.
+    """
+    daemon = make_daemon("--bulk")
+    english, spanish = StubService(make_config()), StubService(make_config())
+    daemon.services[daemon.service_key(daemon.run_args([]))] = english
+    daemon.services[daemon.service_key(daemon.run_args(["--srclang", "es"]))] = spanish
+
+    assert daemon.run_args([]).bulk
+    daemon.translate(daemon.run_args([]), ["Open"], ["fr"])
+    daemon.translate(daemon.run_args(["--srclang", "es"]), ["Open"], ["fr"])
+    assert (english.calls, spanish.calls) == ([(["Open"], ["fr"])], [(["Open"], ["fr"])])
+    assert daemon.stats()["services"] == 2
+
+    with pytest.raises(ValueError, match="absolute"):
+        daemon.run_args(["--file", "es.po"])
+    with pytest.raises(ValueError, match="cannot be set"):
+        daemon.run_args(["--file", "/tmp/es.po", "--metrics-json", "/tmp/metrics.json"])
+    assert absolute_paths(["--pot-diff", "old.pot", "new.pot", "--bulk", "--pot-diff=a.pot"]) == [
+        "--pot-diff", os.path.abspath("old.pot"), os.path.abspath("new.pot"), "--bulk",
+        f"--pot-diff={os.path.abspath('a.pot')}"
+    ]
+
+
+def test_tcp_requests_need_the_token_and_json(tmp_path):
+    """
+    Test that the TCP daemon refuses requests without its token, from web pages or not in JSON.
+    """
+    daemon = make_daemon()
+    token = write_token(str(tmp_path / "token"))
+    assert (tmp_path / "token").read_text() == token and (tmp_path / "token").stat().st_mode & 0o077 == 0
+    server = create_server(daemon, port=0, token=token)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    def post(headers):
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+        connection.request("POST", "/translate", json.dumps({"texts": [], "args": ["--dstlang", "es"]}), headers)
+        status = connection.getresponse().status
+        connection.close()
+        return status
+
+    authorization = {"Authorization": f"Bearer {token}"}
+    try:
+        assert post({"Content-Type": "application/json"}) == 401
+        assert post({"Content-Type": "application/json", "Authorization": "Bearer guess"}) == 401
+        assert post({"Content-Type": "text/plain", **authorization}) == 415
+        assert post({"Content-Type": "application/json", "Origin": "https://example.com", **authorization}) == 403
+        assert post({"Content-Type": "application/json", **authorization}) == 200
+    finally:
+        server.shutdown()
+        server.server_close()
+        daemon.close()
+
+
+@pytest.fixture(name='served')
+def fixture_served(tmp_path):
+    """
+    Fixture serving a daemon on a Unix socket, its Azure backend pointed at the mock server.
+    """
+    with MockServer() as server:
+        daemon = make_daemon("--endpoint", server.url, "--bulk")
+        http_server = create_server(daemon, str(tmp_path / "daemon.sock"))
+        thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+        thread.start()
+        yield server, str(tmp_path / "daemon.sock")
+        http_server.shutdown()
+        http_server.server_close()
+        daemon.close()
+
+
+def run_client(socket_path, *extra, stdin=None):
+    """
+    Runs the thin client against the daemon and returns its exit code and output.
+    """
+    process = subprocess.run([sys.executable, CLIENT, "--socket", socket_path, *extra], input=stdin,
+                             capture_output=True, text=True, check=False)
+    return process.returncode, process.stdout
+
+
+def test_client_translates_catalogs_and_texts(served, tmp_path):
+    """
+    Test that the thin client gets catalogs and strings translated by the daemon, which keeps them cached.
+    """
+    server, socket_path = served
+    catalog = tmp_path / "es.po"
+    po_file = polib.POFile()
+    po_file.metadata = {"Language": "es"}
+    for msgid in ["Open", "Close"]:
+        po_file.append(polib.POEntry(msgid=msgid, msgstr=""))
+    po_file.save(str(catalog))
+
+    code, output = run_client(socket_path, "--file", str(catalog), "--dstlang", "es")
+    assert code == 0
+    assert "done" in output
+    assert [entry.msgstr for entry in polib.pofile(str(catalog))] == ["OPEN", "CLOSE"]
+    requests = server.requests
+
+    code, output = run_client(socket_path, "--texts", "-", "--dstlang", "es", stdin="Open\nClose\n")
+    assert code == 0
+    assert [json.loads(line)["msgstr"] for line in output.splitlines()] == ["OPEN", "CLOSE"]
+    assert server.requests == requests
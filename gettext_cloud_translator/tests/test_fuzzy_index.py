@@ -0,0 +1,91 @@
+"""
+This module contains unit tests for the fuzzy matching index.
+"""
+
+import polib
+
+from fuzzy_index import FuzzyIndex, ngrams, similarity
+from gettext_cloud_translator.gettext_cloud_translator import GettextCloudTranslator
+from test_gettext_cloud_translator import StubService, make_config
+from test_translator_chatgpt import make_translator
+
+
+class RecallingStubService(StubService):
+    """
+    Stub service that looks the texts up before translating the rest.
+    """
+    def translate_multi(self, texts, dstlangs):
+        results = {}
+        for dstlang in dstlangs:
+            cached, texts_to_send = self.recall(texts, dstlang)
+            results[dstlang] = cached + super().translate_multi(texts_to_send, [dstlang])[dstlang]
+        return results
+
+
+def test_match_similar_strings(tmp_path):
+    """
+    Test that a string differing by a word finds the translation of its neighbor, per target language.
+    """
+    index = FuzzyIndex(str(tmp_path / "fuzzy.sqlite3"), "en")
+    index.add({"Delete %s item": "Eliminar %s elemento", "Open the file": "Abrir el archivo"}, "es")
+
+    source, msgstr, score = index.match("Delete %s items", "es")
+    assert (source, msgstr) == ("Delete %s item", "Eliminar %s elemento")
+    assert score == similarity(ngrams("Delete %s items"), ngrams("Delete %s item"))
+    assert index.match("Save changes", "es") is None
+    assert index.match("Delete %s items", "fr") is None
+
+
+def test_index_persists(tmp_path):
+    """
+    Test that the strings indexed in one run are found by the next, with their latest translation.
+    """
+    path = str(tmp_path / "fuzzy.sqlite3")
+    index = FuzzyIndex(path, "en")
+    index.add({"Delete %s item": "Borrar %s elemento"}, "es")
+    index.add({"Delete %s item": "Eliminar %s elemento"}, "es")
+    index.close()
+
+    index = FuzzyIndex(path, "en")
+    assert index.lookup(["Delete %s items", "Save"], "es") == {
+        "Delete %s items": ("Delete %s item", "Eliminar %s elemento", similarity(
+            ngrams("Delete %s items"), ngrams("Delete %s item")))
+    }
+    assert (index.lookups, index.matches) == (2, 1)
+
+
+def test_prefill_applies_fuzzy_entries(tmp_path):
+    """
+    Test that close matches of the translated entries are applied as fuzzy entries instead of being sent.
+    """
+    path = tmp_path / "es.po"
+    po_file = polib.POFile()
+    po_file.metadata = {"Language": "es"}
+    po_file.append(polib.POEntry(msgid="Delete %s item", msgstr="Eliminar %s elemento"))
+    po_file.append(polib.POEntry(msgid="Delete %s items", msgstr=""))
+    po_file.append(polib.POEntry(msgid="Save", msgstr=""))
+    po_file.save(str(path))
+
+    service = RecallingStubService(make_config(files=[str(path)], fuzzy_tm="prefill"))
+    service.fuzzy_index = FuzzyIndex(str(tmp_path / "fuzzy.sqlite3"), "en")
+    GettextCloudTranslator(service).translate()
+
+    assert service.calls == [(["Save"], ["es"])]
+    entry = polib.pofile(str(path)).find("Delete %s items")
+    assert entry.msgstr == "Eliminar %s elemento"
+    assert entry.flags == ["fuzzy"]
+    assert entry.previous_msgid == "Delete %s item"
+
+
+def test_context_references(tmp_path):
+    """
+    Test that the ChatGPT backend passes the close matches to the model along with the texts.
+    """
+    translator = make_translator("--fuzzy-tm", "context", "--fuzzy-tm-file", str(tmp_path / "fuzzy.sqlite3"))
+    translator.fuzzy_index.add({"Delete %s item": "Eliminar %s elemento"}, "es")
+
+    references = translator.references(["Delete %s items", "Save"], "es")
+    assert references == {"Delete %s item": "Eliminar %s elemento"}
+    messages = translator.batch_messages({0: "Delete %s items", 1: "Save"}, "es", references)
+    assert [message["role"] for message in messages] == ["system", "system", "user"]
+    assert "Eliminar %s elemento" in messages[1]["content"]
@@ -0,0 +1,222 @@
+"""
+This module contains unit tests for the GettextCloudTranslator pipeline.
+"""
+
+import os
+import stat
+
+from types import SimpleNamespace
+
+import polib
+import pytest
+
+from gettext_cloud_translator.gettext_cloud_translator import GettextCloudTranslator, find_catalogs
+from translator_service import TranslatorService
+
+
+class StubService(TranslatorService):
+    """
+    Service prefixing texts with their target language and recording translate_multi calls.
+    """
+    def __init__(self, config) -> None:  # pylint: disable=W0231
+        self.config = config
+        self.calls = []
+
+    def translate_in_bulk(self, texts, dstlang=None):
+        return self.translate_multi(texts, [dstlang])[dstlang]
+
+    def translate_one_by_one(self, texts, dstlang=None):
+        return self.translate_multi(texts, [dstlang])[dstlang]
+
+    def translate_multi(self, texts, dstlangs):
+        self.calls.append((texts, dstlangs))
+        return {dstlang: [{"msgid": text, "msgstr": f"{dstlang}:{text}"} for text in texts] for dstlang in dstlangs}
+
+
+def make_config(**overrides):
+    """
+    Returns the configuration attributes the pipeline reads, with test defaults.
+    """
+    config = {"fuzzy": False, "files": [], "jobs": 1, "srclang": "en", "dstlangs": ["es"], "bulk": False,
+              "checkpoint": None, "metrics_json": None, "metrics_prometheus": None,
+              "incremental": None, "pot_diff": None, "mask_placeholders": True,
+              "stream": False, "stream_batch": 1000, "stream_inflight": 2}
+    config.update(overrides)
+    return SimpleNamespace(**config)
+
+
+@pytest.fixture(name='translator')
+def fixture_translator():
+    """
+    Fixture to create a GettextCloudTranslator with a stub service.
+    """
+    return GettextCloudTranslator(StubService(make_config()))
+
+
+def test_apply_translations_updates_every_context(translator):
+    """
+    Test that a translated msgid is applied to all pending entries sharing it.
+    """
+    po_file = polib.POFile()
+    po_file.append(polib.POEntry(msgid="Open", msgstr=""))
+    po_file.append(polib.POEntry(msgid="Open", msgctxt="menu", msgstr=""))
+    po_file.append(polib.POEntry(msgid="Close", msgstr="Cerrar"))
+    po_file.append(polib.POEntry(msgid="Save", msgstr=""))
+
+    translator.apply_translations_to_po_file([
+        {"msgid": "Open", "msgstr": "Abrir"},
+        {"msgid": "Close", "msgstr": "Clausurar"},
+        {"msgid": "Missing", "msgstr": "Falta"},
+        {"msgid": "Save", "msgstr": ""},
+    ], po_file)
+
+    assert [entry.msgstr for entry in po_file] == ["Abrir", "Abrir", "Cerrar", ""]
+
+
+def write_catalog(path, language, msgids):
+    """
+    Writes a catalog with the given language header and untranslated msgids.
+    """
+    po_file = polib.POFile()
+    po_file.metadata = {"Language": language, "Content-Type": "text/plain; charset=UTF-8"}
+    for msgid in msgids:
+        po_file.append(polib.POEntry(msgid=msgid, msgstr=""))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    po_file.save(str(path))
+
+
+def test_find_catalogs(tmp_path):
+    """
+    Test that files, directories and globs are expanded to unique .po files.
+    """
+    for language in ("es", "fr"):
+        write_catalog(tmp_path / "locale" / language / "LC_MESSAGES" / "django.po", language, ["Open"])
+    (tmp_path / "locale" / "es" / "LC_MESSAGES" / "django.mo").write_text("")
+
+    files = find_catalogs([
+        str(tmp_path / "locale"),
+        str(tmp_path / "locale" / "*" / "LC_MESSAGES" / "*.po"),
+    ])
+
+    assert files == [
+        str(tmp_path / "locale" / "es" / "LC_MESSAGES" / "django.po"),
+        str(tmp_path / "locale" / "fr" / "LC_MESSAGES" / "django.po"),
+    ]
+
+
+def test_translate_many_files(tmp_path):
+    """
+    Test that every matching catalog is translated through one shared service,
+    sending each unique msgid only once.
+    """
+    for domain in ("django", "djangojs", "admin"):
+        write_catalog(tmp_path / "es" / f"{domain}.po", "es", ["Open", f"{domain} title"])
+    write_catalog(tmp_path / "fr" / "django.po", "fr", ["Open"])
+
+    service = StubService(make_config(files=[str(tmp_path)], jobs=3))
+
+    summaries = GettextCloudTranslator(service).translate()
+
+    assert [(summary["status"], summary["translated"]) for summary in summaries] == [
+        ("done", 2), ("done", 2), ("done", 2), ("skipped", 0)
+    ]
+    assert service.calls == [(["Open", "admin title", "django title", "djangojs title"], ["es"])]
+    assert polib.pofile(str(tmp_path / "es" / "admin.po")).find("admin title").msgstr == "es:admin title"
+
+
+def test_translate_many_targets(tmp_path):
+    """
+    Test that texts shared by several target catalogs are extracted once and
+    routed to each language's catalog.
+    """
+    write_catalog(tmp_path / "es.po", "es", ["Open", "Close"])
+    write_catalog(tmp_path / "fr.po", "fr", ["Open", "Save"])
+    write_catalog(tmp_path / "de.po", "de", ["Open"])
+
+    service = StubService(make_config(files=[str(tmp_path)], dstlangs=["es", "fr"]))
+    GettextCloudTranslator(service).translate()
+
+    assert service.calls == [(["Open"], ["es", "fr"]), (["Close"], ["es"]), (["Save"], ["fr"])]
+    assert polib.pofile(str(tmp_path / "fr.po")).find("Open").msgstr == "fr:Open"
+    assert polib.pofile(str(tmp_path / "es.po")).find("Open").msgstr == "es:Open"
+    assert polib.pofile(str(tmp_path / "de.po")).find("Open").msgstr == ""
+
+
+class MultiTargetStubService(StubService):
+    """
+    Stub service estimating requests like a backend sending every target in the same request.
+    """
+    def estimate_requests(self, texts, targets=1):
+        return (len(texts) - 1) // self.config.bulksize + 1 if texts else 0
+
+
+def test_savings_count_requests_per_catalog_and_chars_per_target(tmp_path, caplog):
+    """
+    Test that the savings are measured against one request list per catalog, characters billed once per target.
+    """
+    for catalog in ("django", "admin"):
+        for language in ("es", "fr"):
+            write_catalog(tmp_path / language / f"{catalog}.po", language, ["Open", "Close"])
+
+    service = MultiTargetStubService(make_config(files=[str(tmp_path)], dstlangs=["es", "fr"], bulk=True,
+                                                 bulksize=10))
+    with caplog.at_level("INFO"):
+        GettextCloudTranslator(service).translate()
+
+    assert service.calls == [(["Open", "Close"], ["es", "fr"])]
+    # 4 catalogs of 9 characters in one request each, against 2 texts of 9 characters for 2 targets in one request
+    assert "Planned 2 unique texts for 8 pending entries: saved 18 characters and 3 requests" in caplog.text
+
+
+def test_translate_nothing_pending(tmp_path):
+    """
+    Test that catalogs without pending entries never reach the service.
+    """
+    po_file = polib.POFile()
+    po_file.metadata = {"Language": "es", "Content-Type": "text/plain; charset=UTF-8"}
+    po_file.append(polib.POEntry(msgid="Open", msgstr="Abrir"))
+    po_file.save(str(tmp_path / "es.po"))
+
+    service = StubService(make_config(files=[str(tmp_path)]))
+    summaries = GettextCloudTranslator(service).translate()
+
+    assert service.calls == []
+    assert [(summary["pending"], summary["translated"]) for summary in summaries] == [(0, 0)]
+
+
+def test_unchanged_catalog_is_not_rewritten(tmp_path):
+    """
+    Test that a catalog none of whose entries changed keeps its content and modification time.
+    """
+    path = tmp_path / "es.po"
+    po_file = polib.POFile()
+    po_file.metadata = {"Language": "es", "Content-Type": "text/plain; charset=UTF-8"}
+    po_file.append(polib.POEntry(msgid="Open", msgstr="Abrir"))
+    po_file.save(str(path))
+    os.utime(path, ns=(1_000_000_000, 1_000_000_000))
+
+    summaries = GettextCloudTranslator(StubService(make_config(files=[str(path)]))).translate()
+
+    assert summaries[0]["status"] == "done"
+    assert os.stat(path).st_mtime_ns == 1_000_000_000
+
+
+def test_fuzzy_cleared_and_translated_in_one_pass(tmp_path):
+    """
+    Test that --fuzzy clears the fuzzy flags while the pending entries are
+    translated, saving the catalog once, atomically and with its permissions.
+    """
+    path = tmp_path / "es.po"
+    po_file = polib.POFile()
+    po_file.metadata = {"Language": "es", "Content-Type": "text/plain; charset=UTF-8"}
+    po_file.append(polib.POEntry(msgid="Open", msgstr="Abrir", flags=["fuzzy"]))
+    po_file.append(polib.POEntry(msgid="Close", msgstr=""))
+    po_file.save(str(path))
+    os.chmod(path, 0o640)
+
+    summaries = GettextCloudTranslator(StubService(make_config(files=[str(path)], fuzzy=True))).translate()
+
+    assert (summaries[0]["fuzzy_cleared"], summaries[0]["translated"]) == (1, 1)
+    assert [(entry.msgstr, entry.flags) for entry in polib.pofile(str(path))] == [("Abrir", []), ("es:Close", [])]
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+    assert os.listdir(tmp_path) == ["es.po"]
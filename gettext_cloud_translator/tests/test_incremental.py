@@ -0,0 +1,87 @@
+"""
+This module contains unit tests for incremental runs.
+"""
+
+import polib
+
+from gettext_cloud_translator.gettext_cloud_translator import GettextCloudTranslator
+from incremental import CatalogState, pot_changes
+from test_gettext_cloud_translator import StubService, make_config, write_catalog
+
+
+def test_unchanged_catalogs_are_not_parsed(tmp_path, monkeypatch):
+    """
+    Test that a second run skips the catalogs it completed, and picks up a changed one.
+    """
+    state = str(tmp_path / "state.json")
+    write_catalog(tmp_path / "es" / "django.po", "es", ["Open", "Close"])
+    write_catalog(tmp_path / "es" / "admin.po", "es", ["Save"])
+    config = make_config(files=[str(tmp_path / "es")], incremental=state)
+    GettextCloudTranslator(StubService(config)).translate()
+
+    po_file = polib.pofile(str(tmp_path / "es" / "admin.po"))
+    po_file.append(polib.POEntry(msgid="Delete", msgstr=""))
+    po_file.save()
+    parsed = []
+    pofile = polib.pofile
+    monkeypatch.setattr(polib, "pofile", lambda path, **kwargs: parsed.append(path) or pofile(path, **kwargs))
+
+    service = StubService(config)
+    summaries = GettextCloudTranslator(service).translate()
+
+    assert parsed == [str(tmp_path / "es" / "admin.po")]
+    assert service.calls == [(["Delete"], ["es"])]
+    assert sorted((summary["file"].rsplit("/", 1)[-1], summary["status"]) for summary in summaries) == [
+        ("admin.po", "done"), ("django.po", "unchanged")
+    ]
+
+
+def test_touched_but_identical_catalog_is_skipped(tmp_path):
+    """
+    Test that a new modification time alone does not count as a change.
+    """
+    path = tmp_path / "django.po"
+    write_catalog(path, "es", ["Open"])
+    state = CatalogState(str(tmp_path / "state.json"))
+    state.record(str(path), 0)
+    path.write_bytes(path.read_bytes())
+
+    assert state.unchanged(str(path))
+    state.record(str(path), 1)
+    assert not state.unchanged(str(path))
+
+
+def test_pot_diff_limits_the_plan(tmp_path):
+    """
+    Test that only the msgids new in the current template are translated.
+    """
+    write_catalog(tmp_path / "old.pot", "", ["Open"])
+    write_catalog(tmp_path / "new.pot", "", ["Open", "Close"])
+    write_catalog(tmp_path / "es.po", "es", ["Open", "Close"])
+    assert pot_changes(str(tmp_path / "old.pot"), str(tmp_path / "new.pot")) == {"Close"}
+
+    service = StubService(make_config(files=[str(tmp_path / "es.po")],
+                                      pot_diff=[str(tmp_path / "old.pot"), str(tmp_path / "new.pot")]))
+    GettextCloudTranslator(service).translate()
+
+    assert service.calls == [(["Close"], ["es"])]
+
+
+def test_pot_diff_run_does_not_mark_catalog_complete(tmp_path):
+    """
+    Test that an incremental run limited by --pot-diff leaves the other pending entries to the next run.
+    """
+    state = str(tmp_path / "state.json")
+    write_catalog(tmp_path / "old.pot", "", ["Open", "Save"])
+    write_catalog(tmp_path / "new.pot", "", ["Open", "Close", "Save"])
+    write_catalog(tmp_path / "es.po", "es", ["Open", "Close", "Save"])
+    config = make_config(files=[str(tmp_path / "es.po")], incremental=state,
+                         pot_diff=[str(tmp_path / "old.pot"), str(tmp_path / "new.pot")])
+    GettextCloudTranslator(StubService(config)).translate()
+    assert not CatalogState(state).unchanged(str(tmp_path / "es.po"))
+
+    service = StubService(make_config(files=[str(tmp_path / "es.po")], incremental=state))
+    GettextCloudTranslator(service).translate()
+
+    assert service.calls == [(["Open", "Save"], ["es"])]
+    assert CatalogState(state).unchanged(str(tmp_path / "es.po"))
@@ -0,0 +1,44 @@
+"""
+This module contains unit tests for the run metrics.
+"""
+
+import json
+
+from metrics import Histogram, Metrics
+
+
+def test_histogram_buckets_and_quantiles():
+    """
+    Test that observations land in cumulative buckets and quantiles report their bucket bound.
+    """
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.05, 0.5, 5.0):
+        histogram.observe(value)
+
+    assert histogram.to_dict() == {"count": 4, "sum": 5.6, "buckets": {"0.1": 2, "1.0": 3, "+Inf": 4}}
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.75) == 1.0
+    assert histogram.quantile(1.0) == float("inf")
+
+
+def test_metrics_export(tmp_path):
+    """
+    Test the JSON and Prometheus textfile exports.
+    """
+    metrics = Metrics()
+    with metrics.phase("network"):
+        metrics.observe_request(0.2, 120)
+    metrics.count("strings_translated", 3)
+    metrics.service = {"rate_limiter": {"throttled": 1, "retries": 2, "failures": 0}}
+
+    metrics.write(str(tmp_path / "metrics.json"), str(tmp_path / "metrics.prom"))
+
+    document = json.loads((tmp_path / "metrics.json").read_text())
+    assert document["phases"]["network"] > 0
+    assert document["requests"]["chars_sent"] == 120
+    assert document["requests"]["latency_seconds"]["buckets"]["0.25"] == 1
+    prometheus = (tmp_path / "metrics.prom").read_text().splitlines()
+    assert 'gct_request_seconds_bucket{le="+Inf"} 1' in prometheus
+    assert "gct_strings_translated_total 3" in prometheus
+    assert "gct_retries_total 2" in prometheus
+    assert not list(tmp_path.glob("*.tmp"))
@@ -0,0 +1,95 @@
+"""
+This module contains unit tests for the placeholder masking.
+"""
+
+import polib
+
+from gettext_cloud_translator.gettext_cloud_translator import GettextCloudTranslator
+from placeholders import mask, mask_translations, unmask
+from test_gettext_cloud_translator import StubService, make_config
+
+
+class DroppingStubService(StubService):
+    """
+    Stub service whose translations lose their first token.
+    """
+    def translate_multi(self, texts, dstlangs):
+        results = super().translate_multi(texts, dstlangs)
+        for translations in results.values():
+            for translation in translations:
+                translation["msgstr"] = translation["msgstr"].replace("{0}", "", 1)
+        return results
+
+
+def test_mask_and_unmask():
+    """
+    Test that placeholders, markup and numbers are masked in order and restored in any order.
+    """
+    template, values = mask('Delete %(count)d of {total} <a href="/items">items</a> &amp; 100% of 2.5')
+    assert template == "Delete {0} of {1} {2}items{3} {4} {5}% of {6}"
+    assert values == ["%(count)d", "{total}", '<a href="/items">', "</a>", "&amp;", "100", "2.5"]
+
+    translated = unmask("{6} y {5}% de {4} {2}elementos{3}: borrar {0} de {1}", values)
+    assert translated == '2.5 y 100% de &amp; <a href="/items">elementos</a>: borrar %(count)d de {total}'
+
+
+def test_unmask_rejects_lost_and_duplicated_tokens():
+    """
+    Test that a translation missing or repeating a token is not restored.
+    """
+    _, values = mask("Delete %s of %s")
+    assert unmask("Borrar {0}", values) is None
+    assert unmask("Borrar {0} de {0}", values) is None
+    assert unmask("Borrar {1} de {0}", values) == "Borrar %s de %s"
+
+
+def test_mask_translations():
+    """
+    Test that existing translations are masked along with their text, following its values.
+    """
+    assert mask_translations({
+        "Delete %(n)d of %(m)d": "Borrar %(m)d de %(n)d",
+        "Page 10": "Página diez",
+    }) == {"Delete {0} of {1}": "Borrar {1} de {0}"}
+
+
+def test_texts_differing_by_placeholders_are_translated_once(tmp_path):
+    """
+    Test that texts sharing a template are sent once, and that texts with nothing to translate are not sent.
+    """
+    path = tmp_path / "es.po"
+    po_file = polib.POFile()
+    po_file.metadata = {"Language": "es"}
+    for msgid in ["Delete %s items", "Delete %(count)d items", "Page 3 of 10", "Page 4 of 10", "%s: %d"]:
+        po_file.append(polib.POEntry(msgid=msgid, msgstr=""))
+    po_file.save(str(path))
+
+    service = StubService(make_config(files=[str(path)]))
+    GettextCloudTranslator(service).translate()
+
+    assert service.calls == [(["Delete {0} items", "Page {0} of {1}"], ["es"])]
+    assert {entry.msgid: entry.msgstr for entry in polib.pofile(str(path))} == {
+        "Delete %s items": "es:Delete %s items",
+        "Delete %(count)d items": "es:Delete %(count)d items",
+        "Page 3 of 10": "es:Page 3 of 10",
+        "Page 4 of 10": "es:Page 4 of 10",
+        "%s: %d": "%s: %d",
+    }
+
+
+def test_mangled_translations_are_dropped(tmp_path):
+    """
+    Test that translations whose placeholders did not survive are left out and counted.
+    """
+    path = tmp_path / "es.po"
+    po_file = polib.POFile()
+    po_file.metadata = {"Language": "es"}
+    po_file.append(polib.POEntry(msgid="Delete %s items", msgstr=""))
+    po_file.append(polib.POEntry(msgid="Open", msgstr=""))
+    po_file.save(str(path))
+
+    translator = GettextCloudTranslator(DroppingStubService(make_config(files=[str(path)])))
+    translator.translate()
+
+    assert [entry.msgstr for entry in polib.pofile(str(path))] == ["", "es:Open"]
+    assert translator.metrics.counters["placeholder_mismatches"] == 1
@@ -0,0 +1,76 @@
+"""
+This module contains unit tests for the rate limiter.
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from rate_limiter import RateLimiter, RetryableError, ThrottledError, TokenBucket, parse_retry_after
+
+
+def test_token_bucket_enforces_rate():
+    """
+    Test that tokens beyond the capacity are only handed out at the refill rate.
+    """
+    bucket = TokenBucket(rate=100, capacity=10)
+    start = time.monotonic()
+    for _ in range(30):
+        bucket.acquire(1)
+    assert time.monotonic() - start == pytest.approx(0.2, abs=0.1)
+
+
+def test_call_retries_until_success():
+    """
+    Test that retryable errors are retried and throttling is counted.
+    """
+    limiter = RateLimiter(max_retries=3, backoff_base=0.001)
+    failures = [ThrottledError("429", retry_after=0), RetryableError("timeout")]
+
+    def send(batch):
+        if failures:
+            raise failures.pop(0)
+        return batch
+
+    assert limiter.call(send, ["text"]) == ["text"]
+    assert limiter.stats() == {"throttled": 1, "retries": 2, "failures": 0}
+
+
+def test_call_gives_up_after_max_retries():
+    """
+    Test that the last error is raised once the retries are exhausted.
+    """
+    limiter = RateLimiter(max_retries=2, backoff_base=0.001)
+
+    def send(batch):
+        raise RetryableError("HTTP 503")
+
+    with pytest.raises(RetryableError):
+        limiter.call(send, ["text"])
+    assert limiter.stats() == {"throttled": 0, "retries": 2, "failures": 1}
+
+
+def test_parse_retry_after():
+    """
+    Test the Retry-After parsing.
+    """
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") is None
+
+
+def test_call_async_retries_until_success():
+    """
+    Test that the coroutine variant retries and counts like call().
+    """
+    limiter = RateLimiter(max_retries=3, backoff_base=0.001)
+    failures = [ThrottledError("429", retry_after=0)]
+
+    async def send(batch):
+        if failures:
+            raise failures.pop(0)
+        return batch
+
+    assert asyncio.run(limiter.call_async(send, ["text"])) == ["text"]
+    assert limiter.stats() == {"throttled": 1, "retries": 1, "failures": 0}
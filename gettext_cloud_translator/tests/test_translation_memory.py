@@ -0,0 +1,52 @@
+"""
+This module contains unit tests for the translation memory.
+"""
+
+import time
+
+from translation_memory import TranslationMemory
+
+
+def test_lookup_and_store(tmp_path):
+    """
+    Test that stored translations are found again, per target language.
+    """
+    path = str(tmp_path / "memory.sqlite3")
+    memory = TranslationMemory(path, "azure", srclang="en")
+    memory.store({"Open": "Abrir", "Close": "Cerrar"}, "es")
+
+    assert memory.lookup(["Open", "Save"], "es") == {"Open": "Abrir"}
+    assert memory.lookup(["Open"], "fr") == {}
+    assert (memory.hits, memory.misses) == (1, 2)
+
+    other = TranslationMemory(path, "chatgpt", model="gpt-4o", srclang="en")
+    assert other.lookup(["Open"], "es") == {}
+
+
+def test_readonly_does_not_write(tmp_path):
+    """
+    Test that a read-only memory serves lookups and ignores stores.
+    """
+    path = str(tmp_path / "memory.sqlite3")
+    TranslationMemory(path, "azure", srclang="en").store({"Open": "Abrir"}, "es")
+
+    memory = TranslationMemory(path, "azure", srclang="en", readonly=True)
+    memory.store({"Close": "Cerrar"}, "es")
+
+    assert memory.lookup(["Open", "Close"], "es") == {"Open": "Abrir"}
+
+
+def test_eviction_keeps_recently_used(tmp_path):
+    """
+    Test that the least recently used entries are evicted past the size bound.
+    """
+    memory = TranslationMemory(str(tmp_path / "memory.sqlite3"), "azure", srclang="en", max_entries=2)
+    memory.store({"One": "Uno"}, "es")
+    time.sleep(0.01)
+    memory.store({"Two": "Dos"}, "es")
+    time.sleep(0.01)
+    memory.lookup(["One"], "es")
+    time.sleep(0.01)
+    memory.store({"Three": "Tres"}, "es")
+
+    assert memory.lookup(["One", "Two", "Three"], "es") == {"One": "Uno", "Three": "Tres"}
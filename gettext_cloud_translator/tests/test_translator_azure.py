@@ -0,0 +1,174 @@
+"""
+This module contains unit tests for the Azure backend.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+
+from config_azure import AzureConfiguration
+from gettext_cloud_translator.gettext_cloud_translator import build_parser
+from translator_azure import TranslatorAzure
+
+
+def make_args(*extra):
+    """
+    Parses a command line for the Azure backend.
+    """
+    return build_parser().parse_args([
+        "--backend", "azure", "--apikey", "key", "--location", "westus",
+        "--file", "django.po", "--dstlang", "es", "--no-tm", *extra
+    ])
+
+
+@pytest.fixture(name='fake_post')
+def fixture_fake_post(monkeypatch):
+    """
+    Fixture replacing requests.post with a slow, upper-casing fake Azure endpoint.
+    """
+    state = {"in_flight": 0, "peak": 0, "calls": 0}
+    lock = threading.Lock()
+
+    def post(session, url, params=None, headers=None, json=None, **kwargs):  # pylint: disable=W0613,W0621
+        with lock:
+            state["calls"] += 1
+            state["in_flight"] += 1
+            state["peak"] = max(state["peak"], state["in_flight"])
+        time.sleep(0.01)
+        with lock:
+            state["in_flight"] -= 1
+        response = MagicMock(status_code=200, headers={})
+        response.json.return_value = [
+            {"translations": [{"text": item["text"].upper(), "to": dstlang} for dstlang in params["to"]]}
+            for item in json
+        ]
+        return response
+
+    monkeypatch.setattr(requests.Session, "post", post)
+    return state
+
+
+def test_one_by_one_is_concurrent_and_ordered(fake_post):
+    """
+    Test that requests overlap up to --workers and results keep their order.
+    """
+    translator = TranslatorAzure(AzureConfiguration(make_args("--workers", "4")))
+    texts = [f"text {i}" for i in range(20)]
+
+    translated_texts = translator.translate_one_by_one(texts)
+
+    assert translated_texts == [{"msgid": text, "msgstr": text.upper(), "dstlang": "es"} for text in texts]
+    assert fake_post["calls"] == 20
+    assert 1 < fake_post["peak"] <= 4
+
+
+def test_bulk_keeps_order(fake_post):
+    """
+    Test that bulk mode maps every msgid to its own translation.
+    """
+    translator = TranslatorAzure(AzureConfiguration(make_args("--workers", "3", "--bulk")))
+    texts = [f"text {i}" for i in range(2500)]
+
+    translated_texts = translator.translate_in_bulk(texts)
+
+    assert translated_texts == [{"msgid": text, "msgstr": text.upper(), "dstlang": "es"} for text in texts]
+    assert fake_post["calls"] == 3
+
+
+def test_multi_target_requests(fake_post):
+    """
+    Test that one request carries every target language and results are split per language.
+    """
+    translator = TranslatorAzure(AzureConfiguration(make_args("--workers", "2", "--bulk")))
+    texts = [f"text {i}" for i in range(10)]
+
+    results = translator.translate_multi(texts, ["es", "fr", "de"])
+
+    assert fake_post["calls"] == 1
+    assert sorted(results) == ["de", "es", "fr"]
+    assert [translation["msgid"] for translation in results["fr"]] == texts
+
+
+class UpperCaseHandler(BaseHTTPRequestHandler):
+    """
+    Minimal keep-alive HTTP stand-in for the Azure /translate endpoint. The
+    first `throttle` requests are answered with a 429.
+    """
+    protocol_version = "HTTP/1.1"
+    throttle = 0
+
+    def do_POST(self):  # pylint: disable=C0116
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if UpperCaseHandler.throttle > 0:
+            UpperCaseHandler.throttle -= 1
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        payload = json.dumps([{"translations": [{"text": item["text"].upper()}]} for item in body]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):  # pylint: disable=W0622
+        pass
+
+
+@pytest.fixture(name='local_endpoint')
+def fixture_local_endpoint():
+    """
+    Fixture serving UpperCaseHandler on a random local port.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), UpperCaseHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/translate"
+    server.shutdown()
+    server.server_close()
+
+
+def test_session_reuses_connections(local_endpoint):
+    """
+    Test that sequential requests share one kept-alive connection.
+    """
+    translator = TranslatorAzure(AzureConfiguration(make_args("--workers", "1")))
+    translator.constructed_url = local_endpoint
+
+    translator.translate_one_by_one([f"text {i}" for i in range(10)])
+
+    assert translator.connection_stats() == {"requests": 10, "connections": 1, "reused": 9}
+
+
+def test_no_keepalive_opens_a_connection_per_request(local_endpoint):
+    """
+    Test that --no-keepalive closes the connection after every request.
+    """
+    translator = TranslatorAzure(AzureConfiguration(make_args("--workers", "1", "--no-keepalive")))
+    translator.constructed_url = local_endpoint
+
+    translator.translate_one_by_one([f"text {i}" for i in range(5)])
+
+    assert translator.connection_stats()["reused"] == 0
+
+
+def test_throttled_batch_is_retried(local_endpoint, monkeypatch):
+    """
+    Test that a 429 only retries the throttled batch and no translation is lost.
+    """
+    monkeypatch.setattr(UpperCaseHandler, "throttle", 2)
+    translator = TranslatorAzure(AzureConfiguration(make_args("--workers", "1")))
+    translator.constructed_url = local_endpoint
+    texts = [f"text {i}" for i in range(5)]
+
+    translated_texts = translator.translate_one_by_one(texts)
+
+    assert [translation["msgstr"] for translation in translated_texts] == [text.upper() for text in texts]
+    assert translator.limiter_stats() == {"throttled": 2, "retries": 2, "failures": 0}
@@ -0,0 +1,155 @@
+"""
+This module contains unit tests for the ChatGPT backend.
+"""
+
+import json
+from unittest.mock import MagicMock
+
+import pytest
+
+from config_chatgpt import ChatGptConfiguration
+from gettext_cloud_translator.gettext_cloud_translator import build_parser
+from translator_chatgpt import TranslatorChatGPT
+
+
+def make_translator(*extra):
+    """
+    Creates a ChatGPT backend for Spanish.
+    """
+    args = build_parser().parse_args([
+        "--backend", "chatgpt", "--apikey", "key", "--file", "django.po", "--dstlang", "es",
+        "--no-tm", "--workers", "1", *extra
+    ])
+    return TranslatorChatGPT(ChatGptConfiguration(args))
+
+
+def completion(content):
+    """
+    Builds a chat completion holding `content`.
+    """
+    response = MagicMock()
+    response.choices[0].message.content = content
+    return response
+
+
+@pytest.fixture(name='replies')
+def fixture_replies():
+    """
+    Fixture recording the requested payloads and answering with upper-cased
+    texts, dropping index 1 and mangling index 2 on the first reply.
+    """
+    payloads = []
+
+    def create(model, messages, **kwargs):  # pylint: disable=W0613
+        payload = json.loads(messages[-1]["content"])
+        payloads.append(payload)
+        reply = {index: text.upper() for index, text in payload.items()}
+        if len(payloads) == 1:
+            del reply["1"]
+            reply["2"] = ["not", "a", "string"]
+        return completion(json.dumps(reply))
+
+    return payloads, create
+
+
+def test_bulk_re_requests_only_missing_indices(replies):
+    """
+    Test that a batch goes in one completion and only the bad indices are asked again.
+    """
+    payloads, create = replies
+    translator = make_translator("--bulk", "--bulksize", "10")
+    translator.client = MagicMock()
+    translator.client.chat.completions.create.side_effect = create
+    texts = [f"text {i}" for i in range(5)]
+
+    translated_texts = translator.translate_in_bulk(texts)
+
+    assert payloads == [{str(i): text for i, text in enumerate(texts)}, {"1": "text 1", "2": "text 2"}]
+    assert translated_texts == [{"msgid": text, "msgstr": text.upper(), "dstlang": "es"} for text in texts]
+
+
+def test_bulk_splits_into_batches():
+    """
+    Test that texts are packed --bulksize per completion.
+    """
+    translator = make_translator("--bulk", "--bulksize", "4")
+    translator.client = MagicMock()
+    translator.client.chat.completions.create.side_effect = lambda model, messages, **kwargs: completion(
+        json.dumps({index: text.upper() for index, text in json.loads(messages[-1]["content"]).items()})
+    )
+
+    translated_texts = translator.translate_in_bulk([f"text {i}" for i in range(10)])
+
+    assert translator.client.chat.completions.create.call_count == 3
+    assert len(translated_texts) == 10
+
+
+def test_one_by_one():
+    """
+    Test that one-by-one mode returns a result per text and skips refusals.
+    """
+    translator = make_translator()
+    translator.client = MagicMock()
+    translator.client.chat.completions.create.side_effect = [
+        completion("Abrir"), completion("The provided text does not seem to be English")
+    ]
+
+    assert translator.translate_one_by_one(["Open", "xyzzy"]) == [{"msgid": "Open", "msgstr": "Abrir", "dstlang": "es"}]
+
+
+def test_one_by_one_keeps_edge_whitespace():
+    """
+    Test that one-by-one translations keep the leading and trailing whitespace of their source, not the reply's.
+    """
+    translator = make_translator()
+    translator.client = MagicMock()
+    translator.client.chat.completions.create.side_effect = [completion("Nombre:"), completion("\n  Guardar \n")]
+
+    assert [translation["msgstr"] for translation in translator.translate_one_by_one(["Name: ", "Save"])] == [
+        "Nombre: ", "Guardar"
+    ]
+
+
+def test_bulk_batches_fit_token_budget():
+    """
+    Test that batches are sized by estimated tokens and the usage is recorded.
+    """
+    translator = make_translator("--bulk", "--bulksize", "100", "--max-request-tokens", "300")
+    translator.client = MagicMock()
+
+    def create(model, messages, **kwargs):  # pylint: disable=W0613
+        response = completion(json.dumps(
+            {index: text.upper() for index, text in json.loads(messages[-1]["content"]).items()}
+        ))
+        response.usage.prompt_tokens = 100
+        response.usage.completion_tokens = 50
+        return response
+
+    translator.client.chat.completions.create.side_effect = create
+    texts = [f"word {i} " * 10 for i in range(20)]
+    batches = translator.token_batches(texts, "es")
+
+    translated_texts = translator.translate_in_bulk(texts)
+
+    assert 1 < len(batches) < len(texts)
+    assert translator.estimate_requests(texts) == len(batches)
+    assert translator.client.chat.completions.create.call_count == len(batches)
+    assert len(translated_texts) == len(texts)
+    assert translator.token_stats() == {
+        "requests": len(batches), "prompt_tokens": 100 * len(batches), "completion_tokens": 50 * len(batches)
+    }
+
+
+def test_client_created_on_first_request():
+    """
+    Test that no client is created until a text is actually sent, and that --check retrieves the model.
+    """
+    translator = make_translator("--bulk")
+
+    assert translator.translate_in_bulk([]) == []
+    assert translator.client is None
+
+    translator.client = MagicMock()
+    assert translator.check()
+    translator.client.models.retrieve.assert_called_once_with(translator.config.model)
+    translator.client.chat.completions.create.assert_not_called()
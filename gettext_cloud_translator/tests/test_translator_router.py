@@ -0,0 +1,109 @@
+"""
+This module contains tests for the routing of batches between several backends.
+"""
+
+import threading
+import time
+
+from gettext_cloud_translator.gettext_cloud_translator import build_parser
+from test_gettext_cloud_translator import StubService, make_config
+from translator_factory import TranslatorFactory
+from translator_router import TranslatorRouter
+
+
+class DelayStubService(StubService):
+    """
+    Stub service answering after `delay` seconds, or failing every text when `failing`.
+    """
+    def __init__(self, config, delay=0.0, failing=False) -> None:
+        super().__init__(config)
+        self.delay = delay
+        self.failing = failing
+        self.lock = threading.Lock()
+
+    def translate_multi(self, texts, dstlangs):
+        time.sleep(self.delay)
+        with self.lock:
+            results = super().translate_multi(texts, dstlangs)
+        if self.failing:
+            raise ConnectionError("service unavailable")
+        return results
+
+
+def make_router(services, **overrides):
+    """
+    Returns a router between the given {name: service} backends, sharing one configuration.
+    """
+    config = make_config(**{"route_batch": 2, "hedge": False, "workers": 1, **overrides})
+    for service in services.values():
+        service.config = config
+    return TranslatorRouter(services)
+
+
+def test_batches_go_to_the_fastest_backend():
+    """
+    Test that, once both backends were tried, the batches go to the faster one.
+    """
+    slow, fast = DelayStubService(make_config(), 0.05), DelayStubService(make_config(), 0.0)
+    router = make_router({"slow": slow, "fast": fast})
+
+    texts = [f"text {chr(97 + index)}" for index in range(20)]
+    results = router.translate_multi(texts, ["es"])
+
+    assert [translation["msgstr"] for translation in results["es"]] == [f"es:{text}" for text in texts]
+    assert (len(slow.calls), len(fast.calls)) == (1, 9)
+    stats = router.routing_stats()
+    assert stats["fast"]["batches"] == 9 and stats["slow"]["p50_seconds"] >= 0.05
+
+
+def test_failing_backend_is_avoided():
+    """
+    Test that a backend failing its batches stops being routed to, without losing the texts it failed.
+    """
+    failing, healthy = DelayStubService(make_config(), failing=True), DelayStubService(make_config(), 0.01)
+    router = make_router({"failing": failing, "healthy": healthy})
+
+    texts = [f"text {chr(97 + index)}" for index in range(10)]
+    results = router.translate_multi(texts, ["es"])
+
+    assert len(failing.calls) == 1
+    assert len(results["es"]) == 8
+    assert router.routing_stats()["failing"]["error_rate"] == 1.0
+
+
+def test_slow_batch_is_hedged():
+    """
+    Test that a batch outlasting the p95 latency of its backend is sent to the other backend, whose answer wins.
+    """
+    primary, secondary = DelayStubService(make_config(), 0.01), DelayStubService(make_config(), 0.01)
+    router = make_router({"primary": primary, "secondary": secondary}, hedge=True)
+    # Enough history on the primary for its p95, and the secondary measured slower
+    for _ in range(5):
+        router.send(router.backends[0], ["warm"], ["es"])
+    router.send(router.backends[1], ["warm"], ["es"])
+    router.backends[1].record(1.0, 1, 1, 0)
+    for backend in router.backends:
+        backend.last_chosen = time.monotonic()
+
+    primary.delay = 0.5
+    results = router.translate_multi(["Open", "Close"], ["es"])
+    router.close()
+
+    assert [translation["msgstr"] for translation in results["es"]] == ["es:Open", "es:Close"]
+    stats = router.routing_stats()
+    assert (stats["secondary"]["hedges"], stats["secondary"]["hedges_won"]) == (1, 1)
+
+
+def test_factory_builds_a_router(monkeypatch):
+    """
+    Test that --route creates one service per backend, each with its own API key when the environment sets one.
+    """
+    monkeypatch.setenv("CHATGPT_API_KEY", "openai-key")
+    args = build_parser().parse_args(["--backend", "azure", "--route", "chatgpt,azure", "--apikey", "azure-key",
+                                      "--file", "es.po", "--dstlang", "es", "--no-tm"])
+    router = TranslatorFactory().create_translator(args)
+
+    assert [(backend.name, backend.service.config.apikey) for backend in router.backends] == [
+        ("azure", "azure-key"), ("chatgpt", "openai-key")
+    ]
+    router.close()
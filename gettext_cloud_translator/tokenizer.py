@@ -0,0 +1,55 @@
+import math
+import re
+
+###############################################################################
+
+WORD = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+###############################################################################
+
+class TokenEstimator:
+    """
+    Offline token count estimate that needs no tokenizer tables: every
+    punctuation mark counts as a token and every word as one token per four
+    characters, which is close to the BPE tokenizers the OpenAI models use
+    for Latin scripts and errs on the high side for the others.
+    """
+
+    def count(self, text):
+        return sum(math.ceil(len(word) / 4) for word in WORD.findall(text))
+    # count
+# TokenEstimator
+
+###############################################################################
+
+class TiktokenCounter:
+    """Exact token counts with the tiktoken encoding of the model, when tiktoken is installed."""
+
+    def __init__(self, model) -> None:
+        try:
+            import tiktoken  # pylint: disable=C0415
+        except ImportError as e:
+            raise ValueError("The tiktoken tokenizer requires the tiktoken package: pip install tiktoken") from e
+        try:
+            self.encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            self.encoding = tiktoken.get_encoding("cl100k_base")
+    # __init__
+
+    ###########################################################################
+
+    def count(self, text):
+        return len(self.encoding.encode(text))
+    # count
+# TiktokenCounter
+
+###############################################################################
+
+def create_tokenizer(name, model):
+    """Returns the token counter selected with --tokenizer."""
+    if name == "tiktoken":
+        return TiktokenCounter(model)
+    if name == "estimate":
+        return TokenEstimator()
+    raise ValueError(f"Unknown tokenizer: {name}")
+# create_tokenizer
@@ -0,0 +1,136 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+###############################################################################
+
+DEFAULT_TM_FILE = os.path.join(
+    os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+    "gettext-cloud-translator",
+    "memory.sqlite3"
+)
+
+###############################################################################
+
+class TranslationMemory:
+    """
+    A persistent, size-bounded translation memory backed by SQLite.
+
+    Entries are keyed by backend, model, source language, target language
+    and a hash of the normalized source text, so the same string is only
+    paid for once across runs and catalogs.
+    """
+
+    def __init__(self, path, backend, model="", srclang="", readonly=False, max_entries=1000000) -> None:
+        self.path = path
+        self.backend = backend
+        self.model = model or ""
+        self.srclang = srclang
+        self.readonly = readonly
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        if readonly:
+            self.connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS memory ("
+                " backend TEXT NOT NULL, model TEXT NOT NULL, srclang TEXT NOT NULL, dstlang TEXT NOT NULL,"
+                " digest TEXT NOT NULL, msgstr TEXT NOT NULL, used REAL NOT NULL,"
+                " PRIMARY KEY (backend, model, srclang, dstlang, digest))"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS memory_used ON memory (used)")
+            self.connection.commit()
+    # __init__
+
+    ###########################################################################
+
+    @classmethod
+    def from_config(cls, config, backend, model=""):
+        """Opens the memory configured in `config`, or returns None when it is disabled."""
+        if config.tm_mode == "off":
+            return None
+        readonly = config.tm_mode == "readonly"
+        if readonly and not os.path.exists(config.tm_file):
+            logging.warning("Translation memory %s does not exist, running without it", config.tm_file)
+            return None
+        return cls(config.tm_file, backend, model, config.srclang, readonly, config.tm_max_entries)
+    # from_config
+
+    ###########################################################################
+
+    @staticmethod
+    def digest(text):
+        """Hashes the normalized form of a source text."""
+        return hashlib.sha256(unicodedata.normalize("NFC", text).encode("utf-8")).hexdigest()
+    # digest
+
+    ###########################################################################
+
+    def lookup(self, texts, dstlang):
+        """Returns a {text: translation} dict for the texts found in the memory."""
+        found = {}
+        with self.lock:
+            for text in texts:
+                row = self.connection.execute(
+                    "SELECT msgstr FROM memory"
+                    " WHERE backend = ? AND model = ? AND srclang = ? AND dstlang = ? AND digest = ?",
+                    (self.backend, self.model, self.srclang, dstlang, self.digest(text))
+                ).fetchone()
+                if row:
+                    found[text] = row[0]
+            self.hits += len(found)
+            self.misses += len(texts) - len(found)
+
+            if found and not self.readonly:
+                now = time.time()
+                self.connection.executemany(
+                    "UPDATE memory SET used = ?"
+                    " WHERE backend = ? AND model = ? AND srclang = ? AND dstlang = ? AND digest = ?",
+                    [(now, self.backend, self.model, self.srclang, dstlang, self.digest(text)) for text in found]
+                )
+                self.connection.commit()
+        return found
+    # lookup
+
+    ###########################################################################
+
+    def store(self, translations, dstlang):
+        """Stores a {text: translation} dict, evicting the least recently used entries if needed."""
+        if self.readonly or not translations:
+            return
+        now = time.time()
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO memory (backend, model, srclang, dstlang, digest, msgstr, used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (self.backend, self.model, self.srclang, dstlang, self.digest(text), msgstr, now)
+                    for text, msgstr in translations.items()
+                ]
+            )
+            count = self.connection.execute("SELECT COUNT(*) FROM memory").fetchone()[0]
+            if count > self.max_entries:
+                self.connection.execute(
+                    "DELETE FROM memory WHERE rowid IN (SELECT rowid FROM memory ORDER BY used LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+                logging.info("Evicted %i entries from the translation memory", count - self.max_entries)
+            self.connection.commit()
+    # store
+
+    ###########################################################################
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+    # close
+# TranslationMemory
@@ -0,0 +1,99 @@
+import logging
+
+###############################################################################
+
+class TranslationPlan:
+    """
+    Collects the pending entries of every catalog in a run and reduces them to
+    unique (text, srclang, dstlang) keys, so each key is translated exactly
+    once and the result is fanned back out to every entry that needs it.
+    """
+
+    def __init__(self, srclang) -> None:
+        self.srclang = srclang
+        self.entries = {}
+        self.pending_entries = 0
+    # __init__
+
+    ###########################################################################
+
+    def add_catalog(self, path, po_index, dstlang):
+        """Adds the msgid -> entries index of one catalog to the plan."""
+        for msgid, entries in po_index.items():
+            key = (msgid, self.srclang, dstlang)
+            self.entries.setdefault(key, []).extend((path, entry) for entry in entries)
+            self.pending_entries += len(entries)
+    # add_catalog
+
+    ###########################################################################
+
+    def groups(self):
+        """
+        Groups the unique texts by the set of target languages that need them,
+        so each text is extracted once for all of its targets. Returns a
+        {(dstlang, ...): [text, ...]} dict, texts in first-seen order.
+        """
+        dstlangs = {}
+        for (text, _, dstlang) in self.entries:
+            dstlangs.setdefault(text, []).append(dstlang)
+        groups = {}
+        for text, targets in dstlangs.items():
+            groups.setdefault(tuple(sorted(targets)), []).append(text)
+        return groups
+    # groups
+
+    ###########################################################################
+
+    def catalog_texts(self):
+        """
+        Returns the pending texts as they would be sent without the plan, one
+        per entry, as a {(path, dstlang): [text, ...]} dict.
+        """
+        texts = {}
+        for (text, _, dstlang), entries in self.entries.items():
+            for path, _ in entries:
+                texts.setdefault((path, dstlang), []).append(text)
+        return texts
+    # catalog_texts
+
+    ###########################################################################
+
+    def fan_out(self, translated_texts, dstlang=None):
+        """
+        Applies the translated texts to every entry waiting for them. Returns a
+        {path: number of entries updated} dict. Without `dstlang`, the target
+        language of each result is taken from its "dstlang" key. Translations
+        of a similar string are flagged fuzzy, with that string as the previous
+        msgid, as msgmerge does.
+        """
+        updated = {}
+        for translation in translated_texts:
+            if not translation["msgstr"]:
+                logging.warning("No original text found for index %s", translation["msgid"])
+                continue
+            key = (translation["msgid"], self.srclang, dstlang or translation["dstlang"])
+            for path, entry in self.entries.get(key, []):
+                logging.debug("Applying to %s", entry.msgid)
+                entry.msgstr = translation["msgstr"]
+                if translation.get("fuzzy") is not None:
+                    entry.previous_msgid = translation["fuzzy"]
+                    if "fuzzy" not in entry.flags:
+                        entry.flags.append("fuzzy")
+                updated[path] = updated.get(path, 0) + 1
+        return updated
+    # fan_out
+
+    ###########################################################################
+
+    def resolve(self, translated_texts, dstlang):
+        """
+        Applies translations obtained outside the plan, e.g. from a checkpoint,
+        and drops their keys so they are not planned again.
+        """
+        updated = self.fan_out(translated_texts, dstlang)
+        for translation in translated_texts:
+            if translation["msgstr"]:
+                self.entries.pop((translation["msgid"], self.srclang, dstlang), None)
+        return updated
+    # resolve
+# TranslationPlan
@@ -1,9 +1,20 @@
-import traceback
-import requests
+import logging
+import threading
 import uuid
 
+from functools import partial
+
+from async_service import AsyncTranslatorService, BatchScheduler
+from batching import BatchFeed, BatchSizeController, join_fragments, pack_batches, split_text
+from rate_limiter import RateLimiter, RetryableError, ThrottledError, parse_retry_after
 from translator_service import TranslatorService
-from rich.pretty import pprint
+from translation_memory import TranslationMemory
+from fuzzy_index import FuzzyIndex
+
+################################################################################
+
+# Characters Azure accepts in one request, counted once per target language
+MAX_REQUEST_CHARS = 50000
 
 ################################################################################
 
@@ -12,11 +23,11 @@ class TranslatorAzure(TranslatorService):
         self.config = config        
 
         path = '/translate'
-        self.constructed_url = 'https://api.cognitive.microsofttranslator.com' + path
+        endpoint = self.config.endpoint or 'https://api.cognitive.microsofttranslator.com'
+        self.constructed_url = endpoint.rstrip('/') + path
         self.params = {
             'api-version': '3.0',
             'from': self.config.srclang,
-            'to': self.config.dstlang,
             'textType': 'html'
         }
         self.headers = {
@@ -26,80 +37,404 @@ class TranslatorAzure(TranslatorService):
             'Content-type': 'application/json',
             'X-ClientTraceId': str(uuid.uuid4())
         }            
+        if not self.config.keepalive:
+            self.headers['Connection'] = 'close'
+        self.timeout = (self.config.connect_timeout, self.config.read_timeout)
+        self.session = None
+        self.adapter = None
+        self.lock = threading.Lock()
+        self.limiter = RateLimiter.from_config(self.config)
+        self.memory = TranslationMemory.from_config(self.config, "azure")
+        self.fuzzy_index = FuzzyIndex.from_config(self.config)
+        if self.config.adaptive_batch:
+            self.batch_size = BatchSizeController("azure", self.config.bulksize)
     # __init__
 
     ###########################################################################
 
-    def translate_one_by_one(self, texts_to_translate):
+    def get_session(self):
+        """
+        Returns the HTTP session, importing requests and creating the session
+        on the first request, so runs with nothing to translate pay for neither.
+        """
+        with self.lock:
+            if self.session is None:
+                from http_session import create_session  # pylint: disable=C0415
+                self.session, self.adapter = create_session(self.config.pool_size)
+            return self.session
+    # get_session
+
+    ###########################################################################
+
+    def check(self):
+        """Checks the endpoint, the key and the region by translating an empty text, which bills no characters."""
         try:
-            translated_texts = []
-            for msgid in texts_to_translate:
-                body = []
-                body.append({
-                    'text': msgid
-                })
+            self.post_batch([{'text': ''}], [self.config.dstlang])
+        except Exception as e:  # pylint: disable=W0718
+            logging.error("Azure check failed for %s: %s", self.constructed_url, e)
+            return False
+        logging.info("Azure connection checked")
+        return True
+    # check
+
+    ###########################################################################
+
+    def connection_stats(self):
+        """Returns how many requests were sent and how many connections were opened for them."""
+        return self.adapter.stats() if self.adapter is not None else None
+    # connection_stats
+
+    ###########################################################################
+
+    def post_batch(self, body, dstlangs):
+        """
+        Sends one request translating the body into every language in
+        `dstlangs`. Returns its results in the {"msgid", "msgstr", "dstlang"} form.
+        """
+        import requests  # pylint: disable=C0415
+
+        params = dict(self.params, to=list(dstlangs))
+        try:
+            request = self.get_session().post(
+                self.constructed_url, params=params, headers=self.headers, json=body, timeout=self.timeout
+            )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise RetryableError(str(e)) from e
+
+        self.check_status(request.status_code, request.headers)
+        request.raise_for_status()
+        return self.parse_response(request.json(), body, dstlangs)
+    # post_batch
+
+    ###########################################################################
+
+    def check_status(self, status_code, headers):
+        """Raises the retryable errors for a throttled (429) or failed (5xx) response."""
+        retry_after = parse_retry_after(headers.get('Retry-After'))
+        if status_code == 429:
+            raise ThrottledError("HTTP 429 Too Many Requests", retry_after)
+        if status_code >= 500:
+            raise RetryableError(f"HTTP {status_code}", retry_after)
+    # check_status
+
+    ###########################################################################
 
-                request = requests.post(self.constructed_url, params=self.params, headers=self.headers, json=body)
-                response = request.json()
-                        
+    def parse_response(self, response, body, dstlangs):
+        """Returns the translations of a response in the {"msgid", "msgstr", "dstlang"} form."""
+        translated_texts = []
+        for translation, original in zip(response, body):
+            for dstlang, target in zip(dstlangs, translation['translations']):
                 translated_texts.append({
-                    "msgid": msgid,
-                    "msgstr": response[0]['translations'][0]['text']
+                    "msgid": original['text'],
+                    "msgstr": target['text'],
+                    "dstlang": dstlang
                 })
-            # for
-                    
-            return translated_texts
+        # for
+        return translated_texts
+    # parse_response
 
-        except Exception as e:  # pylint: disable=W0718
-            pprint(e)
-            traceback.print_stack()            
-            return []
+    ###########################################################################
+
+    def translate_targets(self, texts_to_translate, dstlangs, bulk):
+        """
+        Translates the texts into every language in `dstlangs`, sending each
+        text once with all the targets it still misses in the translation
+        memory. Returns a {dstlang: results} dict.
+        """
+        results, groups = self.group_targets(texts_to_translate, dstlangs)
+        for targets, texts in groups.items():
+            split, fragments = self.fragment(texts, len(targets))
+            if bulk and self.batch_size is not None:
+                batches = self.adaptive_batches(fragments, len(targets))
+            elif bulk:
+                batches = self.bulk_batches(fragments, len(targets))
+            else:
+                batches = [[{'text': fragment}] for fragment in fragments]
+            try:
+                translated_texts = self.run_batches(
+                    partial(self.post_batch, dstlangs=targets), batches, partial(self.body_chars, targets=targets)
+                )
+            except Exception as e:  # pylint: disable=W0718
+                logging.error("Error translating %i texts into %s: %s", len(texts), ", ".join(targets), e)
+                continue
+            self.assemble(texts, split, translated_texts, targets, results)
+        return results
+    # translate_targets
+
+    ###########################################################################
+
+    def group_targets(self, texts_to_translate, dstlangs):
+        """
+        Looks the texts up in the translation memory for every language in
+        `dstlangs`. Returns the {dstlang: results} dict of the translations
+        found, and the texts still missing grouped by the tuple of languages
+        they miss, so each is sent once with all of them.
+        """
+        results = {dstlang: [] for dstlang in dstlangs}
+        missing = {}
+        for dstlang in dstlangs:
+            cached, remaining = self.recall(texts_to_translate, dstlang)
+            results[dstlang].extend(cached)
+            for msgid in remaining:
+                missing.setdefault(msgid, []).append(dstlang)
+
+        groups = {}
+        for msgid, targets in missing.items():
+            groups.setdefault(tuple(targets), []).append(msgid)
+        return results, groups
+    # group_targets
+
+    ###########################################################################
+
+    def assemble(self, texts, split, translated_texts, targets, results):
+        """
+        Joins the translated fragments of the texts back per language, stores
+        them in the translation memory and adds them to `results`.
+        """
+        translated = {(translation["msgid"], translation["dstlang"]): translation["msgstr"]
+                      for translation in translated_texts}
+        for dstlang in targets:
+            translations = []
+            for msgid in texts:
+                parts = [translated.get((fragment, dstlang)) for fragment in split.get(msgid, [msgid])]
+                if None not in parts:
+                    translations.append({
+                        "msgid": msgid,
+                        "msgstr": join_fragments(split[msgid], parts) if msgid in split else parts[0],
+                        "dstlang": dstlang
+                    })
+            self.remember(translations, dstlang)
+            results[dstlang].extend(translations)
+    # assemble
+
+    ###########################################################################
+
+    def body_chars(self, body, targets):
+        """Returns the characters a request body is billed for."""
+        return sum(len(item['text']) for item in body) * len(targets)
+    # body_chars
+
+    ###########################################################################
+
+    def translate_multi(self, texts, dstlangs):
+        return self.translate_targets(texts, dstlangs, self.config.bulk)
+    # translate_multi
+
+    ###########################################################################
+
+    def translate_one_by_one(self, texts_to_translate, dstlang=None):
+        dstlang = dstlang or self.config.dstlang
+        return self.translate_targets(texts_to_translate, [dstlang], bulk=False)[dstlang]
     # translate_one_by_one
 
     ###########################################################################
 
-    def translate_in_bulk(self, texts_to_translate):
+    def fragment(self, texts_to_translate, targets=1):
+        """
+        Splits the texts too long for a single request. Returns a {msgid: fragments}
+        dict of the texts that were split, and the list of texts and fragments to send.
+        """
+        limit = MAX_REQUEST_CHARS // targets
+        split = {msgid: split_text(msgid, limit) for msgid in texts_to_translate if len(msgid) > limit}
+        fragments = [fragment for msgid in texts_to_translate for fragment in split.get(msgid, [msgid])]
+        return split, fragments
+    # fragment
+
+    ###########################################################################
+
+    def bulk_batches(self, texts_to_translate, targets=1, max_chars=None, sort_by_length=None):
+        """
+        Packs the texts into request bodies within the configured character,
+        element-count and body size limits. The character limit counts every
+        text once per target language.
+        """
+        batches = pack_batches(
+            texts_to_translate, max_chars or self.config.bulksize, self.config.batch_elements,
+            self.config.batch_bytes, self.config.sort_by_length if sort_by_length is None else sort_by_length,
+            targets
+        )
+        return [[{'text': texts_to_translate[index]} for index in batch] for batch in batches]
+    # bulk_batches
+
+    ###########################################################################
+
+    def adaptive_batches(self, texts_to_translate, targets=1):
+        """
+        Returns a feed packing the texts in order as they are sent, each body
+        within the character limit the batch size controller allows then.
+        With --sort-by-length, the texts are sent longest first.
+        """
+        if self.config.sort_by_length:
+            texts_to_translate = sorted(texts_to_translate, key=len, reverse=True)
+        return BatchFeed(
+            texts_to_translate,
+            lambda window, limit: self.bulk_batches(window, targets, limit, sort_by_length=False)[0],
+            self.config.batch_elements, self.batch_size
+        )
+    # adaptive_batches
+
+    ###########################################################################
+
+    def estimate_requests(self, texts, targets=1):
+        _, fragments = self.fragment(texts, targets)
+        if not self.config.bulk:
+            return len(fragments)
+        return len(self.bulk_batches(fragments, targets))
+    # estimate_requests
+
+    ###########################################################################
+
+    def translate_in_bulk(self, texts_to_translate, dstlang=None):
+        dstlang = dstlang or self.config.dstlang
+        return self.translate_targets(texts_to_translate, [dstlang], bulk=True)[dstlang]
+    # translate_in_bulk
+# TranslatorAzure
+################################################################################
+
+class AsyncTranslatorAzure(AsyncTranslatorService):
+    """
+    The Azure backend on an httpx.AsyncClient. Request building, batch
+    packing, the translation memory and the rate limiter are those of a
+    TranslatorAzure; only the requests differ.
+    """
+
+    # Exceptions of the HTTP client retried as transient, set with the client
+    transport_errors = ()
+
+    def __init__(self, config) -> None:
+        self.config = config
+        self.backend = TranslatorAzure(config)
+        self.memory = self.backend.memory
+        self.fuzzy_index = self.backend.fuzzy_index
+        self.limiter = self.backend.limiter
+        self.client = None
+    # __init__
+
+    ###########################################################################
+
+    def get_client(self):
+        """Returns the HTTP client, creating it on the first request with a pool of --pool-size connections."""
+        if self.client is None:
+            import httpx  # pylint: disable=C0415
+            self.transport_errors = (httpx.TransportError,)
+            keepalive = self.config.pool_size if self.config.keepalive else 0
+            self.client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.config.pool_size, max_keepalive_connections=keepalive),
+                timeout=httpx.Timeout(self.config.read_timeout, connect=self.config.connect_timeout)
+            )
+        return self.client
+    # get_client
+
+    ###########################################################################
+
+    async def post(self, body, dstlangs):
+        """Sends one request translating the body into every language in `dstlangs`."""
+        params = dict(self.backend.params, to=list(dstlangs))
+        client = self.get_client()
         try:
-            char_count = 0
-            total_texts = len(texts_to_translate)
-            translated_texts = []
-            body = []
-            i = 0
-            j = 0
-
-            for msgid in texts_to_translate:
-                i = i + 1
-                j = j + 1
-                body.append({
-                    'text': msgid
-                })
-                char_count = char_count + len(msgid)
-                if char_count > 49500 or i + 1 > total_texts or j + 1 > 1000:
-                    request = requests.post(self.constructed_url, params=self.params, headers=self.headers, json=body)
-                    response = request.json()
-
-                    print("*********************************************************")
-                    pprint(response)
-                    print("*********************************************************")
-
-                    for translation, original in zip(response, body):
-                        translated_texts.append({
-                            "msgid": original['text'],
-                            "msgstr": translation['translations'][0]['text']
-                        })
-                    # for
-
-                    body = []
-                    char_count = 0
-                    j = 0
-                # if
-            # for
-
-            return translated_texts
+            request = await client.post(
+                self.backend.constructed_url, params=params, headers=self.backend.headers, json=body
+            )
+        except self.transport_errors as e:
+            raise RetryableError(str(e)) from e
+        self.backend.check_status(request.status_code, request.headers)
+        request.raise_for_status()
+        return self.backend.parse_response(request.json(), body, dstlangs)
+    # post
+
+    ###########################################################################
 
+    async def check(self):
+        """Checks the endpoint, the key and the region by translating an empty text, which bills no characters."""
+        try:
+            await self.post([{'text': ''}], [self.config.dstlang])
         except Exception as e:  # pylint: disable=W0718
-            pprint(e)
-            traceback.print_stack()
-            return []
-    # translate_in_bulk
-# TranslatorAzure
\ No newline at end of file
+            logging.error("Azure check failed for %s: %s", self.backend.constructed_url, e)
+            return False
+        return True
+    # check
+
+    ###########################################################################
+
+    def estimate_requests(self, texts, targets=1):
+        return self.backend.estimate_requests(texts, targets)
+    # estimate_requests
+
+    ###########################################################################
+
+    def plan_batches(self, texts, dstlang=None, bulk=None):
+        """Packs the texts within the Azure request limits in bulk mode, one per request otherwise."""
+        bulk = self.config.bulk if bulk is None else bulk
+        if not bulk:
+            return [[text] for text in texts]
+        return [[item['text'] for item in body] for body in self.backend.bulk_batches(texts)]
+    # plan_batches
+
+    ###########################################################################
+
+    async def translate_batch(self, texts, dstlang=None):
+        """
+        Translates one batch. A text too long for a single request, which
+        plan_batches() leaves alone in its batch, is split, sent in several
+        requests and reassembled.
+        """
+        dstlang = dstlang or self.config.dstlang
+        split, fragments = self.backend.fragment(texts)
+        if not split:
+            return await self.post([{'text': text} for text in texts], [dstlang])
+
+        translated = {}
+        for body in self.backend.bulk_batches(fragments):
+            for translation in await self.post(body, [dstlang]):
+                translated[translation["msgid"]] = translation["msgstr"]
+        translated_texts = []
+        for msgid in texts:
+            parts = [translated.get(fragment) for fragment in split.get(msgid, [msgid])]
+            if None not in parts:
+                msgstr = join_fragments(split[msgid], parts) if msgid in split else parts[0]
+                translated_texts.append({"msgid": msgid, "msgstr": msgstr, "dstlang": dstlang})
+        return translated_texts
+    # translate_batch
+
+    ###########################################################################
+
+    async def translate_multi(self, texts, dstlangs, bulk=None, scheduler=None):
+        """
+        Translates the texts into every language in `dstlangs` as
+        TranslatorAzure.translate_targets() does, each text sent once with all
+        the targets it misses in the translation memory, the requests going
+        through one scheduler. Returns a {dstlang: results} dict.
+        """
+        bulk = self.config.bulk if bulk is None else bulk
+        scheduler = scheduler or BatchScheduler(self.config.workers)
+        results, groups = self.backend.group_targets(texts, dstlangs)
+        plans = []
+        for targets, group in groups.items():
+            split, fragments = self.backend.fragment(group, len(targets))
+            if bulk:
+                bodies = self.backend.bulk_batches(fragments, len(targets))
+            else:
+                bodies = [[{'text': fragment}] for fragment in fragments]
+            plans.append((targets, group, split, bodies))
+
+        sent = await scheduler.run([
+            partial(self.send_request, partial(self.post, dstlangs=targets), body,
+                    self.backend.body_chars(body, targets))
+            for targets, _, _, bodies in plans for body in bodies
+        ])
+        offset = 0
+        for targets, group, split, bodies in plans:
+            translated_texts = [translation for result in sent[offset:offset + len(bodies)] for translation in result]
+            offset += len(bodies)
+            self.backend.assemble(group, split, translated_texts, targets, results)
+        return results
+    # translate_multi
+
+    ###########################################################################
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+    # aclose
+# AsyncTranslatorAzure
@@ -1,135 +1,441 @@
+import json
 import logging
-import time
+import math
+import threading
 
+from functools import partial
+
+from async_service import AsyncTranslatorService
+from batching import BatchFeed, BatchSizeController, pack_weights
+from rate_limiter import RateLimiter, RetryableError, ThrottledError, parse_retry_after
+from tokenizer import create_tokenizer
 from translator_service import TranslatorService
-from openai import OpenAI
+from translation_memory import TranslationMemory
+from fuzzy_index import FuzzyIndex
+
+################################################################################
+
+# Replies the model gives when it refuses to translate a text
+INVALID_TRANSLATION = "The provided text does not seem to be"
+
+# Rounds of re-requests for the indices missing from, or malformed in, a reply
+MAX_REPAIR_ROUNDS = 2
+
+# Expected tokens of a translation per source token, and JSON tokens around
+# every text in the request and in the reply
+OUTPUT_RATIO = 1.5
+ITEM_TOKENS = 6
+
+# Share of the output limit a batch is planned to fill, leaving room for
+# translations longer than expected
+OUTPUT_MARGIN = 0.8
+
+################################################################################
+
+def keep_edge_whitespace(text, translation):
+    """
+    Returns a plain reply with the leading and trailing whitespace of the
+    source text instead of its own, which msgfmt --check expects to match.
+    """
+    leading = text[:len(text) - len(text.lstrip())]
+    trailing = text[len(text.rstrip()):]
+    return leading + translation.strip() + trailing
+# keep_edge_whitespace
 
 ################################################################################
 
 class TranslatorChatGPT(TranslatorService):
     def __init__(self, config) -> None:
         self.config = config
-        self.client = OpenAI(api_key=self.config.apikey)
-
-        # Validate the OpenAI connection
-        if not self.validate_openai_connection():
-            logging.error("OpenAI connection failed. Please check your API key and network connection.")
-            exit()
+        self.client = None
+        self.limiter = RateLimiter.from_config(self.config)
+        self.memory = TranslationMemory.from_config(self.config, "chatgpt", self.config.model)
+        self.fuzzy_index = FuzzyIndex.from_config(self.config)
+        self.tokenizer = create_tokenizer(self.config.tokenizer, self.config.model)
+        self.usage = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        self.lock = threading.Lock()
+        if self.config.adaptive_batch:
+            self.batch_size = BatchSizeController("chatgpt", self.config.max_request_tokens)
     # __init__
 
     ###########################################################################
 
-    def validate_openai_connection(self):
-        """Validates the OpenAI connection by making a test API call."""
+    def get_client(self):
+        """
+        Returns the OpenAI client, importing the SDK and creating the client
+        on the first request, so runs with nothing to translate pay for neither.
+        """
+        with self.lock:
+            if self.client is None:
+                from openai import OpenAI  # pylint: disable=C0415
+                # Retries are left to the rate limiter, which honors Retry-After
+                self.client = OpenAI(api_key=self.config.apikey, base_url=self.config.endpoint, max_retries=0)
+            return self.client
+    # get_client
+
+    ###########################################################################
+
+    def check(self):
+        """Checks the API key and the model by retrieving the model, which is not billed."""
         try:
-            test_message = {"role": "system", "content": "Test message to validate connection."}
-            self.client.chat.completions.create(model=self.config.model, messages=[test_message])
-            logging.info("OpenAI connection validated successfully.")
-            return True
+            self.get_client().models.retrieve(self.config.model)
         except Exception as e:  # pylint: disable=W0718
-            logging.error("Failed to validate OpenAI connection: %s", e)
-            return False    
-    # validate_openai_connection
-
-    ###########################################################################
-
-    def translate(self, text: str, src: str, dst: str) -> str:
-        pass
-    # translate
-
-    #def translate_bulk(self, texts, target_language, po_file_path, current_batch):
-    def translate_bulk(self, text) -> str:
-        return
-        """Translates a list of texts in bulk and handles retries."""
-        translated_texts = []
-        for i, _ in enumerate(range(0, len(texts), self.config.batch_size), start=current_batch):
-            batch_texts = texts[i:i + self.config.batch_size]
-            batch_info = f"File: {po_file_path}, Batch {i}/{self.config.total_batches}"
-            batch_info += f" (texts {i + 1}-{min(i + self.config.batch_size, len(texts))})"
-            translation_request = (f"Translate the following texts from {self.config.source_language} into {target_language}. "
-                                   "Use the format 'Index: Text' for each segment:\n\n")
-            for index, text in enumerate(batch_texts, start=i * self.batch_size):
-                translation_request += f"{index}: {text}\n"
-
-            retries = 3
-
-            while retries:
-                try:
-                    if self.config.bulk:
-                        logging.info("Translating %s", batch_info)
-                    self.perform_translation(translation_request, translated_texts, batch=True)
-                    break
-                except Exception as e:  # pylint: disable=W0718
-                    error_message = f"Error in translating {batch_info}: {e}. Retrying... {retries - 1} attempts left."
-                    logging.error(error_message)
-                    if retries <= 1:
-                        logging.error("Maximum retries reached for %s. Skipping this batch.", batch_info)
-                        translated_texts.extend([''] * len(batch_texts))
-                    retries -= 1
-                    time.sleep(1)
-
-        logging.debug("Translated texts: %s", translated_texts)
-        return translated_texts
-    # translate_bulk
-
-    ###########################################################################
-
-    def perform_translation(self, translation_request, translated_texts, batch=False):
-        """Takes a translation request and appends the translated texts to the translated_texts list."""
-        translated_texts = []
-
-        message = {"role": "user", "content": translation_request}
-        logging.debug("Translation request: %s", translation_request)
-        completion = self.client.chat.completions.create(model=self.config.model, messages=[message])
-
-        raw_response = completion.choices[0].message.content.strip()
-        logging.info("Raw API response: %s", raw_response)
-
-        if batch:
-            for line in raw_response.split("\n"):
-                try:
-                    index_str, translation = line.split(": ", 1)
-                    index = int(index_str.strip())
-                    translation = translation.strip()
-                    if translation and not translation.startswith("The provided text does not seem to be"):
-                        translated_texts.append((index, translation))
-                    else:
-                        logging.error("No valid translation found for index %s", index)
-                        translated_texts.append((index, ''))
-                except ValueError:  # pylint: disable=W0718
-                    logging.error("Error parsing line: '%s'", line)
-                    translated_texts.append((index, ''))
-        else:
-            if not raw_response.startswith("The provided text does not seem to be"):
-                translated_texts.append((0, raw_response))
-            else:
-                logging.error("No valid translation found for text")
-                translated_texts.append((0, ''))
-    # perform_translation
-
-    ###########################################################################
-
-    def translate_one_by_one(self, texts_to_translate):
-        """Translates texts one by one and updates the .po file."""
-        translated_texts = []
-        for index, text in enumerate(texts_to_translate):
-            logging.info("Translating text %s/%s", (index + 1), len(texts_to_translate))
-            translation_request = f"Translate the following text from {self.config.srclang} into {self.config.dstlang}: {text}"            
-            result = self.service.perform_translation(translation_request)
-            if result:
-                translated_texts.append({
-                    "msgid": text,
-                    "msgstr": result[0][1]
-                })
-            else:
-                logging.error("No translation returned for text: %s", text)
+            logging.error("OpenAI check failed for model %s: %s", self.config.model, e)
+            return False
+        logging.info("OpenAI connection and model %s checked", self.config.model)
+        return True
+    # check
+
+    ###########################################################################
+
+    def complete(self, messages, json_output=False):
+        """
+        Requests one chat completion and returns its content, as is, and
+        token usage. Throttling and transient errors are raised as the rate
+        limiter's retryable errors.
+        """
+        import openai  # pylint: disable=C0415
+
+        kwargs = {"response_format": {"type": "json_object"}} if json_output else {}
+        try:
+            completion = self.get_client().chat.completions.create(
+                model=self.config.model, messages=messages, **kwargs
+            )
+        except openai.RateLimitError as e:
+            raise ThrottledError(str(e), parse_retry_after(e.response.headers.get("retry-after"))) from e
+        except (openai.APIConnectionError, openai.InternalServerError) as e:
+            raise RetryableError(str(e)) from e
+        return completion.choices[0].message.content or "", self.record_usage(completion)
+    # complete
+
+    ###########################################################################
+
+    def record_usage(self, completion):
+        """Adds the tokens a completion used to the totals. Returns them as (prompt, completion), or Nones."""
+        usage = getattr(completion, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        completion_tokens = getattr(usage, "completion_tokens", None)
+        if not isinstance(prompt_tokens, int) or not isinstance(completion_tokens, int):
+            return None, None
+        with self.lock:
+            self.usage["requests"] += 1
+            self.usage["prompt_tokens"] += prompt_tokens
+            self.usage["completion_tokens"] += completion_tokens
+        return prompt_tokens, completion_tokens
+    # record_usage
+
+    ###########################################################################
+
+    def token_stats(self):
+        with self.lock:
+            return dict(self.usage)
+    # token_stats
+
+    ###########################################################################
+
+    def references(self, texts, dstlang):
+        """
+        With --fuzzy-tm context, returns the {source: translation} dict of the
+        strings of the fuzzy index most similar to the texts, to be passed to
+        the model along with them. Returns an empty dict otherwise.
+        """
+        if self.fuzzy_index is None or self.config.fuzzy_tm != "context":
+            return {}
+        return {source: msgstr for source, msgstr, _ in self.fuzzy_index.lookup(texts, dstlang).values()}
+    # references
+
+    ###########################################################################
+
+    def batch_messages(self, texts, dstlang, references=None):
+        """
+        Builds the messages asking for a JSON object that maps each index to
+        its translation, followed by the translations of similar strings, when given.
+        """
+        instructions = (
+            f"You translate software interface strings from {self.config.srclang} into {dstlang}. "
+            "The user sends a JSON object mapping indices to source strings. Reply with a JSON object "
+            "mapping every index to its translation, and nothing else. Keep placeholders such as %s, "
+            "%(name)s and {0}, HTML markup and leading or trailing whitespace unchanged."
+        )
+        messages = [{"role": "system", "content": instructions}]
+        if references:
+            messages.append({"role": "system", "content": (
+                "Earlier translations of similar strings, to keep the terminology consistent: "
+                + json.dumps(references, ensure_ascii=False)
+            )})
+        payload = json.dumps({str(index): text for index, text in texts.items()}, ensure_ascii=False)
+        return messages + [{"role": "user", "content": payload}]
+    # batch_messages
+
+    ###########################################################################
+
+    def parse_batch(self, raw_response, texts):
+        """
+        Parses a reply to batch_messages(). Returns the {index: translation}
+        dict of the valid translations; the missing and malformed ones are left out.
+        """
+        raw_response = raw_response.strip()
+        try:
+            reply = json.loads(raw_response)
+        except ValueError:
+            logging.error("Reply is not valid JSON: %s", raw_response[:200])
+            return {}
+        if not isinstance(reply, dict):
+            logging.error("Reply is not a JSON object: %s", raw_response[:200])
+            return {}
+
+        translations = {}
+        for index in texts:
+            translation = reply.get(str(index))
+            if isinstance(translation, str) and translation.strip() and not translation.startswith(INVALID_TRANSLATION):
+                translations[index] = translation
+        return translations
+    # parse_batch
+
+    ###########################################################################
+
+    def translate_batch(self, texts, dstlang):
+        """
+        Translates a batch of texts with one chat completion, then re-requests
+        only the indices missing from or malformed in the reply. Returns the
+        results in the {"msgid", "msgstr", "dstlang"} form.
+        """
+        pending = dict(enumerate(texts))
+        translations = {}
+        references = self.references(texts, dstlang)
+        for attempt in range(MAX_REPAIR_ROUNDS + 1):
+            raw_response, tokens = self.complete(self.batch_messages(pending, dstlang, references), json_output=True)
+            pending = self.apply_reply(raw_response, pending, translations, tokens)
+            if not pending:
+                break
+            if attempt == 0 and self.batch_size is not None:
+                # Usually a reply cut short by the output limit
+                self.batch_size.shrink(f"{len(pending)} of {len(texts)} translations missing from the reply")
+            if attempt < MAX_REPAIR_ROUNDS:
+                logging.warning("Re-requesting %i of %i translations missing from the reply", len(pending), len(texts))
+        return self.batch_results(texts, translations, pending, dstlang)
+    # translate_batch
+
+    ###########################################################################
+
+    def apply_reply(self, raw_response, pending, translations, tokens):
+        """
+        Adds the valid translations of a batch reply to `translations`.
+        Returns the texts still pending, to be requested again.
+        """
+        logging.debug("Raw API response: %s", raw_response)
+        if tokens[0] is not None:
+            logging.info("Batch of %i texts: %i prompt + %i completion tokens (%i estimated)",
+                         len(pending), tokens[0], tokens[1],
+                         sum(sum(self.text_tokens(text)) for text in pending.values()))
+        translations.update(self.parse_batch(raw_response, pending))
+        return {index: text for index, text in pending.items() if index not in translations}
+    # apply_reply
+
+    ###########################################################################
+
+    def batch_results(self, texts, translations, pending, dstlang):
+        """Returns the translations of a batch in the {"msgid", "msgstr", "dstlang"} form."""
+        if pending:
+            logging.error("No valid translation returned for %i texts", len(pending))
+        return [
+            {"msgid": texts[index], "msgstr": translations[index], "dstlang": dstlang}
+            for index in sorted(translations)
+        ]
+    # batch_results
+
+    ###########################################################################
+
+    def translate_text(self, texts, dstlang):
+        """Translates a batch holding a single text with a plain prompt."""
+        text = texts[0]
+        translation_request = f"Translate the following text from {self.config.srclang} into {dstlang}: {text}"
+        for source, msgstr in self.references(texts, dstlang).items():
+            translation_request += f"\nA similar text, {source}, was translated as: {msgstr}"
+        raw_response, _ = self.complete([{"role": "user", "content": translation_request}])
+        raw_response = raw_response.strip()
+        if not raw_response or raw_response.startswith(INVALID_TRANSLATION):
+            logging.error("No translation returned for text: %s", text)
+            return []
+        return [{"msgid": text, "msgstr": keep_edge_whitespace(text, raw_response), "dstlang": dstlang}]
+    # translate_text
+
+    ###########################################################################
+
+    def translate_one_by_one(self, texts_to_translate, dstlang=None):
+        """Translates texts one by one, one completion per text."""
+        dstlang = dstlang or self.config.dstlang
+        cached, texts_to_translate = self.recall(texts_to_translate, dstlang)
+        batches = [[text] for text in texts_to_translate]
+        translated_texts = self.run_batches(partial(self.translate_text, dstlang=dstlang), batches, self.batch_chars)
+        self.remember(translated_texts, dstlang)
+        return cached + translated_texts
     # translate_one_by_one
 
     ###########################################################################
 
-    def translate_in_bulk(self, texts):
-        """Translates texts in bulk and applies them to the .po file."""
-        self.total_batches = (len(texts) - 1) // 50 + 1
-    #    translated_texts = self.service.translate_bulk(texts)
-    # translate_in_bulk    
-# TranslatorChatGPT    
\ No newline at end of file
+    def text_tokens(self, text):
+        """Estimates the (prompt, expected output) tokens a text adds to a batch."""
+        tokens = self.tokenizer.count(text)
+        return tokens + ITEM_TOKENS, math.ceil(tokens * OUTPUT_RATIO) + ITEM_TOKENS
+    # text_tokens
+
+    ###########################################################################
+
+    def token_batches(self, texts, dstlang, max_tokens=None):
+        """
+        Packs the texts into batches whose estimated prompt and output tokens
+        fit the request budget of the model, or `max_tokens` when smaller,
+        whose expected output fits its output limit, and that hold at most
+        --bulksize texts. The reference translation a text brings along with
+        --fuzzy-tm context counts towards its prompt tokens.
+        """
+        instructions = self.batch_messages({}, dstlang)[0]["content"]
+        budget = min(max_tokens or self.config.max_request_tokens, self.config.max_request_tokens)
+        budget -= self.tokenizer.count(instructions) + ITEM_TOKENS
+        context = self.fuzzy_index is not None and self.config.fuzzy_tm == "context"
+        weights = []
+        for text in texts:
+            prompt_tokens, output_tokens = self.text_tokens(text)
+            match = self.fuzzy_index.match(text, dstlang) if context else None
+            if match is not None:
+                prompt_tokens += self.tokenizer.count(match[0]) + self.tokenizer.count(match[1]) + ITEM_TOKENS
+            weights.append((prompt_tokens + output_tokens, output_tokens))
+        batches = pack_weights(
+            weights, budget, self.config.bulksize, int(self.config.max_output_tokens * OUTPUT_MARGIN)
+        )
+        return [[texts[index] for index in batch] for batch in batches]
+    # token_batches
+
+    ###########################################################################
+
+    def estimate_requests(self, texts, targets=1):
+        if not self.config.bulk:
+            return len(texts) * targets
+        return len(self.token_batches(texts, self.config.dstlang)) * targets
+    # estimate_requests
+
+    ###########################################################################
+
+    def translate_in_bulk(self, texts, dstlang=None):
+        """Translates texts in batches sized by their estimated tokens."""
+        dstlang = dstlang or self.config.dstlang
+        cached, texts = self.recall(texts, dstlang)
+        if self.batch_size is not None:
+            # Batches packed as they are sent, within the tokens the controller allows then
+            batches = BatchFeed(texts, lambda window, limit: self.token_batches(window, dstlang, limit)[0],
+                                self.config.bulksize, self.batch_size)
+            logging.info("Translating %i texts into %s in adaptive batches", len(texts), dstlang)
+        else:
+            batches = self.token_batches(texts, dstlang)
+            logging.info("Translating %i texts into %s in %i batches", len(texts), dstlang, len(batches))
+        translated_texts = self.run_batches(partial(self.translate_batch, dstlang=dstlang), batches, self.batch_chars)
+        self.remember(translated_texts, dstlang)
+        return cached + translated_texts
+    # translate_in_bulk
+
+    ###########################################################################
+
+    def batch_chars(self, texts):
+        return sum(len(text) for text in texts)
+    # batch_chars
+# TranslatorChatGPT
+
+################################################################################
+
+class AsyncTranslatorChatGPT(AsyncTranslatorService):
+    """
+    The ChatGPT backend on the AsyncOpenAI client. Prompts, replies, token
+    accounting, batch planning, the translation memory and the rate limiter
+    are those of a TranslatorChatGPT; only the requests differ.
+    """
+
+    def __init__(self, config) -> None:
+        self.config = config
+        self.backend = TranslatorChatGPT(config)
+        self.memory = self.backend.memory
+        self.fuzzy_index = self.backend.fuzzy_index
+        self.limiter = self.backend.limiter
+        self.client = None
+    # __init__
+
+    ###########################################################################
+
+    def get_client(self):
+        """Returns the AsyncOpenAI client, creating it on the first request."""
+        if self.client is None:
+            from openai import AsyncOpenAI  # pylint: disable=C0415
+            self.client = AsyncOpenAI(api_key=self.config.apikey, base_url=self.config.endpoint, max_retries=0)
+        return self.client
+    # get_client
+
+    ###########################################################################
+
+    async def check(self):
+        """Checks the API key and the model by retrieving the model, which is not billed."""
+        try:
+            await self.get_client().models.retrieve(self.config.model)
+        except Exception as e:  # pylint: disable=W0718
+            logging.error("OpenAI check failed for model %s: %s", self.config.model, e)
+            return False
+        return True
+    # check
+
+    ###########################################################################
+
+    async def complete(self, messages):
+        """Requests one JSON chat completion. Returns its content and token usage."""
+        import openai  # pylint: disable=C0415
+
+        try:
+            completion = await self.get_client().chat.completions.create(
+                model=self.config.model, messages=messages, response_format={"type": "json_object"}
+            )
+        except openai.RateLimitError as e:
+            raise ThrottledError(str(e), parse_retry_after(e.response.headers.get("retry-after"))) from e
+        except (openai.APIConnectionError, openai.InternalServerError) as e:
+            raise RetryableError(str(e)) from e
+        return (completion.choices[0].message.content or "").strip(), self.backend.record_usage(completion)
+    # complete
+
+    ###########################################################################
+
+    async def translate_batch(self, texts, dstlang=None):
+        """Translates a batch with one completion, re-requesting only the indices missing from the reply."""
+        dstlang = dstlang or self.config.dstlang
+        pending = dict(enumerate(texts))
+        translations = {}
+        references = self.backend.references(texts, dstlang)
+        for attempt in range(MAX_REPAIR_ROUNDS + 1):
+            raw_response, tokens = await self.complete(self.backend.batch_messages(pending, dstlang, references))
+            pending = self.backend.apply_reply(raw_response, pending, translations, tokens)
+            if not pending:
+                break
+            if attempt < MAX_REPAIR_ROUNDS:
+                logging.warning("Re-requesting %i of %i translations missing from the reply", len(pending), len(texts))
+        return self.backend.batch_results(texts, translations, pending, dstlang)
+    # translate_batch
+
+    ###########################################################################
+
+    def plan_batches(self, texts, dstlang=None, bulk=None):
+        bulk = self.config.bulk if bulk is None else bulk
+        if not bulk:
+            return [[text] for text in texts]
+        return self.backend.token_batches(texts, dstlang or self.config.dstlang)
+    # plan_batches
+
+    ###########################################################################
+
+    def token_stats(self):
+        return self.backend.token_stats()
+    # token_stats
+
+    ###########################################################################
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+    # aclose
+# AsyncTranslatorChatGPT
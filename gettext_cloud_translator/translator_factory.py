@@ -1,9 +1,14 @@
-from rich.pretty import pprint
-from config_chatgpt import ChatGptConfiguration
+import copy
+import os
 
 class TranslatorFactory:
     @staticmethod
     def create_translator(args):
+        if args.route:
+            return TranslatorFactory.create_router(args)
+        if args.async_io:
+            from async_service import SyncTranslatorAdapter
+            return SyncTranslatorAdapter(TranslatorFactory.create_async_translator(args))
         if args.backend == "chatgpt":
             from translator_chatgpt import TranslatorChatGPT
             from config_chatgpt import ChatGptConfiguration
@@ -14,4 +19,36 @@ class TranslatorFactory:
             return TranslatorAzure(AzureConfiguration(args))
         else:
             raise ValueError("Unknown translation backend")
+
+    @staticmethod
+    def create_router(args):
+        """
+        Creates a service per backend of --backend and --route, each with the
+        API key of the <BACKEND>_API_KEY environment variable when set, and
+        routes the batches between them.
+        """
+        from translator_router import TranslatorRouter
+        services = {}
+        for backend in dict.fromkeys([args.backend, *args.route.split(",")]):
+            backend = backend.strip()
+            if backend and backend not in services:
+                backend_args = copy.copy(args)
+                backend_args.backend = backend
+                backend_args.route = None
+                backend_args.apikey = os.getenv(f"{backend.upper()}_API_KEY") or args.apikey
+                services[backend] = TranslatorFactory.create_translator(backend_args)
+        return TranslatorRouter(services)
+
+    @staticmethod
+    def create_async_translator(args):
+        if args.backend == "chatgpt":
+            from translator_chatgpt import AsyncTranslatorChatGPT
+            from config_chatgpt import ChatGptConfiguration
+            return AsyncTranslatorChatGPT(ChatGptConfiguration(args))
+        elif args.backend == "azure":
+            from translator_azure import AsyncTranslatorAzure
+            from config_azure import AzureConfiguration
+            return AsyncTranslatorAzure(AzureConfiguration(args))
+        else:
+            raise ValueError("Unknown translation backend")
 # TranslatorFactory
\ No newline at end of file
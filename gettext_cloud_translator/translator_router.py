@@ -0,0 +1,327 @@
+import logging
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+
+from translator_service import TranslatorService
+
+###############################################################################
+
+# Batches the rolling latency and error rate of a backend are computed over
+WINDOW = 50
+
+# Batches a backend must have answered before its p95 latency is trusted to
+# decide when to hedge
+MIN_SAMPLES = 5
+
+# A backend failing this share of the texts of its recent batches is not
+# routed to, unless every backend is
+MAX_ERROR_RATE = 0.25
+
+# Seconds after which a backend not chosen since is tried again, so the
+# figures of a slow or failing backend get a chance to recover
+PROBE_SECONDS = 30.0
+
+###############################################################################
+
+def quantile(values, q):
+    """Returns the `q` quantile of a list of values, by the nearest rank."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+# quantile
+
+###############################################################################
+
+def merge_stats(stats):
+    """Sums the statistics dicts of several backends, None when none of them keeps any."""
+    stats = [item for item in stats if item is not None]
+    if not stats:
+        return None
+    return {name: sum(item.get(name, 0) for item in stats) for name in stats[0]}
+# merge_stats
+
+###############################################################################
+
+def translated_count(results):
+    """Returns how many non-empty translations a {dstlang: results} dict holds."""
+    return sum(1 for translations in results.values() for translation in translations if translation["msgstr"])
+# translated_count
+
+###############################################################################
+
+class RoutedBackend:
+    """A backend of the router, with the rolling latency and error rate of its last WINDOW batches."""
+
+    def __init__(self, name, service) -> None:
+        self.name = name
+        self.service = service
+        # (seconds, characters, texts, failed texts) of the recent batches
+        self.samples = deque(maxlen=WINDOW)
+        self.batches = 0
+        self.texts = 0
+        self.failed = 0
+        self.hedges = 0
+        self.hedges_won = 0
+        self.last_chosen = float("-inf")
+        self.lock = threading.Lock()
+    # __init__
+
+    ###########################################################################
+
+    def record(self, seconds, chars, texts, failed):
+        with self.lock:
+            self.samples.append((seconds, chars, texts, failed))
+            self.batches += 1
+            self.texts += texts
+            self.failed += failed
+    # record
+
+    ###########################################################################
+
+    def cost(self):
+        """Returns the recent seconds per character, None before the first batch."""
+        with self.lock:
+            if not self.samples:
+                return None
+            return sum(sample[0] for sample in self.samples) / max(1, sum(sample[1] for sample in self.samples))
+    # cost
+
+    ###########################################################################
+
+    def error_rate(self):
+        with self.lock:
+            texts = sum(sample[2] for sample in self.samples)
+            return sum(sample[3] for sample in self.samples) / texts if texts else 0.0
+    # error_rate
+
+    ###########################################################################
+
+    def healthy(self):
+        return self.error_rate() < MAX_ERROR_RATE
+    # healthy
+
+    ###########################################################################
+
+    def latency(self, q):
+        """Returns the `q` quantile of the recent batch latencies, None with fewer than MIN_SAMPLES batches."""
+        with self.lock:
+            if len(self.samples) < MIN_SAMPLES:
+                return None
+            return quantile([sample[0] for sample in self.samples], q)
+    # latency
+
+    ###########################################################################
+
+    def stats(self):
+        with self.lock:
+            latencies = [sample[0] for sample in self.samples]
+            stats = {"batches": self.batches, "texts": self.texts, "failed": self.failed,
+                     "hedges": self.hedges, "hedges_won": self.hedges_won}
+        stats["error_rate"] = round(self.error_rate(), 4)
+        stats["p50_seconds"] = round(quantile(latencies, 0.5), 3) if latencies else None
+        stats["p95_seconds"] = round(quantile(latencies, 0.95), 3) if latencies else None
+        return stats
+    # stats
+# RoutedBackend
+
+###############################################################################
+
+class TranslatorRouter(TranslatorService):
+    """
+    Spreads a run over several backends. The texts are cut into batches of
+    --route-batch texts, and each batch goes to the backend with the lowest
+    recent latency per character among those whose recent error rate is
+    acceptable. With --hedge, a batch still unanswered after the p95 latency
+    of its backend is sent to the next best backend too, and the first
+    complete answer wins.
+
+    The configuration, translation memory and fuzzy index the pipeline sees
+    are those of the first backend; every backend keeps its own.
+    """
+
+    def __init__(self, services) -> None:  # pylint: disable=W0231
+        self.backends = [RoutedBackend(name, service) for name, service in services.items()]
+        primary = self.backends[0].service
+        self.config = primary.config
+        self.memory = primary.memory
+        self.fuzzy_index = primary.fuzzy_index
+        self.hedge_executor = None
+        self.lock = threading.Lock()
+    # __init__
+
+    ###########################################################################
+
+    @property
+    def on_batch(self):
+        return self.backends[0].service.on_batch
+    # on_batch
+
+    @on_batch.setter
+    def on_batch(self, callback):
+        for backend in self.backends:
+            backend.service.on_batch = callback
+    # on_batch
+
+    @property
+    def metrics(self):
+        return self.backends[0].service.metrics
+    # metrics
+
+    @metrics.setter
+    def metrics(self, metrics):
+        for backend in self.backends:
+            backend.service.metrics = metrics
+    # metrics
+
+    ###########################################################################
+
+    def choose(self, exclude=None):
+        """
+        Returns the backend the next batch goes to. Backends not chosen for
+        PROBE_SECONDS, which includes those never chosen, are tried first;
+        then the fastest healthy one wins, or the least failing when none is.
+        """
+        now = time.monotonic()
+        with self.lock:
+            candidates = [backend for backend in self.backends if backend is not exclude]
+            if not candidates:
+                return None
+            chosen = next((backend for backend in candidates if now - backend.last_chosen >= PROBE_SECONDS), None)
+            if chosen is None:
+                healthy = [backend for backend in candidates if backend.healthy()]
+                if healthy:
+                    chosen = min(healthy, key=lambda backend: (backend.cost() is None, backend.cost() or 0.0))
+                else:
+                    chosen = min(candidates, key=lambda backend: backend.error_rate())
+            chosen.last_chosen = now
+            return chosen
+    # choose
+
+    ###########################################################################
+
+    def send(self, backend, texts, dstlangs):
+        """Sends a batch to one backend and records how it went. Returns its results."""
+        start = time.perf_counter()
+        try:
+            results = backend.service.translate_multi(texts, dstlangs)
+        except Exception as e:  # pylint: disable=W0718
+            logging.error("The %s backend failed a batch of %i texts: %s", backend.name, len(texts), e)
+            results = {}
+        expected = len(texts) * len(dstlangs)
+        backend.record(time.perf_counter() - start, sum(len(text) for text in texts) * len(dstlangs), expected,
+                       expected - translated_count(results))
+        return results
+    # send
+
+    ###########################################################################
+
+    def route(self, texts, dstlangs):
+        """
+        Sends one batch to the best backend, hedging it with --hedge once the
+        p95 latency of that backend has passed. Returns its results.
+        """
+        primary = self.choose()
+        delay = primary.latency(0.95) if self.config.hedge and len(self.backends) > 1 else None
+        if delay is None:
+            return self.send(primary, texts, dstlangs)
+
+        with self.lock:
+            if self.hedge_executor is None:
+                self.hedge_executor = ThreadPoolExecutor(max_workers=2 * self.config.workers,
+                                                         thread_name_prefix="router-hedge")
+        first = self.hedge_executor.submit(self.send, primary, texts, dstlangs)
+        try:
+            return first.result(timeout=delay)
+        except FutureTimeout:
+            pass
+
+        secondary = self.choose(exclude=primary)
+        logging.debug("Hedging a batch of %i texts sent to %s after %.2fs on %s",
+                      len(texts), primary.name, delay, secondary.name)
+        with secondary.lock:
+            secondary.hedges += 1
+        second = self.hedge_executor.submit(self.send, secondary, texts, dstlangs)
+        pending = {first: primary, second: secondary}
+        best = None
+        # The first complete answer wins; a partial one waits for the other
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                backend = pending.pop(future)
+                results = future.result()
+                if best is None or translated_count(results) > translated_count(best[1]):
+                    best = (backend, results)
+            if translated_count(best[1]) == len(texts) * len(dstlangs):
+                break
+        if best[0] is secondary:
+            with secondary.lock:
+                secondary.hedges_won += 1
+        return best[1]
+    # route
+
+    ###########################################################################
+
+    def translate_multi(self, texts, dstlangs):
+        size = self.config.route_batch
+        batches = [texts[offset:offset + size] for offset in range(0, len(texts), size)]
+        if self.config.workers <= 1 or len(batches) <= 1:
+            results = [self.route(batch, dstlangs) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=self.config.workers) as executor:
+                results = list(executor.map(lambda batch: self.route(batch, dstlangs), batches))
+        merged = {dstlang: [] for dstlang in dstlangs}
+        for result in results:
+            for dstlang, translated_texts in result.items():
+                merged.setdefault(dstlang, []).extend(translated_texts)
+        return merged
+    # translate_multi
+
+    def translate_in_bulk(self, texts, dstlang=None):
+        dstlang = dstlang or self.config.dstlang
+        return self.translate_multi(texts, [dstlang])[dstlang]
+    # translate_in_bulk
+
+    def translate_one_by_one(self, texts, dstlang=None):
+        return self.translate_in_bulk(texts, dstlang)
+    # translate_one_by_one
+
+    ###########################################################################
+
+    def estimate_requests(self, texts, targets=1):
+        return self.backends[0].service.estimate_requests(texts, targets)
+    # estimate_requests
+
+    def check(self):
+        return all(backend.service.check() for backend in self.backends)
+    # check
+
+    ###########################################################################
+
+    def routing_stats(self):
+        return {backend.name: backend.stats() for backend in self.backends}
+    # routing_stats
+
+    def connection_stats(self):
+        return merge_stats(backend.service.connection_stats() for backend in self.backends)
+    # connection_stats
+
+    def limiter_stats(self):
+        return merge_stats(backend.service.limiter_stats() for backend in self.backends)
+    # limiter_stats
+
+    def token_stats(self):
+        return merge_stats(backend.service.token_stats() for backend in self.backends)
+    # token_stats
+
+    ###########################################################################
+
+    def close(self):
+        """Waits for the hedged requests still running, then closes every backend."""
+        if self.hedge_executor is not None:
+            self.hedge_executor.shutdown()
+        for backend in self.backends:
+            backend.service.close()
+    # close
+# TranslatorRouter
@@ -1,20 +1,249 @@
+import logging
+import time
+
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+from batching import BatchFeed
 
 ###############################################################################
 
-class TranslatorService(ABC):
+class ServiceCommon:
+    """
+    What the synchronous and the asynchronous services share: the translation
+    memory and fuzzy index, the rate limiter, the optional credentials check
+    and the statistics.
+    """
+    memory = None
+    fuzzy_index = None
+    limiter = None
+    batch_size = None
+    on_batch = None
+    metrics = None
+
+    ###########################################################################
+
+    def estimate_requests(self, texts, targets=1):
+        """Returns how many requests translating `texts` into `targets` languages would take."""
+        if not texts:
+            return 0
+        if not self.config.bulk:
+            return len(texts) * targets
+        return ((len(texts) - 1) // self.config.bulksize + 1) * targets
+    # estimate_requests
+
+    ###########################################################################
+
+    def check(self):
+        """
+        Checks that the service is reachable and the credentials work, without
+        translating anything billable. Returns whether the check passed.
+        """
+        return True
+    # check
+
+    ###########################################################################
+
+    def connection_stats(self):
+        """Returns the HTTP connection reuse statistics, if the backend tracks them."""
+        return None
+    # connection_stats
+
+    ###########################################################################
+
+    def limiter_stats(self):
+        """Returns the throttling and retry statistics, if the backend is rate limited."""
+        return self.limiter.stats() if self.limiter is not None else None
+    # limiter_stats
+
+    ###########################################################################
+
+    def token_stats(self):
+        """Returns the tokens used, if the backend is billed by tokens."""
+        return None
+    # token_stats
+
+    ###########################################################################
+
+    def routing_stats(self):
+        """Returns the per-backend routing statistics, if the service routes between backends."""
+        return None
+    # routing_stats
+
+    ###########################################################################
+
+    def recall(self, texts, dstlang=None):
+        """
+        Looks the texts up in the translation memory, then, with --fuzzy-tm
+        prefill, in the fuzzy index. Returns the translations found, in the
+        {"msgid", "msgstr", "dstlang"} form, and the texts still to be sent.
+        The translations of similar strings carry their source under "fuzzy",
+        so they are applied as fuzzy entries for review.
+        """
+        dstlang = dstlang or self.config.dstlang
+        cached = []
+        if self.memory is not None:
+            found = self.memory.lookup(texts, dstlang)
+            cached = [{"msgid": text, "msgstr": msgstr, "dstlang": dstlang} for text, msgstr in found.items()]
+            texts = [text for text in texts if text not in found]
+        if self.fuzzy_index is not None and self.config.fuzzy_tm == "prefill":
+            found = self.fuzzy_index.lookup(texts, dstlang)
+            cached += [{"msgid": text, "msgstr": msgstr, "dstlang": dstlang, "fuzzy": source}
+                       for text, (source, msgstr, _) in found.items()]
+            texts = [text for text in texts if text not in found]
+        return cached, list(texts)
+    # recall
+
+    def remember(self, translated_texts, dstlang=None):
+        """Stores the non-empty translations in the translation memory and the fuzzy index."""
+        translations = {
+            translation["msgid"]: translation["msgstr"]
+            for translation in translated_texts
+            if translation["msgstr"]
+        }
+        if self.memory is not None:
+            self.memory.store(translations, dstlang or self.config.dstlang)
+        if self.fuzzy_index is not None:
+            self.fuzzy_index.add(translations, dstlang or self.config.dstlang)
+    # remember
+
+    ###########################################################################
+
+    def observe(self, start, chars):
+        """Records in the metrics, when set, a request sent at `start` with `chars` characters."""
+        if self.metrics is not None:
+            self.metrics.observe_request(time.perf_counter() - start, chars)
+    # observe
+
+    ###########################################################################
+
+    def close(self):
+        """Releases the translation memory and the fuzzy index."""
+        if self.memory is not None:
+            self.memory.close()
+        if self.fuzzy_index is not None:
+            self.fuzzy_index.close()
+    # close
+# ServiceCommon
+
+###############################################################################
+
+class TranslatorService(ServiceCommon, ABC):
     @abstractmethod
     def __init__(self) -> None:
         pass
     # __init__
 
     @abstractmethod
-    def translate_in_bulk(self, texts):
+    def translate_in_bulk(self, texts, dstlang=None):
         pass
     # translate_in_bulk
         
     @abstractmethod
-    def translate_one_by_one(self, texts):
+    def translate_one_by_one(self, texts, dstlang=None):
         pass
     # translate_one_by_one    
-# TranslatorService
\ No newline at end of file
+
+    ###########################################################################
+
+    def translate_multi(self, texts, dstlangs):
+        """
+        Translates the texts into every language in `dstlangs`, in bulk or one
+        by one according to the configuration. Returns a {dstlang: results}
+        dict. Backends whose API accepts several targets per request override it.
+        """
+        translate = self.translate_in_bulk if self.config.bulk else self.translate_one_by_one
+        return {dstlang: translate(texts, dstlang) for dstlang in dstlangs}
+    # translate_multi
+
+    ###########################################################################
+
+    def run_batches(self, send, batches, weigh=len):
+        """
+        Sends the batches with up to `config.workers` requests in flight and
+        returns the concatenated results in the same order as the batches.
+        Each request goes through the rate limiter, which keeps it within the
+        quota and retries it when it fails. A batch that still fails is logged
+        and left out of the results, without affecting the other batches.
+        The results of every completed batch are passed to `on_batch`, when set.
+        `batches` may be a BatchFeed, whose batches are packed as they are
+        sent, their latencies and failures fed back to its controller.
+        """
+        controller = batches.controller if isinstance(batches, BatchFeed) else None
+
+        def attempt(batch):
+            start = time.perf_counter()
+            try:
+                result = send(batch)
+            except Exception as e:
+                if controller is not None:
+                    controller.shrink(str(e) or type(e).__name__)
+                raise
+            finally:
+                self.observe(start, weigh(batch))
+            if controller is not None:
+                controller.record(time.perf_counter() - start, weigh(batch))
+            return result
+
+        def send_batch(batch):
+            try:
+                if self.limiter is None:
+                    result = attempt(batch)
+                else:
+                    result = self.limiter.call(attempt, batch, weigh(batch), f"Batch of {len(batch)} texts")
+            except Exception as e:  # pylint: disable=W0718
+                logging.error("Giving up on a batch of %i texts: %s", len(batch), e)
+                return []
+            if self.on_batch is not None:
+                self.on_batch(result)
+            return result
+
+        if controller is not None:
+            results = self.run_feed(send_batch, batches)
+        elif self.config.workers <= 1 or len(batches) <= 1:
+            results = [send_batch(batch) for batch in batches]
+        else:
+            executor = ThreadPoolExecutor(max_workers=self.config.workers)
+            try:
+                results = list(executor.map(send_batch, batches))
+            finally:
+                # Do not start the queued batches when interrupted
+                executor.shutdown(cancel_futures=True)
+        return [translation for result in results for translation in result]
+    # run_batches
+
+    ###########################################################################
+
+    def run_feed(self, send_batch, feed):
+        """
+        Sends the batches of a feed from up to `config.workers` threads, each
+        taking the next batch when done with the previous one. Returns their
+        results in the order the batches were taken.
+        """
+        results = {}
+
+        def work():
+            while True:
+                taken = feed.take()
+                if taken is None:
+                    return
+                sequence, batch, limit = taken
+                feed.controller.local.limit = limit
+                results[sequence] = send_batch(batch)
+
+        if self.config.workers <= 1:
+            work()
+        else:
+            executor = ThreadPoolExecutor(max_workers=self.config.workers)
+            try:
+                for future in [executor.submit(work) for _ in range(self.config.workers)]:
+                    future.result()
+            except KeyboardInterrupt:
+                # Do not take more batches when interrupted
+                feed.close()
+                raise
+            finally:
+                executor.shutdown()
+        return [results[sequence] for sequence in sorted(results)]
+    # run_feed
+# TranslatorService
@@ -26,12 +26,15 @@ setup(
     install_requires=[
         'polib',
         'openai',
-        'python-dotenv'
+        'python-dotenv',
+        # HTTP client of the --async Azure backend
+        'httpx>=0.23'
         # Add other dependencies from requirements.txt
     ],
     entry_points={
         'console_scripts': [
             'gettext-cloud-translator=gettext_cloud_translator.cloud_translator:main',
+            'gettext-cloud-translator-client=gettext_cloud_translator.daemon_client:main',
         ],
     },
     classifiers=[